@@ -0,0 +1,35 @@
+"""
+Compare the minimum image distances of pyxtal.operations.distance_matrix
+with the plain 27 image search in the original cell, for a regular cell,
+a sheared cell and a flat cell.
+"""
+import time
+import numpy as np
+from scipy.spatial.distance import cdist
+from pyxtal.operations import distance_matrix, create_matrix
+
+def distance_matrix_27(pts1, pts2, lattice):
+    l1 = np.dot(pts1 - np.floor(pts1), lattice)
+    l2 = np.dot(pts2 - np.floor(pts2), lattice)
+    vecs = np.dot(create_matrix(), lattice)
+    return np.min([cdist(l1+v, l2) for v in vecs], axis=0)
+
+def timeit(func, *args, repeat=10):
+    t0 = time.time()
+    for i in range(repeat):
+        res = func(*args)
+    return (time.time() - t0)/repeat, res
+
+lattices = {
+    "regular": np.diag([5.0, 6.0, 7.0]),
+    "sheared": np.array([[2.1, 0, 0], [9.0, 4.9, 0], [17.0, 3.0, 20.0]]),
+    "flat": np.array([[4.0, 0, 0], [0, 4.5, 0], [12.0, 9.0, 0.8]]),
+}
+for name, lattice in lattices.items():
+    for n in [20, 200, 1000]:
+        pts1 = np.random.random([n, 3])
+        pts2 = np.random.random([n, 3])
+        t1, d1 = timeit(distance_matrix, pts1, pts2, lattice)
+        t2, d2 = timeit(distance_matrix_27, pts1, pts2, lattice)
+        print("{:8s} n={:5d}  reduced: {:8.4f} s  27 images: {:8.4f} s  "
+              "max(d_27 - d): {:.3f}".format(name, n, t1, t2, np.max(d2-d1)))
@@ -5,6 +5,7 @@ import numpy as np
 import numba as nb
 import os
 import collections
+from functools import lru_cache
 from scipy.interpolate import interp1d
 from monty.serialization import loadfn
 from pkg_resources import resource_filename
@@ -16,25 +17,36 @@ class XRD(object):
 
     def __init__(self, crystal, wavelength=1.54184, 
                  thetas = [0, 180], 
-                 preferred_orientation = False, march_parameter = None):
+                 preferred_orientation = False, march_parameter = None,
+                 backend = 'numpy', symprec = 1e-5):
        
         """ 
         a class to compute the powder XRD.
         
         Args:
-            crystal: ase atoms object
+            crystal: ase atoms or pyxtal object. For a pyxtal structure, the 
+                symmetry operations are taken from its space group
             wavelength: float 
             max2theta: float
             preferred_orientation: boolean
             march_parameter: float
+            backend: 'numpy' or 'numba' to compute the structure factors
+            symprec: tolerance to find the symmetry operations, which are used
+                to compute only the symmetry-unique reflections. If None,
+                only the Friedel pairs are merged.
         """
 
         self.wavelength = wavelength
         self.min2theta = np.radians(thetas[0])
         self.max2theta = np.radians(thetas[1])
-        self.name = crystal.get_chemical_formula()
+        if hasattr(crystal, 'group'):
+            self.name = crystal.formula
+        else:
+            self.name = crystal.get_chemical_formula()
         self.preferred_orientation = preferred_orientation
         self.march_parameter = march_parameter
+        self.backend = backend
+        self.symprec = symprec
         self.all_dhkl(crystal)
         self.intensity(crystal)
         self.pxrdf()     
@@ -77,7 +89,10 @@ class XRD(object):
         3x3 representation -> 1x6 (a, b, c, alpha, beta, gamma)
         """
 
-        rec_matrix = crystal.get_reciprocal_cell()
+        if hasattr(crystal, 'group'):
+            rec_matrix = np.linalg.inv(crystal.lattice.matrix).T
+        else:
+            rec_matrix = crystal.get_reciprocal_cell()
         d_min = self.wavelength/np.sin(self.max2theta/2)/2
 
         # This block is to find the shortest d_hkl, 
@@ -124,81 +139,88 @@ class XRD(object):
         d0 = (1/2/self.d_hkl)**2
 
         # obtiain scattering parameters, atomic numbers, and occus (need to look into occus)
-        coeffs = []
-        zs = []
-
-        for elem in crystal.get_chemical_symbols():
-            if elem == 'D':
-                elem = 'H'
-            c = ATOMIC_SCATTERING_PARAMS[elem]
-            z = Element(elem).z
-            coeffs.append(c)
-            zs.append(z) 
-
-        coeffs = np.array(coeffs)
-        self.peaks = {}
-        two_thetas = []
+        if hasattr(crystal, 'group'):
+            positions, symbols, rotations, translations = get_pyxtal_data(crystal)
+        else:
+            symbols = crystal.get_chemical_symbols()
+            positions = crystal.get_scaled_positions()
+            rotations, translations = get_symmetry(crystal, self.symprec)
+        symbols = ['H' if elem == 'D' else elem for elem in symbols]
+        elements, ids = np.unique(symbols, return_inverse=True)
+        coeffs = np.array([ATOMIC_SCATTERING_PARAMS[elem] for elem in elements])
+        zs = np.array([Element(elem).z for elem in elements])
+
+        # only sum over the atoms which are not related by centering or inversion
+        centering, inversion = get_centering(rotations, translations)
+        positions, ids, weights, centering, real = get_reduced_positions(positions, \
+                ids, centering, inversion)
+
+        # only compute the symmetry-unique and not extinct reflections
+        uniques, inverse, absent = get_unique_reflections(self.hkl_list, rotations, translations)
+        uniques = uniques[~absent]
+        hkls = self.hkl_list[uniques]
+
+        # atomic scattering factors for each unique element and s2 value
+        s2s, s2_ids = np.unique(d0[uniques], return_inverse=True)
+        sfs = get_scattering_factors(s2s, zs, coeffs)
+
+        # calculate the structure factors and intensities
+        I_unique = np.zeros(len(absent))
+        if self.backend == 'numba':
+            I_unique[~absent] = structure_factor_numba(hkls.astype(float), positions, \
+                    ids.astype(np.int64), sfs, s2_ids.astype(np.int64), weights, centering, real)
+        else:
+            I_unique[~absent] = structure_factor(hkls, positions, ids, sfs, s2_ids, \
+                    weights, centering, real)
+        I = I_unique[inverse]
+
+        # calculate the lorentz polarization factor lf
+        theta = self.theta
+        lf = (1 + np.cos(2 * theta) ** 2) / (np.sin(theta) ** 2 * np.cos(theta))
+
+        # calculate the preferred orientation factor
+        if self.preferred_orientation != False:
+            G = self.march_parameter
+            po = ((G * np.cos(theta))**2 + 1/G * np.sin(theta)**2)**(-3/2) 
+        else:
+            po = 1
+        I = I * lf * po
 
         # self.march_parameter = 1
         TWO_THETA_TOL = 1e-5 # tolerance to find repeating angles
         SCALED_INTENSITY_TOL = 1e-5 # threshold for intensities
 
-        for hkl, s2, theta, d_hkl in zip(self.hkl_list, d0, self.theta, self.d_hkl):
-            
-            # calculate the scattering factor sf
-            g_dot_r = np.dot(crystal.get_scaled_positions(), np.transpose([hkl])).T[0]
-            sf = zs - 41.78214 * s2 * np.sum(coeffs[:, :, 0] * np.exp(-coeffs[:, :, 1] * s2), axis=1)
-            
-            # calculate the structure factor f
-            f = np.sum(sf * np.exp(2j * np.pi * g_dot_r))
-            
-            # calculate the lorentz polarization factor lf
-            lf = (1 + np.cos(2 * theta) ** 2) / (np.sin(theta) ** 2 * np.cos(theta))
-
-            # calculate the preferred orientation factor
-            if self.preferred_orientation != False:
-                G = self.march_parameter
-                po = ((G * np.cos(theta))**2 + 1/G * np.sin(theta)**2)**(-3/2) 
-            else:
-                po = 1
-    
-            # calculate the intensity I
-            I = (f * f.conjugate()).real
-            
-            # calculate 2*theta
-            two_theta = np.degrees(2 * theta)
-            
-            # find where the scattered angles are equal
-            ind = np.where(np.abs(np.subtract(two_thetas, two_theta)) < TWO_THETA_TOL)
-
-            # append intensity, hkl plane, and thetas to lists
-            if len(ind[0]) > 0:
-                 self.peaks[two_thetas[ind[0][0]]][0] += I * lf * po
-                 self.peaks[two_thetas[ind[0][0]]][1].append(tuple(hkl))
-            else:
-                self.peaks[two_theta] = [I * lf * po, [tuple(hkl)],d_hkl]
-                two_thetas.append(two_theta)
+        # group the reflections with the same scattered angles,
+        # each group keeps the angle and d_hkl of its first reflection
+        two_thetas = np.degrees(2 * theta)
+        order = np.argsort(two_thetas, kind='stable')
+        starts = np.append(0, np.where(np.diff(two_thetas[order]) >= TWO_THETA_TOL)[0] + 1)
+        peak_ids = np.zeros(len(order), dtype=int)
+        peak_ids[order[starts[1:]]] = 1
+        peak_ids[order] = np.cumsum(peak_ids[order])
+        firsts = np.minimum.reduceat(order, starts)
+        intensities = np.bincount(peak_ids, weights=I)
+
+        # 2theta => [intensity, hkls, d_hkl] for all peaks, in the order
+        # of their first reflections
+        groups = [[] for _ in firsts]
+        for hkl, peak_id in zip(self.hkl_list.tolist(), peak_ids):
+            groups[peak_id].append(tuple(hkl))
+        self.peaks = {}
+        for peak_id in np.argsort(firsts):
+            first = firsts[peak_id]
+            self.peaks[two_thetas[first]] = [intensities[peak_id], groups[peak_id], self.d_hkl[first]]
 
         # obtain important intensities (defined by SCALED_INTENSITY_TOL)
         # and corresponding 2*theta, hkl plane + multiplicity, and d_hkl
         
-        max_intensity = max([v[0] for v in self.peaks.values()])
-        x = []
-        y = []
-        hkls = []
-        d_hkls = []
-        count = 0 
-        for k in sorted(self.peaks.keys()):
-            count +=1
-            v = self.peaks[k]
-            fam = self.get_unique_families(v[1])
-            if v[0] / max_intensity * 100 > SCALED_INTENSITY_TOL:
-                x.append(k)
-                y.append(v[0])
-                
-                hkls.append([{"hkl": hkl, "multiplicity": mult}
-                             for hkl, mult in fam.items()])
-                d_hkls.append(v[2])
+        keep = intensities / intensities.max() * 100 > SCALED_INTENSITY_TOL
+        families = get_hkl_families(self.hkl_list, peak_ids, keep)
+        x = list(two_thetas[firsts[keep]])
+        y = list(intensities[keep])
+        d_hkls = list(self.d_hkl[firsts[keep]])
+        hkls = [[{"hkl": hkl, "multiplicity": mult} for hkl, mult in fam] \
+                for fam in families]
 
         self.theta2 = x
         self.xrd_intensity = y
@@ -241,22 +263,10 @@ class XRD(object):
             {hkl: multiplicity}: A dict with unique hkl and multiplicity.
         """
 
-       # TODO: Definitely can be sped up.
-        def is_perm(hkl1, hkl2):
-            h1 = np.abs(hkl1)
-            h2 = np.abs(hkl2)
-            return all([i == j for i, j in zip(sorted(h1), sorted(h2))])
-
+        # group the hkls by their sorted absolute values
         unique = collections.defaultdict(list)
         for hkl1 in hkls:
-            found = False
-            for hkl2 in unique.keys():
-                if is_perm(hkl1, hkl2):
-                    found = True
-                    unique[hkl2].append(hkl1)
-                    break
-            if not found:
-                unique[hkl1].append(hkl1)
+            unique[tuple(sorted(np.abs(hkl1)))].append(hkl1)
 
         pretty_unique = {}
         for k, v in unique.items():
@@ -373,9 +383,9 @@ class XRD(object):
             return fig
 
 
-    def get_profile(self, method='gaussian', res=0.01, user_kwargs=None):
+    def get_profile(self, method='gaussian', res=0.01, user_kwargs=None, **kwargs):
 
-        return Profile(method, res, user_kwargs).get_profile(self.theta2, \
+        return Profile(method, res, user_kwargs, **kwargs).get_profile(self.theta2, \
                 self.xrd_intensity, np.degrees(self.min2theta), np.degrees(self.max2theta))
 
 
@@ -395,13 +405,21 @@ class Profile:
         resolution of the profiling array in degree
     user_kwargs: dict
         The parameters for the profiling method.
+    cutoff: float
+        Each peak is only evaluated within cutoff*FWHM of its center
+    tail: bool
+        Whether or not to add the Lorentzian tails beyond the cutoff. 
+        The tails are evaluated on a coarse grid and interpolated.
     """
 
-    def __init__(self, method='mod_pseudo-voigt', res = 0.02, user_kwargs=None):
+    def __init__(self, method='mod_pseudo-voigt', res = 0.02, user_kwargs=None,
+                 cutoff = 20.0, tail = True):
         
         self.method = method
         self.user_kwargs = user_kwargs
         self.res = res       
+        self.cutoff = cutoff
+        self.tail = tail
         kwargs = {}
 
         if method == 'mod_pseudo-voigt':
@@ -429,6 +447,64 @@ class Profile:
 
         self.kwargs = kwargs
 
+    def get_fwhm(self, two_thetas):
+        """
+        Compute the FWHM of each peak and the mixing parameter eta 
+        for the pseudo-voigt function
+        """
+        if self.method == 'pseudo-voigt':
+            try:
+                fwhm_g = self.kwargs['FWHM-G'] 
+                fwhm_l = self.kwargs['FWHM-L']
+            except:
+                fwhm_g = self.kwargs['FWHM']
+                fwhm_l = self.kwargs['FWHM'] 
+             
+            fwhm = (fwhm_g**5 + 2.69269*fwhm_g**4*fwhm_l + 2.42843*fwhm_g**3*fwhm_l**2 +
+                    4.47163*fwhm_g**2*fwhm_l**3 + 0.07842*fwhm_g*fwhm_l**4 + fwhm_l**5)**(1/5)
+            eta = 1.36603*fwhm_l/fwhm - 0.47719*(fwhm_l/fwhm)**2 + 0.11116*(fwhm_l/fwhm)**3
+            fwhm = np.full(len(two_thetas), fwhm)
+
+        elif self.method == 'mod_pseudo-voigt':
+            U = self.kwargs['U']
+            V = self.kwargs['V']
+            W = self.kwargs['W']
+            tan = np.tan(np.pi*two_thetas/2/180)
+            fwhm = np.sqrt(U*tan**2 + V*tan + W)
+            eta = None
+        else:
+            fwhm = np.full(len(two_thetas), self.kwargs['FWHM'])
+            eta = None
+
+        return fwhm, eta
+
+    def get_shape(self, x, fwhm, eta=None):
+        """
+        Evaluate the profiling function at the distances x from the peak centers
+
+        Args:
+            x: array of distances to the peak centers
+            fwhm: array of FWHM which can be broadcast to x
+            eta: mixing parameter of the pseudo-voigt function
+
+        Returns:
+            array of the same shape as x
+        """
+        u = np.ascontiguousarray((x/fwhm).ravel())
+        if self.method == 'gaussian':
+            tmp = gaussian(0.0, u, 1.0)
+        elif self.method == 'lorentzian':
+            tmp = lorentzian(0.0, u, 1.0)
+        elif self.method == 'pseudo-voigt':
+            tmp = pseudo_voigt(0.0, u, 1.0, eta)
+        else:
+            A = self.kwargs['A']
+            eta_h = self.kwargs['eta_h']
+            eta_l = self.kwargs['eta_l']
+            tmp = mod_pseudo_voigt(u, 1.0, A, eta_h, eta_l, len(u))
+            return tmp.reshape(x.shape) / fwhm
+        return tmp.reshape(x.shape)
+
     def get_profile(self, two_thetas, intensities, min2theta, max2theta):
 
         """
@@ -441,52 +517,55 @@ class Profile:
         """
     
         N = int((max2theta-min2theta)/self.res)
-        px = np.linspace(min2theta, max2theta, N) 
-        py = np.zeros((N))
-
-        for two_theta, intensity in zip(two_thetas, intensities):
-            if self.method == 'gaussian':
-               fwhm = self.kwargs['FWHM']
-               tmp = gaussian(two_theta, px, fwhm)
-            
-            elif self.method == 'lorentzian':
-               fwhm = self.kwargs['FWHM'] 
-               tmp = lorentzian(two_theta, px, fwhm) 
-            
-            elif self.method == 'pseudo-voigt':
-               try:
-                  fwhm_g = self.kwargs['FWHM-G'] 
-                  fwhm_l = self.kwargs['FWHM-L']
-               except:
-                  fwhm_g = self.kwargs['FWHM']
-                  fwhm_l = self.kwargs['FWHM'] 
-                
-               fwhm = (fwhm_g**5 + 2.69269*fwhm_g**4*fwhm_l + 2.42843*fwhm_g**3*fwhm_l**2 +
-                       4.47163*fwhm_g**2*fwhm_l**3 + 0.07842*fwhm_g*fwhm_l**4 + fwhm_l**5)**(1/5)
-               
-               eta = 1.36603*fwhm_l/fwhm - 0.47719*(fwhm_l/fwhm)**2 + 0.11116*(fwhm_l/fwhm)**3
-
-               tmp = pseudo_voigt(two_theta, px, fwhm, eta)
-
-            elif self.method == 'mod_pseudo-voigt':
-               U = self.kwargs['U']
-               V = self.kwargs['V']
-               W = self.kwargs['W']
-               A = self.kwargs['A']
-               eta_h = self.kwargs['eta_h']
-               eta_l = self.kwargs['eta_l']
-               
-               fwhm = np.sqrt(U*np.tan(np.pi*two_theta/2/180)**2 + V*np.tan(np.pi*two_theta/2/180) + W)
-               x = px - two_theta
-               tmp = mod_pseudo_voigt(x, fwhm, A, eta_h, eta_l, N)
-            
-            py += intensity * tmp
+        px = get_grid(min2theta, max2theta, N) 
+        two_thetas = np.array(two_thetas, dtype=float)
+        intensities = np.array(intensities, dtype=float)
+        fwhm, eta = self.get_fwhm(two_thetas)
+
+        # the grid points within the window of each peak
+        width = self.cutoff * fwhm
+        i0 = np.searchsorted(px, two_thetas - width)
+        i1 = np.searchsorted(px, two_thetas + width, side='right')
+        lens = i1 - i0
+        peaks = np.repeat(np.arange(len(lens)), lens)
+        ids = np.arange(lens.sum()) - np.repeat(np.cumsum(lens) - lens - i0, lens)
+        x = px[ids] - two_thetas[peaks]
+        tmp = self.get_shape(x, fwhm[peaks], eta)
+
+        tail = self.tail and self.method != 'gaussian' and len(two_thetas) > 0
+        if tail:
+            # split each peak into a window part and a continuous tail 
+            # which is flat within the window
+            edges = self.get_shape(np.array([-width, width]).T, fwhm[:, None], eta)
+            tmp -= np.where(x < 0, edges[peaks, 0], edges[peaks, 1])
+
+        py = np.bincount(ids, weights=tmp*intensities[peaks], minlength=N)
+
+        if tail:
+            Nc = int((max2theta-min2theta)/(width.min()/2)) + 2
+            cx = get_grid(min2theta, max2theta, Nc) 
+            x = cx - two_thetas[:, None]
+            x = np.where(np.abs(x) > width[:, None], x, np.sign(x+1e-12)*width[:, None])
+            tmp = self.get_shape(x, fwhm[:, None], eta) * intensities[:, None]
+            py += np.interp(px, cx, tmp.sum(axis=0))
 
         py /= np.max(py)
 
         self.spectra = np.vstack((px,py))
         return self.spectra
 
+@lru_cache(maxsize=16)
+def _get_grid(min2theta, max2theta, N):
+    grid = np.linspace(min2theta, max2theta, N)
+    grid.flags.writeable = False
+    return grid
+
+def get_grid(min2theta, max2theta, N):
+    """
+    Returns the (cached) grid of 2theta values
+    """
+    return _get_grid(float(min2theta), float(max2theta), int(N))
+
 
 # ------------------------------ Similarity between two XRDs ---------------------------------
 class Similarity(object):
@@ -535,19 +614,125 @@ class Similarity(object):
 
         self.fx, self.gx, self.fy, self.gy = fgx_new, fgx_new, fy_new, gy_new
         self.weight = weight
-        if self.weight == 'triangle':
-            w = self.triangleFunction()
-        elif self.weight == 'cosine':
-            w = self.cosineFunction()
-        else:
-            msg = function + 'is not supported'
-            raise NotImplementedError(msg)
+        w = get_weight_function(self.r, self.l, self.weight)
 
         Npts = len(self.fx)
         d = self.fx[1] - self.fx[0]
 
-        self.S = similarity_calculate(self.r, w, d, Npts, self.fy, self.gy)
+        # precompute the transform and autocorrelation of the reference f
+        self.ref = get_reference(self.r, w, d, Npts, self.fy)
+        self.S = similarity_fft(self.ref, self.gy)
     
+    def compare(self, g):
+        """
+        Compute the similarity between the reference spectra f and another
+        spectra g, on the same grid and with the same weight function.
+        The transform and autocorrelation of f are reused.
+
+        Args:
+            g: spectra (2D array)
+
+        Returns:
+            the similarity value
+        """
+        g_inter = interp1d(g[0], g[1], 'cubic', fill_value = 'extrapolate')
+        return similarity_fft(self.ref, g_inter(self.fx))
+
+    @staticmethod
+    def matrix(spectra, N = None, x_range = None, l = 2.0, weight = 'cosine',
+               resolution = None, threshold = None, top_k = None, 
+               ncpu = 1, block = 256):
+        """
+        Compute the similarities between many diffraction patterns.
+        All spectra are interpolated once onto a common grid. Since the
+        weighted correlation is a bilinear form f^T K g, where K is the 
+        banded Toeplitz matrix of the shift weights, each spectrum is 
+        convolved with the weights once and the similarities of a block of
+        rows are obtained with one matrix product.
+
+        Args:
+            spectra: list of spectra (2D arrays)
+            N: number of sampling points for the shifts
+            x_range: the range of x values used to compute similarity ([x_min, x_max]),
+                the default is the overlap of all spectra
+            l: cutoff value for shift (real)
+            weight: weight function 'triangle' or 'cosine' (str)
+            resolution: the grid spacing, the default is 1/3 of the finest
+                resolution of the spectra, as in Similarity
+            threshold: if not None, only return the pairs (i<j) with larger similarity
+            top_k: if not None, only return the top_k most similar spectra of 
+                each spectrum, threshold is then ignored
+            ncpu: number of threads to compute the blocks
+            block: number of rows in each block
+
+        Returns:
+            - the N*N similarity matrix, by default
+            - (rows, cols, values) of the selected pairs, if threshold is given
+            - (ids, values) of the top_k spectra for each spectrum (N*top_k), 
+              if top_k is given
+        """
+        l = abs(l)
+        if resolution is None:
+            resolution = min([(x[-1]-x[0])/len(x) for (x, y) in spectra])/3
+        if N is None:
+            N = int(2*l/resolution)
+        r = np.linspace(-l, l, N)
+        w = get_weight_function(r, l, weight)
+
+        if x_range is None: #get the overlap
+            x_min = max([np.min(x) for (x, y) in spectra])
+            x_max = min([np.max(x) for (x, y) in spectra])
+        else:
+            x_min, x_max = x_range[0], x_range[1]
+        x = np.linspace(x_min, x_max, int((x_max-x_min)/resolution)+1)
+        d = x[1] - x[0]
+
+        # resample all spectra onto the common grid
+        Y = np.empty([len(spectra), len(x)])
+        for i, (fx, fy) in enumerate(spectra):
+            Y[i] = interp1d(fx, fy, 'cubic', fill_value = 'extrapolate')(x)
+
+        # Z[i, m] = sum_s w(s) Y[i, m-s], so that Z[i].Y[j] = sum_s w(s) sum_k Y[i, k]Y[j, k+s]
+        S, weights = get_shift_weights(r, w, d, len(x))
+        from scipy.signal import fftconvolve
+        Z = np.ascontiguousarray(fftconvolve(Y, weights[None, :], axes=1)[:, S:S+len(x)])
+        norms = 1/np.sqrt(np.einsum('ij,ij->i', Z, Y))
+
+        def get_block(i):
+            # only the upper triangle is needed unless for top_k
+            j = 0 if top_k is not None else i
+            sims = np.abs(np.dot(Z[i:i+block], Y[j:].T))
+            sims *= norms[i:i+block, None] * norms[None, j:]
+            if top_k is not None:
+                sims[np.arange(len(sims)), np.arange(i, i+len(sims))] = -1
+                ids = np.argsort(-sims, axis=1)[:, :top_k]
+                return ids, np.take_along_axis(sims, ids, axis=1)
+            elif threshold is not None:
+                rows, cols = np.where(sims >= threshold)
+                rows += i
+                cols += j
+                mask = cols > rows
+                return rows[mask], cols[mask], sims[rows[mask]-i, cols[mask]-j]
+            else:
+                return sims
+
+        starts = range(0, len(spectra), block)
+        if ncpu > 1:
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(ncpu) as executor:
+                results = list(executor.map(get_block, starts))
+        else:
+            results = [get_block(i) for i in starts]
+
+        if top_k is not None or threshold is not None:
+            return tuple(np.concatenate(res) for res in zip(*results))
+        else:
+            sims = np.zeros([len(spectra), len(spectra)])
+            for i, res in zip(starts, results):
+                sims[i:i+block, i:] = res
+            sims = np.triu(sims)
+            return sims + np.triu(sims, 1).T
+
 
     def __str__(self):
         s = "The similarity between two PXRDs is {:.4f}".format(self.S)
@@ -561,23 +746,14 @@ class Similarity(object):
         """
         Triangle function to weight correlations
         """
-        w = 1 - np.abs(self.r/self.l)
-        ids = (np.abs(self.r) > self.l)
-        w[ids] = 0
-
-        return w
+        return get_weight_function(self.r, self.l, 'triangle')
 
     def cosineFunction(self):
 
         """
         cosine function to weight correlations
         """
-        
-        w = 0.5 * (np.cos(np.pi * self.r/self.l) + 1.)
-        ids = (np.abs(self.r) > self.l)
-        w[ids] = 0
-
-        return w
+        return get_weight_function(self.r, self.l, 'cosine')
 
     def show(self, filename=None, fontsize=None, labels=["profile 1", "profile 2"]):
 
@@ -612,6 +788,221 @@ class Similarity(object):
            plt.savefig(filename)
            plt.close()
 
+# ------------------------------ Fingerprint index of XRDs ---------------------------------
+class FingerprintIndex(object):
+
+    def __init__(self, filename=None, x_range=[5, 80], l=2.0, res=None, 
+                 dim=64, seed=0):
+        
+        """
+        Class to search the most similar diffraction patterns in a large pool.
+        Each spectra is converted to a fixed-length fingerprint, i.e., the 
+        averages of the profile in the windows of width l around the bins.
+        The dot product of two fingerprints approximates the triangle weighted
+        correlation used in Similarity, so that they tolerate the peak shifts.
+        The fingerprints are appended as chunks of npy arrays to one file and
+        memory-mapped. A query is done in two stages: a shortlist from a linear
+        scan over the random projections (dim floats per spectra) of the 
+        fingerprints, then the exact fingerprint (or Similarity) ranking.
+
+        Args:
+            filename: the file to store the fingerprints, if None, 
+                they are kept in memory
+            x_range: the range of 2theta values ([x_min, x_max])
+            l: cutoff value for shift (real)
+            res: the spacing of the bins, the default is l/4
+            dim: the number of random projections 
+            seed: the random seed of the projections
+        """
+        self.filename = filename
+        self.x_range = [float(x_range[0]), float(x_range[1])]
+        self.l = abs(l)
+        self.res = self.l/4 if res is None else res
+        self.dim = dim
+        self.seed = seed
+        self.x = np.arange(self.x_range[0], self.x_range[1]+1e-8, self.res)
+        rng = np.random.RandomState(seed)
+        self.projections = rng.normal(size=[len(self.x), dim]).astype(np.float32)
+        self.chunks = []
+        self.starts = [0]
+        self._codes = np.zeros([0, dim], dtype=np.float32)
+        self._ncode = 0
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Load the index from the file and its .json parameters,
+        the chunks of fingerprints are memory-mapped in the read-only mode.
+        """
+        import json
+        with open(filename + '.json') as f:
+            kwargs = json.load(f)
+        index = cls(filename, **kwargs)
+        with open(filename, 'rb') as f:
+            size = f.seek(0, 2)
+            f.seek(0)
+            while f.tell() < size:
+                version = np.lib.format.read_magic(f)
+                if version == (1, 0):
+                    shape, _, dtype = np.lib.format.read_array_header_1_0(f)
+                else:
+                    shape, _, dtype = np.lib.format.read_array_header_2_0(f)
+                offset = f.tell()
+                if shape[0] > 0:
+                    index._append(np.memmap(filename, dtype=dtype, mode='r', 
+                                            offset=offset, shape=shape))
+                f.seek(offset + int(np.prod(shape))*dtype.itemsize)
+        return index
+
+    def __len__(self):
+        return self.starts[-1]
+
+    def __str__(self):
+        s = "Fingerprint index of {:d} PXRDs with {:d} bins".format(len(self), len(self.x))
+        return s
+
+    def __repr__(self):
+        return str(self)
+
+    def _append(self, fps):
+        self.chunks.append(fps)
+        self.starts.append(self.starts[-1] + len(fps))
+
+    def get_fingerprints(self, ids):
+        """
+        Collect the fingerprints of the given ids from the chunks
+
+        Args:
+            ids: 1D array of ids
+
+        Returns:
+            2D array of fingerprints
+        """
+        ids = np.asarray(ids, dtype=int)
+        fps = np.empty([len(ids), len(self.x)], dtype=np.float32)
+        chunk_ids = np.searchsorted(self.starts, ids, side='right') - 1
+        for c in np.unique(chunk_ids):
+            mask = chunk_ids == c
+            fps[mask] = self.chunks[c][ids[mask] - self.starts[c]]
+        return fps
+
+    def get_fingerprint(self, spectra):
+        """
+        Compute the fingerprint of one spectra on the bins of the index
+
+        Args:
+            spectra: 2D array or XRD object
+
+        Returns:
+            the normalized fingerprint
+        """
+        if hasattr(spectra, 'get_profile'):
+            spectra = spectra.get_profile()
+        return get_fingerprint(spectra, self.x, self.l).astype(np.float32)
+
+    def add(self, spectra):
+        """
+        Add a list of spectra to the index. With a filename, they are
+        appended to the file as a new chunk, and the parameters are saved 
+        to filename.json.
+
+        Args:
+            spectra: list of spectra (2D arrays or XRD objects)
+
+        Returns:
+            the ids of the added spectra
+        """
+        fps = np.array([self.get_fingerprint(s) for s in spectra], dtype=np.float32)
+        fps = fps.reshape([len(spectra), len(self.x)])
+        N0 = len(self)
+        if len(fps) == 0:
+            return np.arange(N0, N0)
+
+        if self.filename is None:
+            self._append(fps)
+        else:
+            import json
+            with open(self.filename, 'ab') as f:
+                np.lib.format.write_array(f, fps)
+                offset = f.tell() - fps.nbytes
+            self._append(np.memmap(self.filename, dtype=np.float32, mode='r', 
+                                   offset=offset, shape=fps.shape))
+            kwargs = {"x_range": self.x_range, "l": self.l, "res": self.res,
+                      "dim": self.dim, "seed": self.seed}
+            with open(self.filename + '.json', 'w') as f:
+                json.dump(kwargs, f)
+
+        return np.arange(N0, N0+len(fps))
+
+    def get_codes(self):
+        """
+        The random projections of all fingerprints. Only the fingerprints 
+        added since the last call are projected, and the buffer of codes
+        grows geometrically.
+        """
+        N0, N = self._ncode, len(self)
+        if N0 < N:
+            if len(self._codes) < N:
+                codes = np.empty([max([N, 2*len(self._codes)]), self.dim], dtype=np.float32)
+                codes[:N0] = self._codes[:N0]
+                self._codes = codes
+            for i in range(N0, N, 65536):
+                ids = np.arange(i, min([i+65536, N]))
+                codes = np.dot(self.get_fingerprints(ids), self.projections)
+                self._codes[ids] = codes / np.sqrt(self.dim)
+            self._ncode = N
+        return self._codes[:N]
+
+    def query(self, spectra, k=10, shortlist=200, rerank=None, 
+              pool=None, weight='cosine'):
+        """
+        Find the k most similar spectra in the index. The shortlist is 
+        selected by a linear scan over the projected codes of all spectra,
+        which is cheaper than the fingerprints but still O(N) per query.
+
+        Args:
+            spectra: 2D array or XRD object
+            k: the number of spectra to return
+            shortlist: the number of candidates from the random projections,
+                the exhaustive search is used if it is larger than the index
+            rerank: the number of candidates to be reranked by Similarity, 
+                the default is 3*k
+            pool: list (or function of the id) of the spectra in the index,
+                if given, the candidates are reranked by the exact Similarity
+            weight: weight function 'triangle' or 'cosine' for Similarity
+
+        Returns:
+            the ids and the similarities (fingerprint or Similarity values)
+        """
+        if hasattr(spectra, 'get_profile'):
+            spectra = spectra.get_profile()
+        fp = self.get_fingerprint(spectra)
+        if len(self) == 0:
+            return np.zeros(0, dtype=int), np.zeros(0)
+
+        if shortlist < len(self):
+            approx = np.dot(self.get_codes(), np.dot(fp, self.projections))
+            ids = np.argpartition(-approx, shortlist-1)[:shortlist]
+            ids.sort()
+        else:
+            ids = np.arange(len(self))
+
+        sims = np.dot(self.get_fingerprints(ids), fp)
+        n = len(ids) if pool is None else min([len(ids), 3*k if rerank is None else rerank])
+        n = max([min([k, len(ids)]), n])
+        order = np.argsort(-sims, kind='stable')[:n]
+        ids, sims = ids[order], sims[order].astype(float)
+
+        if pool is not None:
+            get = pool if callable(pool) else pool.__getitem__
+            s = Similarity(spectra, get(ids[0]), x_range=self.x_range, 
+                           l=self.l, weight=weight)
+            sims = np.array([s.compare(get(i)) for i in ids])
+            order = np.argsort(-sims, kind='stable')
+            ids, sims = ids[order], sims[order]
+
+        return ids[:k], sims[:k]
+
 @nb.njit(nb.f8[:](nb.f8[:], nb.f8, nb.f8, nb.f8, nb.f8, nb.i8), cache = True)
 def mod_pseudo_voigt(x, fwhm, A, eta_h, eta_l, N):
     
@@ -623,19 +1014,19 @@ def mod_pseudo_voigt(x, fwhm, A, eta_h, eta_l, N):
     tmp = np.zeros((N))
     for xi, dx in enumerate(x):
         if dx < 0:
-            A = A
-            eta_l = eta_l
-            eta_h = eta_h
+            A0 = A
+            eta_l0 = eta_l
+            eta_h0 = eta_h
         else:
-            A = 1/A
-            eta_l = eta_h
-            eta_h = eta_l
-
-        tmp[xi] = ((1+A)*(eta_h + np.sqrt(np.pi*np.log(2))*(1-eta_h))) /\
-            (eta_l + np.sqrt(np.pi*np.log(2)) * (1-eta_l) + A*(eta_h +\
-            np.sqrt(np.pi*np.log(2))*(1-eta_h))) * (eta_l*2/(np.pi*fwhm) *\
-            (1+((1+A)/A)**2 * (dx/fwhm)**2)**(-1) + (1-eta_l)*np.sqrt(np.log(2)/np.pi) *\
-            2/fwhm *np.exp(-np.log(2) * ((1+A)/A)**2 * (dx/fwhm)**2))
+            A0 = 1/A
+            eta_l0 = eta_h
+            eta_h0 = eta_l
+
+        tmp[xi] = ((1+A0)*(eta_h0 + np.sqrt(np.pi*np.log(2))*(1-eta_h0))) /\
+            (eta_l0 + np.sqrt(np.pi*np.log(2)) * (1-eta_l0) + A0*(eta_h0 +\
+            np.sqrt(np.pi*np.log(2))*(1-eta_h0))) * (eta_l0*2/(np.pi*fwhm) *\
+            (1+((1+A0)/A0)**2 * (dx/fwhm)**2)**(-1) + (1-eta_l0)*np.sqrt(np.log(2)/np.pi) *\
+            2/fwhm *np.exp(-np.log(2) * ((1+A0)/A0)**2 * (dx/fwhm)**2))
     return tmp
 
 @nb.njit(nb.f8[:](nb.f8, nb.f8[:], nb.f8), cache = True)
@@ -693,6 +1084,404 @@ def similarity_calculate(r, w, d, Npts, fy, gy):
     return np.abs(xCorrfg_w / np.sqrt(aCorrff_w * aCorrgg_w))
 
 
+def get_hkl_families(hkls, peak_ids, keep):
+    """
+    Group the hkls of each peak into families of permutations, as in
+    XRD.get_unique_families
+
+    Args:
+        hkls: the hkl indices (M*3)
+        peak_ids: the peak index of each hkl (M)
+        keep: whether or not to return the families of each peak
+
+    Returns:
+        a list of [(hkl, multiplicity), ...] for each kept peak, where the
+        families are in the order of their first hkl and labelled by
+        their largest hkl
+    """
+    hkls = np.array(hkls, dtype=int)
+    base = 2 * np.abs(hkls).max() + 1
+    shift = (base - 1) // 2
+    fams = np.sort(np.abs(hkls), axis=1)
+    fam_keys = (fams[:, 0] * base + fams[:, 1]) * base + fams[:, 2]
+    hkl_keys = ((hkls[:, 0] + shift) * base + hkls[:, 1] + shift) * base + hkls[:, 2] + shift
+
+    mask = keep[peak_ids]
+    ids = np.where(mask)[0]
+    keys = peak_ids[mask] * base**3 + fam_keys[mask]
+    _, firsts, inverse, counts = np.unique(keys, return_index=True, \
+            return_inverse=True, return_counts=True)
+    labels = np.full(len(firsts), -1)
+    np.maximum.at(labels, inverse, hkl_keys[mask])
+    labels = np.array([labels // base**2, labels // base % base, labels % base]).T - shift
+
+    # sort the families by the peaks and their first appearance
+    firsts = ids[firsts]
+    seq = np.lexsort((firsts, peak_ids[firsts]))
+    splits = np.where(np.diff(peak_ids[firsts[seq]]) > 0)[0] + 1
+    families = []
+    for group in np.split(seq, splits):
+        families.append([(tuple(labels[i]), counts[i]) for i in group])
+    return families
+
+def get_pyxtal_data(struc):
+    """
+    Get the atoms and symmetry operations from a pyxtal structure
+
+    Args:
+        struc: pyxtal object
+
+    Returns:
+        the fractional coordinates, species, rotations and translations
+    """
+    if struc.molecular:
+        coords, species = struc._get_coords_and_species(absolute=True)
+        coords = coords.dot(struc.lattice.inv_matrix)
+    else:
+        coords, species = struc._get_coords_and_species()
+
+    # the general position, see Wyckoff_position.diagonalize_symops for diag
+    ops = struc.group.wyckoffs[0]
+    rotations = np.array([np.round(op.rotation_matrix) for op in ops], dtype=int)
+    translations = np.array([op.translation_vector for op in ops])
+    if struc.diag and struc.group.number in [7, 14, 15]:
+        translations = translations.dot(np.array([[1,0,0],[0,1,0],[1,0,1]]))
+        translations -= np.floor(translations)
+    return coords, [str(specie) for specie in species], rotations, translations
+
+def get_centering(rotations, translations, tol=1e-3):
+    """
+    Get the centering vectors and check if the inversion is at the origin
+    (up to a centering vector)
+
+    Args:
+        rotations: the rotations of the symmetry operations (G*3*3)
+        translations: the translations of the symmetry operations (G*3)
+        tol: tolerance to compare the translations
+
+    Returns:
+        the centering vectors (K*3) and the inversion flag
+    """
+    translations = np.array(translations, dtype=float)
+    translations -= np.round(translations)
+    ids = np.all(np.array(rotations) == np.eye(3, dtype=int), axis=(1, 2))
+    centering = [np.zeros(3)]
+    for tran in translations[ids]:
+        diffs = np.array(centering) - tran
+        if np.abs(diffs - np.round(diffs)).max(axis=1).min() > tol:
+            centering.append(tran)
+    centering = np.array(centering)
+
+    inversion = False
+    ids = np.all(np.array(rotations) == -np.eye(3, dtype=int), axis=(1, 2))
+    for tran in translations[ids]:
+        diffs = centering - tran
+        if np.abs(diffs - np.round(diffs)).max(axis=1).min() < tol:
+            inversion = True
+            break
+    return centering, inversion
+
+def get_reduced_positions(positions, ids, centering, inversion, tol=1e-3):
+    """
+    Keep one atom for each set of atoms related by the centering vectors,
+    and one for each pair related by the inversion (with the weight of 2).
+    If any atom has no partner, the atoms are not reduced.
+
+    Args:
+        positions: the fractional coordinates of the atoms (N*3)
+        ids: the element index of each atom (N)
+        centering: the centering vectors (K*3)
+        inversion: whether or not the structure has inversion at the origin
+        tol: tolerance to match the atoms
+
+    Returns:
+        positions, ids, weights, centering and the flag for the real F
+    """
+    from scipy.spatial import cKDTree
+
+    def wrap(pts):
+        pts = pts - np.floor(pts)
+        pts[pts >= 1] = 0
+        return pts
+
+    positions = np.array(positions, dtype=float)
+    N = len(positions)
+    full = positions, ids, np.ones(N), np.zeros([1, 3]), False
+    if N == 0 or (len(centering) == 1 and not inversion):
+        return full
+
+    tree = cKDTree(wrap(positions), boxsize=1)
+    def find(pts):
+        dists, js = tree.query(wrap(pts))
+        if dists.max() > tol or np.any(ids[js] != ids):
+            return None
+        return js
+
+    reps = np.arange(N)
+    for vec in centering:
+        js = find(positions + vec)
+        if js is None:
+            return full
+        reps = np.minimum(reps, js)
+    keep = reps == np.arange(N)
+
+    weights = np.ones(N)
+    if inversion:
+        js = find(-positions)
+        if js is None:
+            inversion = False
+        else:
+            partners = reps[js]
+            weights[partners > np.arange(N)] = 2
+            keep &= partners >= np.arange(N)
+    return positions[keep], ids[keep], weights[keep], centering, inversion
+
+def get_symmetry(crystal, symprec=1e-5):
+    """
+    Get the symmetry operations of the crystal in its own cell setting
+
+    Args:
+        crystal: ase atoms object
+        symprec: the tolerance of spglib, if None only the identity is returned
+
+    Returns:
+        the rotations (G*3*3) and translations (G*3)
+    """
+    rotations, translations = np.eye(3, dtype=int)[None, :, :], np.zeros([1, 3])
+    if symprec is not None:
+        from spglib import get_symmetry as spg_get_symmetry
+        cell = (crystal.get_cell()[:], crystal.get_scaled_positions(), crystal.numbers)
+        data = spg_get_symmetry(cell, symprec=symprec)
+        if data is not None:
+            rotations, translations = data['rotations'], data['translations']
+    return rotations, translations
+
+def get_unique_reflections(hkls, rotations, translations, tol=1e-3):
+    """
+    Reduce the reflections by the Laue symmetry. For an operation (R, t),
+    F(h) = exp(2pi*i h.t) F(hR), and |F(h)| = |F(-h)| by Friedel's law.
+    Therefore, all the reflections in the orbit of h under the Laue group
+    share the same intensity, and h is systematically absent if there is
+    an operation with hR = h and a non-integer h.t.
+
+    Args:
+        hkls: the hkl indices (M*3)
+        rotations: the rotations of the symmetry operations (G*3*3)
+        translations: the translations of the symmetry operations (G*3)
+        tol: tolerance to check the phase shifts
+
+    Returns:
+        uniques: the indices of the unique reflections in hkls
+        inverse: the index of the unique reflection for each hkl
+        absent: whether or not each unique reflection is absent
+    """
+    hkls = np.array(hkls, dtype=int)
+    base = 2 * np.abs(hkls).max() + 1
+    rots = np.unique(np.array(rotations, dtype=int), axis=0)
+    rots = np.vstack([rots, -rots])
+
+    # the representative of each orbit has the largest key
+    keys = np.full(len(hkls), -1)
+    for rot in rots:
+        hkl1 = np.dot(hkls, rot) + (base - 1) // 2
+        keys = np.maximum(keys, (hkl1[:, 0] * base + hkl1[:, 1]) * base + hkl1[:, 2])
+    _, uniques, inverse = np.unique(keys, return_index=True, return_inverse=True)
+
+    hkl_uniques = hkls[uniques]
+    absent = np.zeros(len(uniques), dtype=bool)
+    for rot, tran in zip(rotations, translations):
+        shifts = np.dot(hkl_uniques, tran)
+        shifts = np.abs(shifts - np.round(shifts)) > tol
+        absent |= np.all(np.dot(hkl_uniques, rot) == hkl_uniques, axis=1) & shifts
+    return uniques, inverse, absent
+
+def get_scattering_factors(s2s, zs, coeffs):
+    """
+    Compute the atomic scattering factors
+
+    Args:
+        s2s: the (sin(theta)/lambda)^2 values (M)
+        zs: the atomic numbers of the elements (E)
+        coeffs: the scattering parameters of the elements (E*K*2)
+
+    Returns:
+        the scattering factors (M*E)
+    """
+    exps = np.exp(-coeffs[None, :, :, 1] * s2s[:, None, None])
+    return zs - 41.78214 * s2s[:, None] * np.sum(coeffs[None, :, :, 0] * exps, axis=2)
+
+def structure_factor(hkls, positions, ids, sfs, s2_ids, weights=None, 
+                     centering=None, real=False, max_size=2000000):
+    """
+    Compute the squared structure factors |F(hkl)|^2. The phases of each
+    block of reflections are summed per element with a matrix product,
+    the block size is chosen to keep the phase matrix below max_size.
+    The atoms can be reduced by the centering vectors c, which multiply
+    F by sum_c exp(2pi*i h.c), and by the inversion, which makes F real.
+
+    Args:
+        hkls: the hkl indices (M*3)
+        positions: the fractional coordinates of the atoms (N*3)
+        ids: the element index of each atom (N)
+        sfs: the scattering factors for each s2 value and element
+        s2_ids: the s2 index of each reflection (M)
+        weights: the weight of each atom (N)
+        centering: the centering vectors (K*3)
+        real: whether or not F is real
+        max_size: the maximum number of elements in each block
+
+    Returns:
+        the intensities (M)
+    """
+    if weights is None:
+        weights = np.ones(len(positions))
+    onehot = np.zeros([len(positions), sfs.shape[1]])
+    onehot[np.arange(len(positions)), ids] = weights
+    block = max([1, int(max_size/max([1, len(positions)]))])
+    I = np.zeros(len(hkls))
+    for i in range(0, len(hkls), block):
+        phases = 2 * np.pi * np.dot(hkls[i:i+block], positions.T)
+        sf = sfs[s2_ids[i:i+block]]
+        f_real = np.sum(np.dot(np.cos(phases), onehot) * sf, axis=1)
+        I[i:i+block] = f_real**2
+        if not real:
+            f_imag = np.sum(np.dot(np.sin(phases), onehot) * sf, axis=1)
+            I[i:i+block] += f_imag**2
+        if centering is not None:
+            phases = 2 * np.pi * np.dot(hkls[i:i+block], centering.T)
+            I[i:i+block] *= np.cos(phases).sum(axis=1)**2
+    return I
+
+@nb.njit(nb.f8[:](nb.f8[:, :], nb.f8[:, :], nb.i8[:], nb.f8[:, :], nb.i8[:], \
+                  nb.f8[:], nb.f8[:, :], nb.b1), cache = True)
+def structure_factor_numba(hkls, positions, ids, sfs, s2_ids, weights, centering, real):
+    """
+    Numba version of structure_factor
+    """
+    I = np.zeros(len(hkls))
+    for i in range(len(hkls)):
+        f_real, f_imag = 0.0, 0.0
+        for j in range(len(positions)):
+            phase = 2 * np.pi * (hkls[i, 0]*positions[j, 0] + \
+                    hkls[i, 1]*positions[j, 1] + hkls[i, 2]*positions[j, 2])
+            sf = sfs[s2_ids[i], ids[j]] * weights[j]
+            f_real += sf * np.cos(phase)
+            if not real:
+                f_imag += sf * np.sin(phase)
+        f_cent = 0.0
+        for j in range(len(centering)):
+            f_cent += np.cos(2 * np.pi * (hkls[i, 0]*centering[j, 0] + \
+                    hkls[i, 1]*centering[j, 1] + hkls[i, 2]*centering[j, 2]))
+        I[i] = (f_real**2 + f_imag**2) * f_cent**2
+    return I
+
+def get_weight_function(r, l, weight='cosine'):
+    """
+    Triangle or cosine function to weight correlations
+
+    Args:
+        r: the shifts
+        l: cutoff value for shift
+        weight: 'triangle' or 'cosine'
+    """
+    if weight == 'triangle':
+        w = 1 - np.abs(r/l)
+    elif weight == 'cosine':
+        w = 0.5 * (np.cos(np.pi * r/l) + 1.)
+    else:
+        msg = weight + ' is not supported'
+        raise NotImplementedError(msg)
+    w[np.abs(r) > l] = 0
+    return w
+
+def get_shift_weights(r, w, d, Npts):
+    """
+    Round each shift r0 to int(r0/d) grid points as in similarity_calculate,
+    and sum up the weights of the same integer shift.
+
+    Returns:
+        the maximum shift S and the weights of the shifts -S...S
+    """
+    shifts = (np.array(r) / d).astype(int)
+    valid = np.abs(shifts) <= Npts - 1
+    S = max([np.abs(shifts[valid]).max(initial=0), 1])
+    weights = np.bincount(shifts[valid] + S, weights=np.array(w)[valid], minlength=2*S+1)
+    return S, weights
+
+def get_reference(r, w, d, Npts, fy):
+    """
+    Precompute the quantities of the reference spectra fy to compute
+    the similarity with FFT, which gives the same result as
+    similarity_calculate.
+
+    Args:
+        r: the shifts
+        w: the weights of the shifts
+        d: the grid spacing
+        Npts: the number of grid points
+        fy: the reference spectra
+
+    Returns:
+        a dictionary with the weights of the integer shifts, the FFT of
+        the padded fy and its weighted autocorrelation
+    """
+    from scipy.fft import next_fast_len
+    S, weights = get_shift_weights(r, w, d, Npts)
+    n = next_fast_len(Npts + S)
+    F = np.fft.rfft(fy, n)
+
+    ref = {"S": S, "n": n, "d": d, "F": F, "weights": weights}
+    ref["aCorrff_w"] = weighted_correlation(ref, F, F)
+    return ref
+
+def weighted_correlation(ref, F, G):
+    """
+    Compute the weighted correlation sum_s w(s) sum_i f[i]g[i+s] d^2,
+    where F and G are the FFTs of the padded f and g.
+    """
+    n, S = ref["n"], ref["S"]
+    corr = np.fft.irfft(np.conj(F) * G, n)
+    corr = np.concatenate((corr[n-S:], corr[:S+1]))
+    return np.dot(ref["weights"], corr) * ref["d"]**2
+
+def similarity_fft(ref, gy):
+    """
+    Compute the similarity between the reference and the spectra gy by FFT
+
+    Args:
+        ref: the dictionary from get_reference
+        gy: the spectra on the same grid as the reference
+
+    Returns:
+        the similarity value
+    """
+    G = np.fft.rfft(gy, ref["n"])
+    xCorrfg_w = weighted_correlation(ref, ref["F"], G)
+    aCorrgg_w = weighted_correlation(ref, G, G)
+    return np.abs(xCorrfg_w / np.sqrt(ref["aCorrff_w"] * aCorrgg_w))
+
+def get_fingerprint(spectra, x, l):
+    """
+    Compute the averages of the spectra in the windows [x-l/2, x+l/2] from
+    its cumulative integral. Since the correlation of two windows is the 
+    triangle function, the dot product of the fingerprints approximates 
+    the triangle weighted correlation of the spectra.
+
+    Args:
+        spectra: 2D array
+        x: the centers of the bins
+        l: the width of the window
+
+    Returns:
+        the normalized fingerprint
+    """
+    fx, fy = np.asarray(spectra[0], dtype=float), np.asarray(spectra[1], dtype=float)
+    F = np.zeros(len(fx))
+    F[1:] = np.cumsum(0.5*(fy[1:]+fy[:-1])*np.diff(fx))
+    fp = np.interp(x+l/2, fx, F) - np.interp(x-l/2, fx, F)
+    norm = np.linalg.norm(fp)
+    return fp/norm if norm > 0 else fp
+
 def create_index():
     hkl_index = []
     for i in [-1,0,1]:
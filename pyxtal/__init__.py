@@ -49,6 +49,24 @@ def print_logo():
     print("The source code is available at https://github.com/qzhu2017/pyxtal")
     print("Developed by Zhu's group at University of Nevada Las Vegas\n\n")
 
+def _get_subgroups(args):
+    """
+    expand a structure to its subgroup structures in the worker process
+    """
+    struc, group_type, max_cell, eps = args
+    return struc.subgroup(eps=eps, group_type=group_type, max_cell=max_cell)
+
+def _get_new_strucs(results, keys):
+    """
+    yield the structures whose keys are not in the set of keys
+    """
+    for strucs in results:
+        for struc in strucs:
+            key = struc.get_key()
+            if key not in keys:
+                keys.add(key)
+                yield struc
+
 class pyxtal:
     """
     Class for handling atomic crystals based on symmetry constraints. 
@@ -459,7 +477,7 @@ class pyxtal:
         else:
             raise RuntimeError("Cannot create file: structure did not generate")
 
-    def supergroup(self, G=None, group_type='t', d_tol=1.0):
+    def supergroup(self, G=None, group_type='t', d_tol=1.0, ncpu=1):
         """
         generate a structure with lower symmetry
 
@@ -467,6 +485,7 @@ class pyxtal:
             G: super space group number (list of integers)
             group_type: `t`, `k` or `t+k`
             d_tol: maximum tolerance
+            ncpu: number of processes for the search
 
         Returns:
             a list of pyxtal structures with minimum super group symmetries
@@ -475,10 +494,10 @@ class pyxtal:
         from pyxtal.supergroup import supergroup
 
         my_super = supergroup(self, G=G, group_type=group_type)
-        solutions = my_super.search_supergroup(d_tol=d_tol)
+        solutions = my_super.search_supergroup(d_tol=d_tol, ncpu=ncpu)
         return my_super.make_supergroup(solutions)
 
-    def subgroup(self, permutations=None, H=None, eps=0.05, idx=None, group_type='t', max_cell=4):
+    def subgroup(self, permutations=None, H=None, eps=0.05, idx=None, group_type='t', max_cell=4, max_depth=3):
         """
         generate a structure with lower symmetry
 
@@ -489,6 +508,8 @@ class pyxtal:
             idx: list
             group_type: `t`, `k` or `t+k`
             max_cell: maximum cell reconstruction (float)
+            max_depth: maximum number of extra subgroup levels to search
+                when none of the splits is valid
 
         Returns:
             a list of pyxtal structures with lower symmetries
@@ -534,9 +555,25 @@ class pyxtal:
         if len(valid_splitters) == 0:
             #print("try do one more step")
             new_strucs = []
+            keys = set()
             for splitter in bad_splitters:
-                trail_struc = self._subgroup_by_splitter(splitter)
-                new_strucs.extend(trail_struc.subgroup(permutations, group_type=group_type))
+                multiple = np.linalg.det(splitter.R[:3,:3])
+                if max_depth < 1 or splitter.H.number == 1 or max_cell/multiple < 1 - 1e-3:
+                    continue
+                # the unperturbed structures can be compared by get_key
+                trail_struc = self._subgroup_by_splitter(splitter, eps=0)
+                strucs = trail_struc.subgroup(permutations, eps=0, group_type=group_type, 
+                                              max_cell=max_cell/multiple, max_depth=max_depth-1)
+                # remove the duplicates from different branches
+                for struc in strucs:
+                    key = struc.get_key()
+                    if key not in keys:
+                        keys.add(key)
+                        new_strucs.append(struc)
+            if permutations is None and eps > 0:
+                for struc in new_strucs:
+                    struc.apply_perturbation(d_lat=eps, d_coor=eps)
+                    struc.source = 'subgroup'
             return new_strucs
         else:
             #print(len(valid_splitters), "valid_splitters are present")
@@ -550,6 +587,69 @@ class pyxtal:
             return new_strucs
 
 
+    def subgroup_tree(self, depth=2, group_type='t', max_cell=4, eps=0, ncpu=1):
+        """
+        breadth-first enumeration of the subgroup tree, the duplicated
+        structures (see get_key) are removed across all branches.
+
+        Args:
+            depth: the maximum number of subgroup levels
+            group_type: `t`, `k` or `t+k`
+            max_cell: maximum cell reconstruction relative to this structure
+            eps: pertubation term (float)
+            ncpu: number of processes to expand the structures of a level
+
+        Returns:
+            a generator of (level, pyxtal structure)
+        """
+        n0 = sum(self.numMols) if self.molecular else sum(self.numIons)
+        keys = set([self.get_key()])
+        level = [self]
+        for d in range(1, depth+1):
+            tasks = []
+            for struc in level:
+                n = sum(struc.numMols) if struc.molecular else sum(struc.numIons)
+                if max_cell*n0/n >= 1:
+                    tasks.append((struc, group_type, max_cell*n0/n, eps))
+
+            level = []
+            if ncpu > 1 and len(tasks) > 1:
+                from concurrent.futures import ProcessPoolExecutor
+                with ProcessPoolExecutor(ncpu) as executor:
+                    results = executor.map(_get_subgroups, tasks)
+                    for struc in _get_new_strucs(results, keys):
+                        level.append(struc)
+                        yield d, struc
+            else:
+                for struc in _get_new_strucs(map(_get_subgroups, tasks), keys):
+                    level.append(struc)
+                    yield d, struc
+
+    def get_key(self, decimals=2):
+        """
+        a cheap hashable key to identify the duplicated structures, 
+        which consists of the group number, the Wyckoff sites, and the
+        parameters and the sorted fractional coordinates of the reduced cell
+
+        Args:
+            decimals: the number of decimals to round the values
+
+        Returns:
+            a tuple
+        """
+        if self.molecular:
+            sites = [site.molecule.name + str(site.wp.multiplicity) + site.wp.letter for site in self.mol_sites]
+        else:
+            sites = [site.specie + str(site.wp.multiplicity) + site.wp.letter for site in self.atom_sites]
+
+        lattice, tran = self.lattice.get_reduced()
+        paras = np.round(lattice.get_para(degree=True), decimals)
+        coords, species = self._get_coords_and_species()
+        coords = np.dot(coords, np.linalg.inv(tran))
+        coords = np.round(np.round(coords, decimals) % 1, decimals) % 1
+        atoms = sorted([(str(specie),) + tuple(coord) for specie, coord in zip(species, coords)])
+        return (self.group.number, tuple(sorted(sites)), tuple(paras), tuple(atoms))
+
     def subgroup_once(self, eps=0.1, H=None, permutations=None, group_type='t', max_cell=4):
         """
         generate a structure with lower symmetry (for atomic crystals only)
@@ -912,9 +1012,17 @@ class pyxtal:
             - thetas [0, 180]
             - preferred_orientation: False
             - march_parameter: None
+            - backend: 'numpy'
+            - symprec: 1e-5, only used for the non 3D structures
+
+        For 3D structures, the atoms and the symmetry operations are taken 
+        directly from the Wyckoff sites and the space group.
         """
 
-        return XRD(self.to_ase(), **kwargs)
+        if self.dim == 3:
+            return XRD(self, **kwargs)
+        else:
+            return XRD(self.to_ase(), **kwargs)
 
     def show(self, **kwargs):
         """
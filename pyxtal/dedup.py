@@ -0,0 +1,235 @@
+"""
+Module to remove the duplicated structures from a large batch of pyxtal
+structures, e.g., the outputs of random structure generation
+"""
+import itertools
+import numpy as np
+from pymatgen.analysis import structure_matcher as sm
+
+def get_key(struc):
+    """
+    get the hashable part of the fingerprint, i.e., the group number
+    and the sorted multiset of (specie, multiplicity) for each Wyckoff
+    site. The Wyckoff letters are not used since they depend on the
+    choice of origin (e.g., Na(4a)Cl(4b) and Na(4b)Cl(4a) in NaCl)
+
+    Args:
+        struc: pyxtal structure
+
+    Returns:
+        a tuple
+    """
+    if struc.molecular:
+        sites = [(site.molecule.name, site.wp.multiplicity) for site in struc.mol_sites]
+    else:
+        sites = [(site.specie, site.wp.multiplicity) for site in struc.atom_sites]
+    return (struc.group.number, tuple(sorted(sites)))
+
+def get_rdf(coords, species, matrix, rmax=6.0, sigma=0.1, dr=0.05):
+    """
+    compute the gaussian smeared radial distribution function
+    for each pair of species, normalized per atom
+
+    Args:
+        coords: N*3 cartesian coordinates
+        species: list of N species
+        matrix: 3*3 lattice matrix
+        rmax: the cutoff radius
+        sigma: the width of gaussian smearing
+        dr: the grid spacing
+
+    Returns:
+        a 1D numpy array
+    """
+    species = np.array(species)
+    elements = sorted(set(species))
+    # the number of images along each axis
+    volume = abs(np.linalg.det(matrix))
+    heights = volume / np.linalg.norm(np.cross(matrix[[1, 2, 0]], matrix[[2, 0, 1]]), axis=1)
+    n = np.ceil(rmax/heights).astype(int)
+    shifts = np.array(np.meshgrid(*[range(-i, i+1) for i in n])).reshape(3, -1).T
+    shifts = shifts.dot(matrix)
+
+    grid = np.arange(0, rmax+dr, dr)
+    rdfs = []
+    for i, e1 in enumerate(elements):
+        pos1 = coords[species==e1]
+        for e2 in elements[i:]:
+            pos2 = coords[species==e2]
+            pos2 = (pos2[:, None, :] + shifts[None, :, :]).reshape(-1, 3)
+            dists = np.linalg.norm(pos1[:, None, :] - pos2[None, :, :], axis=2).flatten()
+            dists = dists[(dists > 1e-3) * (dists < rmax)]
+            rdf = np.exp(-0.5*((grid[:, None] - dists[None, :])/sigma)**2).sum(axis=1)
+            rdfs.append(rdf/len(coords))
+    return np.concatenate(rdfs)
+
+def get_fingerprint(struc, rmax=6.0, sigma=0.1, dr=0.05):
+    """
+    compute the fingerprint of a pyxtal structure, which consists of
+    the hashable key (see get_key), the sorted lengths and the volume per
+    atom of the LLL reduced cell, and the radial distribution function
+
+    Args:
+        struc: pyxtal structure
+        rmax: the cutoff radius for rdf
+        sigma: the width of gaussian smearing for rdf
+        dr: the grid spacing for rdf
+
+    Returns:
+        key, paras, rdf
+    """
+    coords, species = struc._get_coords_and_species(absolute=True)
+    lattice, _ = struc.lattice.get_reduced()
+    matrix = lattice.matrix
+    volume = abs(np.linalg.det(matrix))/len(coords)
+    paras = np.append(np.sort(np.linalg.norm(matrix, axis=1)), volume)
+    rdf = get_rdf(coords, species, matrix, rmax, sigma, dr)
+    return get_key(struc), paras, rdf
+
+def get_rdf_distance(rdf1, rdf2):
+    """
+    the relative difference between two rdfs
+
+    Args:
+        rdf1: 1D numpy array
+        rdf2: 1D numpy array
+
+    Returns:
+        a float between 0 and 2
+    """
+    if len(rdf1) != len(rdf2):
+        return 2.0
+    total = 0.5*(rdf1.sum() + rdf2.sum())
+    if total < 1e-8:
+        return 0.0
+    return np.abs(rdf1-rdf2).sum()/total
+
+
+class structure_index():
+    """
+    Class to accept or reject the structures based on the fingerprint.
+    The structures are stored in the buckets according to the hashable
+    key, the sorted reduced cell lengths and the volume per atom, so that
+    a new structure is only compared against the candidates in the same
+    and neighboring buckets
+
+    Args:
+        ltol: relative tolerance for the reduced cell lengths
+        vtol: relative tolerance for the volume per atom
+        rtol: tolerance for the rdf distance (see get_rdf_distance)
+        confirm: whether or not to confirm the match by StructureMatcher
+        rmax: the cutoff radius for rdf
+        sigma: the width of gaussian smearing for rdf
+        dr: the grid spacing for rdf
+    """
+    def __init__(self, ltol=0.05, vtol=0.05, rtol=0.05, confirm=False,
+                 rmax=6.0, sigma=0.1, dr=0.05):
+        self.ltol = ltol
+        self.vtol = vtol
+        self.rtol = rtol
+        self.confirm = confirm
+        self.rmax = rmax
+        self.sigma = sigma
+        self.dr = dr
+        self.buckets = {}
+        self.fingerprints = []
+        self.strucs = []
+
+    def __len__(self):
+        return len(self.fingerprints)
+
+    def __str__(self):
+        s = "\nstructure_index with {:d} structures in {:d} buckets".format(len(self), len(self.buckets))
+        return s
+
+    def __repr__(self):
+        return str(self)
+
+    def get_fingerprint(self, struc):
+        """
+        compute the fingerprint with the parameters of the index
+        """
+        return get_fingerprint(struc, self.rmax, self.sigma, self.dr)
+
+    def _get_bin(self, paras):
+        """
+        the bin of the sorted reduced cell lengths and the volume per atom
+        on the logarithmic scale. The widths are no smaller than the
+        tolerances, so that the matches are always in the neighboring bins
+        """
+        widths = np.array([-np.log(1-self.ltol)]*3 + [self.vtol])
+        return tuple(np.floor(np.log(paras)/widths).astype(int).tolist())
+
+    def _match(self, fp1, fp2, struc1, struc2):
+        """
+        check if two fingerprints (and structures) are the same
+        """
+        (_, paras1, rdf1), (_, paras2, rdf2) = fp1, fp2
+        if abs(np.log(paras1[-1]/paras2[-1])) > self.vtol:
+            return False
+        if np.max(np.abs(paras1[:3]/paras2[:3]-1)) > self.ltol:
+            return False
+        if get_rdf_distance(rdf1, rdf2) > self.rtol:
+            return False
+        if self.confirm:
+            pmg1 = struc1.to_pymatgen()
+            pmg2 = struc2.to_pymatgen()
+            return sm.StructureMatcher().fit(pmg1, pmg2)
+        return True
+
+    def query(self, struc, fp=None):
+        """
+        find the duplicate of the given structure in the index
+
+        Args:
+            struc: pyxtal structure
+            fp: the precomputed fingerprint (optional)
+
+        Returns:
+            the id of the matched structure or None
+        """
+        if fp is None:
+            fp = self.get_fingerprint(struc)
+        key, paras = fp[0], fp[1]
+        b = self._get_bin(paras)
+        for shift in itertools.product([0, -1, 1], repeat=len(b)):
+            bin = tuple([i+j for i, j in zip(b, shift)])
+            for id in self.buckets.get((key, bin), []):
+                if self._match(fp, self.fingerprints[id], struc, self.strucs[id]):
+                    return id
+        return None
+
+    def add(self, struc):
+        """
+        add the structure to the index if it is new
+
+        Args:
+            struc: pyxtal structure
+
+        Returns:
+            (True, new id) if the structure is new, otherwise
+            (False, the id of the matched structure)
+        """
+        fp = self.get_fingerprint(struc)
+        id = self.query(struc, fp)
+        if id is not None:
+            return False, id
+
+        id = len(self.fingerprints)
+        bin = self._get_bin(fp[1])
+        self.buckets.setdefault((fp[0], bin), []).append(id)
+        self.fingerprints.append(fp)
+        self.strucs.append(struc if self.confirm else None)
+        return True, id
+
+    def filter(self, strucs):
+        """
+        return the new structures from a batch
+
+        Args:
+            strucs: list of pyxtal structures
+
+        Returns:
+            list of pyxtal structures
+        """
+        return [struc for struc in strucs if self.add(struc)[0]]
@@ -2,39 +2,60 @@
 This module handles reading and write crystal files.
 """
 from pyxtal.constants import deg, logo
+import re
+from copy import copy
 import numpy as np
+import itertools
 from pymatgen.core.structure import Structure, Molecule
-from pymatgen.core.bonds import CovalentBond
+from pymatgen.core.operations import SymmOp
 from pymatgen.symmetry.analyzer import SpacegroupAnalyzer
 from pyxtal.wyckoff_site import atom_site, mol_site, WP_merge
 from pyxtal.molecule import pyxtal_molecule, Orientation, compare_mol_connectivity
-from pyxtal.symmetry import Wyckoff_position, Group
+from pyxtal.symmetry import Wyckoff_position, Group, organized_wyckoffs
 from pyxtal.lattice import Lattice
+from pyxtal.database.element import Element
 
-def write_cif(struc, filename=None, header="", permission='w', sym_num=None, style='mp'):
+# the xyz strings of symmetry operations, keyed by the affine matrix
+_xyz_cache = {}
+
+def get_xyz_string(op):
     """
-    Export the structure in cif format
-    The default setting for _atom_site follows the materials project cif 
+    cached version of op.as_xyz_string()
+
+    Args:
+        op: SymmOp object
+
+    Returns:
+        a string, e.g., `x, y, z`
+    """
+    key = op.affine_matrix.tobytes()
+    xyz = _xyz_cache.get(key)
+    if xyz is None:
+        xyz = op.as_xyz_string()
+        _xyz_cache[key] = xyz
+    return xyz
+
+def get_cif_block(struc, header="", sym_num=None, style='mp'):
+    """
+    Get the `data_` block of a structure in cif format (without the logo)
 
     Args:
         struc: pyxtal structure object
-        filename: path of the structure file 
         header: additional information
-        permission: write('w') or append('a+') to the given file
         sym_num: the number of symmetry operations, None means writing all symops
         style: "icsd" or "mp" (used in pymatgen)
 
+    Returns:
+        a string
     """
     if sym_num is None:
         l_type = struc.group.lattice_type
         symbol = struc.group.symbol
         number = struc.group.number
-        G1 = struc.group.Wyckoff_positions[0]
     else: #P1 symmetry
         l_type = 'triclinic'
         symbol = 'P1'
         number = 1
-        G1 = Group(1).Wyckoff_positions[0]
 
     if hasattr(struc, 'mol_sites'):
         sites = struc.mol_sites
@@ -47,79 +68,97 @@ def write_cif(struc, filename=None, header="", permission='w', sym_num=None, sty
     if number in [7, 14, 15]:
         if hasattr(struc, 'diag') and struc.diag:
             symbol = struc.group.alias 
-            G1.diagonalize_symops()
             change_set = True
     
-    lines = logo
-    lines += 'data_' + header + '\n'
+    lines = ['data_' + header + '\n']
     if hasattr(struc, "energy"):
         if struc.molecular:
             eng = struc.energy/sum(struc.numMols)
         else:
             eng = struc.energy/sum(struc.numIons)
-        lines += '#Energy: {:} eV/cell\n'.format(eng)
+        lines.append('#Energy: {:} eV/cell\n'.format(eng))
 
-    lines += "\n_symmetry_space_group_name_H-M '{:s}'\n".format(symbol)
-    lines += '_symmetry_Int_Tables_number      {:>15d}\n'.format(number)
-    lines += '_symmetry_cell_setting           {:>15s}\n'.format(l_type)
+    lines.append("\n_symmetry_space_group_name_H-M '{:s}'\n".format(symbol))
+    lines.append('_symmetry_Int_Tables_number      {:>15d}\n'.format(number))
+    lines.append('_symmetry_cell_setting           {:>15s}\n'.format(l_type))
 
     a, b, c, alpha, beta, gamma = struc.lattice.get_para(degree=True)
-    lines += '_cell_length_a        {:12.6f}\n'.format(a)
-    lines += '_cell_length_b        {:12.6f}\n'.format(b)
-    lines += '_cell_length_c        {:12.6f}\n'.format(c)
-    lines += '_cell_angle_alpha     {:12.6f}\n'.format(alpha)
-    lines += '_cell_angle_beta      {:12.6f}\n'.format(beta)
-    lines += '_cell_angle_gamma     {:12.6f}\n'.format(gamma)
-
-    lines += '\nloop_\n'
-    lines += ' _symmetry_equiv_pos_site_id\n'
-    lines += ' _symmetry_equiv_pos_as_xyz\n'
-
-    #if not change_set:
+    lines.append('_cell_length_a        {:12.6f}\n'.format(a))
+    lines.append('_cell_length_b        {:12.6f}\n'.format(b))
+    lines.append('_cell_length_c        {:12.6f}\n'.format(c))
+    lines.append('_cell_angle_alpha     {:12.6f}\n'.format(alpha))
+    lines.append('_cell_angle_beta      {:12.6f}\n'.format(beta))
+    lines.append('_cell_angle_gamma     {:12.6f}\n'.format(gamma))
+
+    lines.append('\nloop_\n')
+    lines.append(' _symmetry_equiv_pos_site_id\n')
+    lines.append(' _symmetry_equiv_pos_as_xyz\n')
+
     if change_set:
-        wps = G1
+        # the cached general position in n representation
+        ops = [SymmOp(op) for op in get_wyckoff_tables(number, True)[0]]
     else:
-        wps = sites[0].wp.ops
-    for i, op in enumerate(wps):
-        lines += "{:d} '{:s}'\n".format(i+1, op.as_xyz_string())
-
-    lines += '\nloop_\n'
-    lines += ' _atom_site_label\n'
-    lines += ' _atom_site_type_symbol\n'
-    lines += ' _atom_site_symmetry_multiplicity\n'
+        ops = sites[0].wp.ops
+    for i, op in enumerate(ops):
+        lines.append("{:d} '{:s}'\n".format(i+1, get_xyz_string(op)))
+
+    lines.append('\nloop_\n')
+    lines.append(' _atom_site_label\n')
+    lines.append(' _atom_site_type_symbol\n')
+    lines.append(' _atom_site_symmetry_multiplicity\n')
     if style == 'icsd':
-        lines += ' _atom_site_Wyckoff_symbol\n'
-    lines += ' _atom_site_fract_x\n'
-    lines += ' _atom_site_fract_y\n'
-    lines += ' _atom_site_fract_z\n'
-    lines += ' _atom_site_occupancy\n'
+        lines.append(' _atom_site_Wyckoff_symbol\n')
+    lines.append(' _atom_site_fract_x\n')
+    lines.append(' _atom_site_fract_y\n')
+    lines.append(' _atom_site_fract_z\n')
+    lines.append(' _atom_site_occupancy\n')
 
+    # collect the columns of the atom loop and format them at once
+    all_species = []
+    all_coords = []
+    muls = []
+    letters = []
     for site in sites:
-        mul = site.wp.multiplicity
-        letter = site.wp.letter
         if molecule:
             if sym_num is None:
                 coords, species = site._get_coords_and_species(first=True)
             else:
-                coords = None
-                species = []
-                for id in range(sym_num):
-                    mol = site.get_mol_object(id)
-                    tmp = mol.cart_coords.dot(site.lattice.inv_matrix)
-                    if coords is None:
-                        coords = tmp
-                    else:
-                        coords = np.append(coords, tmp, axis=0)
-                    species.extend([s.value for s in mol.species])
-                #coords, species = site._get_coords_and_species(ids=sym_num)
+                coords, species = site._get_mol_coords(sym_num)
         else:
             coords, species = [site.position], [site.specie]
-        for specie, coord in zip(species, coords):
-            lines += '{:6s} {:6s} {:3d} '.format(specie, specie, mul)
-            if style != 'mp':
-                lines += '{:s} '.format(letter)
-            lines += '{:12.6f}{:12.6f}{:12.6f} 1\n'.format(*coord)
-    lines +='#END\n\n'
+        all_species.extend(species)
+        all_coords.append(coords)
+        muls.extend([site.wp.multiplicity]*len(species))
+        letters.extend([site.wp.letter]*len(species))
+
+    if len(all_species) > 0:
+        coords = np.concatenate(all_coords).tolist()
+        if style != 'mp':
+            fmt = '%-6s %-6s %3d %s %12.6f%12.6f%12.6f 1\n'
+            rows = [(s, s, m, l, x, y, z) for s, m, l, (x, y, z) in zip(all_species, muls, letters, coords)]
+        else:
+            fmt = '%-6s %-6s %3d %12.6f%12.6f%12.6f 1\n'
+            rows = [(s, s, m, x, y, z) for s, m, (x, y, z) in zip(all_species, muls, coords)]
+        lines.append((fmt*len(rows)) % tuple(itertools.chain.from_iterable(rows)))
+    lines.append('#END\n\n')
+
+    return ''.join(lines)
+
+def write_cif(struc, filename=None, header="", permission='w', sym_num=None, style='mp'):
+    """
+    Export the structure in cif format
+    The default setting for _atom_site follows the materials project cif 
+
+    Args:
+        struc: pyxtal structure object
+        filename: path of the structure file 
+        header: additional information
+        permission: write('w') or append('a+') to the given file
+        sym_num: the number of symmetry operations, None means writing all symops
+        style: "icsd" or "mp" (used in pymatgen)
+
+    """
+    lines = logo + get_cif_block(struc, header, sym_num, style)
 
     if filename is None:
         return lines
@@ -128,6 +167,473 @@ def write_cif(struc, filename=None, header="", permission='w', sym_num=None, sty
             f.write(lines)
         return
 
+def open_file(filename, mode='r', compression=None):
+    """
+    open a plain, gzip or zstd compressed text file
+
+    Args:
+        filename: path of the file
+        mode: `r`, `w` or `a`
+        compression: None, `gz` or `zst`, inferred from the extension by default
+
+    Returns:
+        a file object in text mode
+    """
+    if compression is None:
+        if filename.endswith('.gz'):
+            compression = 'gz'
+        elif filename.endswith('.zst'):
+            compression = 'zst'
+
+    if compression == 'gz':
+        import gzip
+        return gzip.open(filename, mode+'t')
+    elif compression == 'zst':
+        import io
+        import zstandard
+        if mode == 'r':
+            f = zstandard.ZstdDecompressor().stream_reader(open(filename, 'rb'))
+        else:
+            f = zstandard.ZstdCompressor().stream_writer(open(filename, mode+'b'))
+        return io.TextIOWrapper(f)
+    elif compression is None:
+        return open(filename, mode, buffering=1<<20)
+    else:
+        raise ValueError("Unsupported compression: {:}".format(compression))
+
+class cif_writer():
+    """
+    Class to stream many structures into one cif file, which keeps a single
+    buffered file handle open and writes the logo only once
+
+    Args:
+        filename: path of the cif file
+        permission: write('w') or append('a')
+        compression: None, `gz` or `zst`, inferred from the extension by default
+        sym_num: the number of symmetry operations, None means writing all symops
+        style: "icsd" or "mp" (used in pymatgen)
+
+    Examples:
+        >>> with cif_writer('my.cif.gz') as f:
+        ...     f.write_all(strucs)
+    """
+    def __init__(self, filename, permission='w', compression=None, sym_num=None, style='mp'):
+        self.filename = filename
+        self.sym_num = sym_num
+        self.style = style
+        self.count = 0
+        self.file = open_file(filename, permission[0], compression)
+        if permission[0] == 'w':
+            self.file.write(logo)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __str__(self):
+        return "\ncif_writer: {:d} structures to {:s}".format(self.count, self.filename)
+
+    def __repr__(self):
+        return str(self)
+
+    def write(self, struc, header=None):
+        """
+        write one structure
+
+        Args:
+            struc: pyxtal structure object
+            header: the name of `data_` block, default is the index of structure
+        """
+        if header is None:
+            header = str(self.count)
+        self.file.write(get_cif_block(struc, header, self.sym_num, self.style))
+        self.count += 1
+
+    def write_all(self, strucs, headers=None):
+        """
+        write an iterable of structures
+
+        Args:
+            strucs: an iterable of pyxtal structure objects
+            headers: an iterable of the names of `data_` blocks (optional)
+        """
+        if headers is None:
+            for struc in strucs:
+                self.write(struc)
+        else:
+            for struc, header in zip(strucs, headers):
+                self.write(struc, header)
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+# the Group objects and the Wyckoff positions, keyed by (number, diag),
+# which are only copied for each structure (see get_wyckoff_positions)
+_wyckoff_objects = {}
+
+def _get_wyckoff_objects(number, diag=False):
+    """
+    get the cached group and Wyckoff positions. The group is shared by both
+    representations, while the Wyckoff positions of the n representation
+    are diagonalized copies
+    """
+    key = (number, diag and number in [7, 14, 15])
+    if key not in _wyckoff_objects:
+        group = _get_wyckoff_objects(number)[0] if key[1] else Group(number)
+        wps = list(group)
+        if key[1]:
+            wps = [copy(wp) for wp in wps]
+            for wp in wps:
+                wp.diagonalize_symops()
+        _wyckoff_objects[key] = (group, wps)
+    return _wyckoff_objects[key]
+
+# the stacked Wyckoff operations, keyed by (number, diag)
+_wyckoff_tables = {}
+
+def get_wyckoff_tables(number, diag=False):
+    """
+    get the cached affine matrices used for Wyckoff assignment
+
+    Args:
+        number: space group number
+        diag: whether or not to use the n representation for P21/c, Pc, C2/c
+
+    Returns:
+        gen_ops: (N, 4, 4) array of the general position
+        first_ops: (W, 4, 4) array of the first operation of each Wyckoff position
+        mults: (W,) array of multiplicities
+    """
+    key = (number, diag and number in [7, 14, 15])
+    if key not in _wyckoff_tables:
+        wps = _get_wyckoff_objects(number, diag)[1]
+        gen_ops = np.array([op.affine_matrix for op in wps[0].ops])
+        first_ops = np.array([wp.ops[0].affine_matrix for wp in wps])
+        mults = np.array([wp.multiplicity for wp in wps])
+        _wyckoff_tables[key] = (gen_ops, first_ops, mults)
+    return _wyckoff_tables[key]
+
+def _copy_wp(wp):
+    """
+    a shallow copy of the Wyckoff position with its own list of operations
+    """
+    wp = copy(wp)
+    wp.ops = list(wp.ops)
+    return wp
+
+def get_wyckoff_positions(number, diag=False):
+    """
+    get a new Group object and the list of Wyckoff positions for one
+    structure, copied from the cached ones. Each
+    structure owns its group, Wyckoff positions and lists of operations,
+    so that changing them (e.g., by diagonalize_symops) does not affect
+    the other structures, while the symmetry data is not parsed again
+
+    Args:
+        number: space group number
+        diag: whether or not to use the n representation for P21/c, Pc, C2/c
+
+    Returns:
+        group: Group object in the standard setting
+        wps: list of Wyckoff_position objects to build the sites
+    """
+    group, wps = _get_wyckoff_objects(number, diag)
+    group = copy(group)
+    group.Wyckoff_positions = [_copy_wp(wp) for wp in group.Wyckoff_positions]
+    group.wyckoffs_organized = organized_wyckoffs(group)
+    if diag and number in [7, 14, 15]:
+        wps = [_copy_wp(wp) for wp in wps]
+    else:
+        wps = group.Wyckoff_positions
+    return group, wps
+
+def _get_wyckoff_points(coords, gen_ops, first_ops, mults, matrix, tol=0.1):
+    """
+    find the Wyckoff position with the lowest multiplicity and its generating
+    point for each point, see get_wyckoff_sites
+
+    Returns:
+        (N,) array of Wyckoff position indices and (N, 3) array of points
+    """
+    n_ops, n_wps = len(gen_ops), len(first_ops)
+    # (A, N, 3) orbits and (A, N, W, 3) projections as stacked matrix products
+    rots = gen_ops[:, :3, :3].transpose(2, 0, 1).reshape([3, -1])
+    orbits = coords.dot(rots).reshape([-1, n_ops, 3]) + gen_ops[:, :3, 3]
+    rots = first_ops[:, :3, :3].transpose(2, 0, 1).reshape([3, -1])
+    projs = orbits.reshape([-1, 3]).dot(rots).reshape([-1, n_ops, n_wps, 3])
+    projs += first_ops[:, :3, 3]
+    diffs = projs - orbits[:, :, None, :]
+    diffs -= np.round(diffs)
+    dists = np.linalg.norm(diffs.reshape([-1, 3]).dot(matrix), axis=1)
+    dists = dists.reshape([-1, n_ops, n_wps])
+    dists = np.where(dists < tol, dists, np.inf)
+
+    # (A, W) => the Wyckoff position with the lowest multiplicity
+    ids = np.arange(len(coords))
+    matched = np.isfinite(dists).any(axis=1)
+    ws = np.where(matched, mults, np.inf).argmin(axis=1)
+    ks = dists[ids, :, ws].argmin(axis=1)
+    pts = projs[ids, ks, ws]
+    pts -= np.floor(pts)
+    return ws, pts
+
+def get_wyckoff_sites(coords, species, number, matrix, diag=False, tol=0.1, size=1<<18):
+    """
+    assign the Wyckoff positions by orbit matching. For each point, the orbit
+    of the general position is projected by the first operation of every
+    Wyckoff position, and the site with the lowest multiplicity whose
+    projection agrees with the orbit is kept. The points that belong to the
+    orbit of an earlier site of the same specie are skipped. The points are
+    processed in chunks to bound the memory
+
+    Args:
+        coords: (N, 3) fractional coordinates
+        species: list of N species
+        number: space group number
+        matrix: 3*3 lattice matrix
+        diag: whether or not to use the n representation for P21/c, Pc, C2/c
+        tol: the cutoff distance in angstrom
+        size: the maximum number of (point, operation, Wyckoff position)
+            entries in one chunk
+
+    Returns:
+        list of (Wyckoff position index, generating point, specie)
+    """
+    gen_ops, first_ops, mults = get_wyckoff_tables(number, diag)
+    coords = np.array(coords, dtype=float).reshape([-1, 3])
+    step = max([1, size // (len(gen_ops)*len(first_ops))])
+
+    results = []
+    orbits_by_specie = {}
+    for i0 in range(0, len(coords), step):
+        ws, pts = _get_wyckoff_points(coords[i0:i0+step], gen_ops, first_ops, mults, matrix, tol)
+        for i, w, pt in zip(range(i0, i0+step), ws, pts):
+            specie = species[i]
+            if specie in orbits_by_specie:
+                diff = orbits_by_specie[specie] - coords[i]
+                diff -= np.round(diff)
+                if np.min(np.linalg.norm(diff.dot(matrix), axis=1)) < tol:
+                    continue
+            results.append((w, pt, specie))
+            orbit = gen_ops[:, :3, :3].dot(pt) + gen_ops[:, :3, 3]
+            if specie in orbits_by_specie:
+                orbit = np.append(orbits_by_specie[specie], orbit, axis=0)
+            orbits_by_specie[specie] = orbit
+    return results
+
+def _get_atom_site(wp, position, specie, diag=False):
+    """
+    make the atom site on the Wyckoff position, which has been diagonalized
+    already in the n representation (see get_wyckoff_positions)
+    """
+    site = atom_site(wp, position, specie)
+    site.diag = diag
+    return site
+
+def _get_pyxtal(group, lattice, sites):
+    """
+    make the pyxtal structure from the group, lattice and atom sites
+    """
+    from pyxtal import pyxtal
+
+    struc = pyxtal()
+    struc.group = group
+    struc.lattice = lattice
+    struc.atom_sites = sites
+    struc.diag = sites[0].diag if len(sites) > 0 else False
+    struc.valid = True
+    struc.factor = 1.0
+    struc.source = 'Seed'
+    struc.dim = 3
+    struc.PBC = [1, 1, 1]
+    struc._get_formula()
+    return struc
+
+def _get_cif_float(value):
+    """
+    convert the cif number, e.g., `5.64(2)`, to float
+    """
+    return float(value.split('(')[0])
+
+# quoted strings or the other non-blank tokens
+_cif_token = re.compile(r"""'[^']*'(?=\s|$)|"[^"]*"(?=\s|$)|\S+""")
+
+def _get_cif_tokens(line):
+    """
+    split a cif line into tokens, and remove the quotes and comments
+    """
+    if "'" not in line and '"' not in line and '#' not in line:
+        return line.split()
+    tokens = []
+    for token in _cif_token.findall(line):
+        if token[0] == '#':
+            break
+        if token[0] in ['"', "'"]:
+            token = token[1:-1]
+        tokens.append(token)
+    return tokens
+
+def read_cif_blocks(f):
+    """
+    tokenize a (multi-block) cif file in one pass
+
+    Args:
+        f: file object or iterable of lines
+
+    Yields:
+        (name, data) for each `data_` block, where data maps each tag to a
+        string or to a list of strings for the looped tags
+    """
+    name, data = None, None
+    loop_tags = []
+    loop_header = False
+    loop_id = 0
+    tag = None
+    text = None
+    for line in f:
+        literal = False
+        if text is not None:
+            # multi-line text field between two `;`
+            if line.startswith(';'):
+                tokens = [''.join(text).strip()]
+                text = None
+                literal = True
+            else:
+                text.append(line)
+                continue
+        elif line.startswith(';'):
+            text = [line[1:]]
+            continue
+        elif line.startswith('data_'):
+            if data is not None:
+                yield name, data
+            name, data = line.strip()[5:], {}
+            loop_tags, loop_header, tag = [], False, None
+            continue
+        else:
+            tokens = _get_cif_tokens(line)
+
+        if data is None:
+            continue
+        for token in tokens:
+            if token.startswith('_') and not literal:
+                if loop_header:
+                    loop_tags.append(token)
+                    data[token] = []
+                else:
+                    loop_tags = []
+                    tag = token
+            elif token.lower() == 'loop_':
+                loop_tags, loop_header, loop_id, tag = [], True, 0, None
+            elif tag is not None:
+                data[tag] = token
+                tag = None
+            elif len(loop_tags) > 0:
+                loop_header = False
+                data[loop_tags[loop_id % len(loop_tags)]].append(token)
+                loop_id += 1
+    if data is not None:
+        yield name, data
+
+def _get_op_set(ops):
+    """
+    the set of (rotation, translation modulo lattice translations) of the
+    affine matrices, where the translations are rounded to 1/24
+    """
+    ops = np.array(ops)
+    rots = np.round(ops[:, :3, :3]).astype(int).reshape([-1, 9])
+    trans = np.round(ops[:, :3, 3]*24).astype(int) % 24
+    return set([(rot.tobytes(), tran.tobytes()) for rot, tran in zip(rots, trans)])
+
+# whether the symmetry operations of cif are in the setting of pyxtal,
+# keyed by (number, diag, xyz strings)
+_cif_symops = {}
+
+def _check_cif_symops(data, number, diag=False):
+    """
+    check the symmetry operations of the cif block against the general
+    position of the group (or the operations of a Wyckoff position, which
+    pyxtal writes for the first site), so that the other settings (e.g.,
+    Pbnm, origin choice 1 or rhombohedral axes) are not read silently
+    """
+    for key in ['_symmetry_equiv_pos_as_xyz', '_space_group_symop_operation_xyz']:
+        if key in data:
+            xyzs = data[key]
+            break
+    else:
+        return
+    if isinstance(xyzs, str):
+        xyzs = [xyzs]
+    key = (number, diag and number in [7, 14, 15], tuple(xyzs))
+    if key not in _cif_symops:
+        ops = _get_op_set([SymmOp.from_xyz_string(xyz).affine_matrix for xyz in xyzs])
+        wps = _get_wyckoff_objects(number, diag)[1]
+        _cif_symops[key] = any([_get_op_set([op.affine_matrix for op in wp.ops]) == ops
+                                for wp in wps if len(wp.ops) == len(xyzs)])
+    if not _cif_symops[key]:
+        msg = "The symmetry operations in cif are not in the standard setting "
+        msg += "of space group {:d}".format(number)
+        raise ValueError(msg)
+
+def _get_cif_structure(data, tol=0.1):
+    """
+    get the space group, lattice and atom sites from the tokenized cif block
+    """
+    number = None
+    for key in ['_symmetry_Int_Tables_number', '_space_group_IT_number']:
+        if key in data:
+            number = int(data[key])
+            break
+    if number is None:
+        raise ValueError("Cannot find the space group number in cif")
+
+    symbol = ''
+    for key in ['_symmetry_space_group_name_H-M', '_space_group_name_H-M_alt']:
+        if key in data:
+            symbol = data[key].replace(' ', '')
+            break
+    diag = symbol in ["Pn", "P21/n", "C2/n", "P1n1", "P121/n1", "C12/n1"]
+    _check_cif_symops(data, number, diag)
+
+    group, wps = get_wyckoff_positions(number, diag)
+    lat_type = data.get('_symmetry_cell_setting', group.lattice_type)
+    paras = [_get_cif_float(data['_cell_' + key]) for key in
+             ['length_a', 'length_b', 'length_c', 'angle_alpha', 'angle_beta', 'angle_gamma']]
+    lattice = Lattice.from_para(*paras, lat_type)
+
+    if '_atom_site_type_symbol' in data:
+        species = [re.match('[A-Z][a-z]?', s).group() for s in data['_atom_site_type_symbol']]
+    else:
+        species = [re.match('[A-Z][a-z]?', s).group() for s in data['_atom_site_label']]
+    coords = np.array([[_get_cif_float(x) for x in data['_atom_site_fract_' + key]] for key in 'xyz']).T
+
+    sites = []
+    for w, pt, specie in get_wyckoff_sites(coords, species, number, lattice.matrix, diag, tol):
+        sites.append(_get_atom_site(wps[w], pt, specie, diag))
+    return group, lattice, sites
+
+def read_cifs(filename, tol=0.1):
+    """
+    read the (multi-block) cif file lazily, mainly for pyxtal cif output.
+    Only the atomic crystals in the standard setting are supported, and
+    ValueError is raised for the blocks in other settings.
+    Each structure has its own Group and Wyckoff_position objects, which
+    are copied from the cached ones (see get_wyckoff_positions)
+
+    Args:
+        filename: path of the cif file, can be compressed (see open_file)
+        tol: the cutoff distance in angstrom to assign the Wyckoff positions
+
+    Yields:
+        pyxtal structures
+    """
+    with open_file(filename) as f:
+        for name, data in read_cif_blocks(f):
+            yield _get_pyxtal(*_get_cif_structure(data, tol))
+
 def read_cif(filename):
     """
     read the cif, mainly for pyxtal cif output
@@ -137,54 +643,183 @@ def read_cif(filename):
         filename: path of the structure file 
 
     Return:
-        pyxtal structure
-    """
-    species = []
-    coords = []
-    with open(filename, 'r') as f:
-        lines = f.readlines()
-        for i, line in enumerate(lines):
-            if line.startswith('_symmetry_Int_Tables_number'):
-                sg = int(line.split()[-1])
-            elif line.startswith('_cell_length_a'):
-                a = float(lines[i].split()[-1])
-                b = float(lines[i+1].split()[-1])
-                c = float(lines[i+2].split()[-1])
-                alpha = float(lines[i+3].split()[-1])
-                beta = float(lines[i+4].split()[-1])
-                gamma = float(lines[i+5].split()[-1])
-            elif line.startswith('_symmetry_cell_setting'):
-                lat_type = line.split()[-1]
-            elif line.startswith('_symmetry_space_group_name_H-M '):
-                symbol = line.split()[-1]
-                if eval(symbol) in ["Pn", "P21/n", "C2/n"]:
-                    diag = True
+        lattice and the list of atom sites of the first block
+    """
+    with open_file(filename) as f:
+        for name, data in read_cif_blocks(f):
+            _, lattice, sites = _get_cif_structure(data)
+            return lattice, sites
+
+
+# the columns of the binary archive, see archive_writer
+_archive_struc = np.dtype([('group', '<u1'), ('diag', '<u1'), ('nsite', '<u2'), ('lattice', '<f4', (6,))])
+_archive_site = np.dtype([('wp', '<u1'), ('z', '<u1'), ('xyz', '<f4', (3,))])
+
+class archive_writer():
+    """
+    Class to store many atomic structures in a compact binary file. Each
+    structure is encoded by the space group number, the lattice parameters
+    and the Wyckoff index, atomic number and generating coordinate of each
+    site (28 bytes plus 14 bytes per site in single precision). The
+    structures are buffered and appended as chunks, where each chunk
+    consists of two npy arrays (structures and sites). See archive_reader
+
+    Args:
+        filename: path of the archive file
+        permission: write('w') or append('a')
+        chunk: the number of structures per chunk
+
+    Examples:
+        >>> with archive_writer('my.pxa') as f:
+        ...     f.write_all(strucs)
+    """
+    def __init__(self, filename, permission='w', chunk=10000):
+        self.filename = filename
+        self.chunk = chunk
+        self.count = 0
+        self.strucs = []
+        self.sites = []
+        self.file = open(filename, permission[0]+'b')
+        self._z = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __str__(self):
+        return "\narchive_writer: {:d} structures to {:s}".format(self.count, self.filename)
+
+    def __repr__(self):
+        return str(self)
+
+    def write(self, struc):
+        """
+        write one structure
+
+        Args:
+            struc: pyxtal structure object
+        """
+        if struc.molecular:
+            raise NotImplementedError("Does not support molecular crystals for now")
+        diag = struc.diag and struc.group.number in [7, 14, 15]
+        paras = struc.lattice.get_para(degree=True)
+        self.strucs.append((struc.group.number, diag, len(struc.atom_sites), paras))
+        for site in struc.atom_sites:
+            if site.specie not in self._z:
+                self._z[site.specie] = Element(site.specie).z
+            self.sites.append((site.wp.index, self._z[site.specie], site.position))
+        self.count += 1
+        if len(self.strucs) >= self.chunk:
+            self.flush()
+
+    def write_all(self, strucs):
+        """
+        write an iterable of structures
+
+        Args:
+            strucs: an iterable of pyxtal structure objects
+        """
+        for struc in strucs:
+            self.write(struc)
+
+    def flush(self):
+        """
+        append the buffered structures as a new chunk
+        """
+        if len(self.strucs) > 0:
+            np.lib.format.write_array(self.file, np.array(self.strucs, dtype=_archive_struc))
+            np.lib.format.write_array(self.file, np.array(self.sites, dtype=_archive_site))
+            self.strucs = []
+            self.sites = []
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+class archive_reader():
+    """
+    Class to read the binary archive from archive_writer with random access.
+    The chunks are memory-mapped, and the structures are only decoded when
+    they are accessed, each on its own Group and Wyckoff_position objects
+
+    Args:
+        filename: path of the archive file
+
+    Examples:
+        >>> archive = archive_reader('my.pxa')
+        >>> struc = archive[10]
+        >>> strucs = [archive[i] for i in np.where(archive.groups == 225)[0]]
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.chunks = []
+        with open(filename, 'rb') as f:
+            size = f.seek(0, 2)
+            f.seek(0)
+            arrays = []
+            while f.tell() < size:
+                version = np.lib.format.read_magic(f)
+                if version == (1, 0):
+                    shape, _, dtype = np.lib.format.read_array_header_1_0(f)
                 else:
-                    diag = False
-
-            elif line.find('_atom_site') >= 0:
-                s = i
-                while True:
-                    s += 1
-                    if lines[s].find('_atom_site') >= 0:
-                        pass
-                    elif len(lines[s].split()) <= 3:
-                        break
-                    else:
-                        tmp = lines[s].split()
-                        pos = [float(tmp[-4]), float(tmp[-3]), float(tmp[-2])]
-                        species.append(tmp[0])
-                        coords.append(pos)
-                break
-
-    wp0 = Group(sg)[0]
-    lattice = Lattice.from_para(a, b, c, alpha, beta, gamma, lat_type)
-    sites = []
-    for specie, coord in zip(species, coords):
-        pt, wp, _ = WP_merge(coord, lattice.matrix, wp0, tol=0.1)
-        sites.append(atom_site(wp, pt, specie, diag))
-    return lattice, sites
+                    shape, _, dtype = np.lib.format.read_array_header_2_0(f)
+                offset = f.tell()
+                if shape[0] > 0:
+                    arrays.append(np.memmap(filename, dtype=dtype, mode='r', offset=offset, shape=shape))
+                else:
+                    arrays.append(np.zeros(shape, dtype=dtype))
+                f.seek(offset + int(np.prod(shape))*dtype.itemsize)
+        for strucs, sites in zip(arrays[::2], arrays[1::2]):
+            starts = np.zeros(len(strucs)+1, dtype=int)
+            starts[1:] = np.cumsum(strucs['nsite'])
+            self.chunks.append((strucs, sites, starts))
+        self.ends = np.cumsum([len(chunk[0]) for chunk in self.chunks], dtype=int)
+
+    def __len__(self):
+        return int(self.ends[-1]) if len(self.ends) > 0 else 0
+
+    def __str__(self):
+        return "\narchive_reader: {:d} structures in {:d} chunks from {:s}".format(len(self), len(self.chunks), self.filename)
 
+    def __repr__(self):
+        return str(self)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if i < 0 or i >= len(self):
+            raise IndexError("archive index out of range")
+        id = np.searchsorted(self.ends, i, side='right')
+        strucs, sites, starts = self.chunks[id]
+        j = i - (self.ends[id-1] if id > 0 else 0)
+        return self._get_pyxtal(strucs[j], sites[starts[j]:starts[j+1]])
+
+    @property
+    def groups(self):
+        """
+        the space group numbers of all structures
+        """
+        return np.concatenate([chunk[0]['group'] for chunk in self.chunks]).astype(int)
+
+    def _get_pyxtal(self, row, sites):
+        """
+        decode one structure
+        """
+        number, diag = int(row['group']), bool(row['diag'])
+        group, wps = get_wyckoff_positions(number, diag)
+        lattice = Lattice.from_para(*row['lattice'].astype(float), ltype=group.lattice_type)
+        atom_sites = []
+        for wp, z, xyz in zip(sites['wp'], sites['z'], sites['xyz'].astype(float)):
+            atom_sites.append(_get_atom_site(wps[int(wp)], xyz, int(z), diag))
+        return _get_pyxtal(group, lattice, atom_sites)
 
 class structure_from_ext():
     
@@ -358,65 +993,95 @@ def search_molecule_in_crystal(struc, tol=0.2, keep_order=False, absolute=True):
 
     Args:
         struc: Pymatgen Structure
-        keep_order: whether or not use the orignal sequence
+        keep_order: whether or not use the orignal sequence (the atoms
+            are always returned in the order of the structure)
         absolute: whether or not output absolute coordindates
 
     Returns:
         coords: fractional coordinates
         numbers: atomic numbers
     """
-    def check_one_layer(struc, sites0, visited):
-        new_members = []
-        for site0 in sites0:
-            sites_add, visited = check_one_site(struc, site0, visited)
-            new_members.extend(sites_add)
-        return new_members, visited
-    
-    def check_one_site(struc, site0, visited):
-        neigh_sites = struc.get_neighbors(site0, 3.0)
-        ids = [m.index for m in visited]
-        sites_add = []
-        ids_add = []
-
-        for site1 in neigh_sites:
-            if (site1.index not in ids+ids_add):
-                if CovalentBond.is_bonded(site0, site1, tol):
-                    sites_add.append(site1)
-                    ids_add.append(site1.index)
-        if len(sites_add) > 0:
-            visited.extend(sites_add)
-
-        return sites_add, visited
-
-    first_site = struc.sites[0]
-    first_site.index = 0 #assign the index
-    visited = [first_site] 
-    ids = [0]
-
-    n_iter, max_iter = 0, len(struc)
-    while n_iter < max_iter:
-        if n_iter == 0:
-            new_sites, visited = check_one_site(struc, first_site, visited)
-        else:
-            new_sites, visited = check_one_layer(struc, new_sites, visited)
-        n_iter += 1
-        if len(new_sites)==0:
-            break
-    
-    coords = [s.coords for s in visited]
-    coords = np.array(coords)
-    numbers = [s.specie.number for s in visited]
-    
-    if keep_order:
-        ids = [s.index for s in visited]
-        seq = np.argsort(ids)
-        coords = coords[seq]
-        numbers = numbers[seq]
+    mol = search_molecules_in_crystal(struc, tol, once=True)[0]
+    coords = mol.cart_coords
+    numbers = mol.atomic_numbers
 
     if not absolute:
         coords = coords.dot(struc.lattice.inv_matrix)
     return coords, numbers
 
+def search_molecules_in_crystal(struc, tol=0.2, once=False):
+    """
+    Find all molecules in a Pymatgen crystal structure. The bonds are
+    obtained from a single periodic neighbor list and the molecules are
+    labelled by union-find, keeping track of the periodic images so that
+    each molecule is returned as a whole.
+
+    Args:
+        struc: Pymatgen Structure
+        tol: the relative tolerance on the typical bond lengths
+        once: whether or not to only return the molecule of the first atom
+
+    Returns:
+        a list of Pymatgen Molecules (absolute coordinates), sorted by the
+        index of their first atom. Each molecule is unwrapped around
+        the original position of its first atom.
+    """
+    from pyxtal.molecule import get_bond_cutoffs
+
+    names = [site.specie.symbol for site in struc.sites]
+    elements, ids = np.unique(names, return_inverse=True)
+    cutoffs = get_bond_cutoffs(elements, tol, scaled=False)
+
+    # one neighbor list for the whole structure
+    if cutoffs.max() > 0:
+        centers, points, images, dists = struc.get_neighbor_list(cutoffs.max())
+        bonded = (centers < points) & (dists < cutoffs[ids[centers], ids[points]])
+        centers, points, images = centers[bonded], points[bonded], images[bonded]
+    else:
+        centers, points, images = [], [], []
+
+    # union-find, shifts[i] is the lattice translation of atom i in the
+    # frame of parents[i]
+    parents = np.arange(len(struc))
+    shifts = np.zeros([len(struc), 3])
+
+    def find(i):
+        shift = np.zeros(3)
+        path = []
+        while parents[i] != i:
+            path.append(i)
+            shift += shifts[i]
+            i = parents[i]
+        # path compression
+        acc = shift.copy()
+        for j in path:
+            acc_j = acc.copy()
+            acc -= shifts[j]
+            parents[j], shifts[j] = i, acc_j
+        return i, shift
+
+    for i, j, image in zip(centers, points, images):
+        root_i, shift_i = find(i)
+        root_j, shift_j = find(j)
+        if root_i != root_j:
+            # atom j + image is bonded to atom i
+            parents[root_j] = root_i
+            shifts[root_j] = shift_i + image - shift_j
+
+    roots, frames = zip(*[find(i) for i in range(len(struc))])
+    roots, frames = np.array(roots), np.array(frames)
+
+    molecules = []
+    frac_coords = struc.frac_coords
+    for root in roots[np.sort(np.unique(roots, return_index=True)[1])]:
+        members = np.where(roots == root)[0]
+        coords = frac_coords[members] + frames[members] - frames[members[0]]
+        coords = coords.dot(struc.lattice.matrix)
+        molecules.append(Molecule([names[m] for m in members], coords))
+        if once:
+            break
+    return molecules
+
 #seed = structure_from_cif("254385.cif", "1.xyz")
 #if seed.match():
 #    print(seed.pmg_struc)
@@ -4,7 +4,7 @@ import random
 
 # PyXtal imports
 from pyxtal.msg import printx
-from pyxtal.operations import angle, create_matrix
+from pyxtal.operations import angle, create_matrix, get_reduced_matrix
 from pyxtal.constants import deg, rad
 
 class Lattice:
@@ -72,6 +72,7 @@ class Lattice:
         self.dim = sum(PBC)
         self.kwargs = {}
         self.random = True
+        self._buffer = None
         # Set optional values
         self.allow_volume_reset = True
         for key, value in kwargs.items():
@@ -211,6 +212,18 @@ class Lattice:
             return self, np.eye(3), opt
 
 
+    def get_reduced(self):
+        """
+        Reduce the lattice vectors with the LLL algorithm (see
+        operations.get_reduced_matrix)
+
+        Returns:
+            the reduced Lattice object and the integer transformation
+            matrix tran, such that reduced.matrix = tran.dot(self.matrix)
+        """
+        cell, tran = get_reduced_matrix(self.matrix)
+        return Lattice.from_matrix(cell, reset=False), tran
+
     def mutate(self, degree=0.20, frozen=False):
         """
         mutate the lattice object
@@ -255,9 +268,15 @@ class Lattice:
             raise ValueError("ltype {:s} is not supported".format(ltype))
         return lat
 
+    def __getstate__(self):
+        # copies should not replay the same random lattices
+        state = self.__dict__.copy()
+        state["_buffer"] = None
+        return state
+
     def generate_para(self):
         if self.dim == 3:
-            return generate_lattice(self.ltype, self.volume, **self.kwargs)
+            return self._generate_para_from_buffer()
         elif self.dim == 2:
             return generate_lattice_2D(self.ltype, self.volume, **self.kwargs)
         elif self.dim == 1:
@@ -265,6 +284,46 @@ class Lattice:
         elif self.dim == 0:
             return generate_lattice_0D(self.ltype, self.volume, **self.kwargs)
 
+    def _generate_para_from_buffer(self, N=100):
+        """
+        Draw the next lattice parameters from an internal buffer of
+        unit-volume candidates, which is refilled by one vectorized call
+        to sample_lattice_paras when exhausted. The candidates are scaled
+        to the current volume and checked all at once, and the accepted
+        ones are kept until the volume changes.
+        """
+        for i in range(2):
+            buf = self._buffer
+            if buf is None or buf["ltype"] != self.ltype or len(buf["units"]) == 0:
+                units = sample_lattice_paras(self.ltype, N)
+                buf = {"ltype": self.ltype, "units": units, "volume": None, "start": 0}
+                self._buffer = buf
+
+            if buf["volume"] != self.volume:
+                # drop the candidates which have been consumed
+                buf["units"] = buf["units"][buf["start"]:]
+                buf["start"] = 0
+                buf["volume"] = self.volume
+                paras = buf["units"].copy()
+                paras[:, :3] *= np.cbrt(self.volume)
+                ids = np.where(check_lattice_paras(paras, **self.kwargs))[0]
+                buf["paras"], buf["ids"] = paras, list(ids[::-1])
+
+            if len(buf["ids"]) > 0:
+                k = buf["ids"].pop()
+                buf["start"] = k + 1
+                return buf["paras"][k]
+            self._buffer = None
+
+        printx(
+            "Could not generate lattice after "
+            + str(2 * N)
+            + " attempts for volume "
+            + str(self.volume),
+            priority=2,
+        )
+        return
+
     def generate_matrix(self):
         """
         Generates a 3x3 matrix for the lattice based on the lattice type and volume
@@ -323,12 +382,12 @@ class Lattice:
 
     def reset_matrix(self):
         if self.random:
-            for i in range(3):
-                m = self.generate_matrix()
-                if m is not None:
-                    self.matrix = m
-                    self.inv_matrix = np.linalg.inv(m)
-                    [a, b, c, alpha, beta, gamma] = matrix2para(self.matrix)
+            for i in range(30):
+                para = self.generate_para()
+                if para is not None:
+                    self.matrix = para2matrix(para)
+                    self.inv_matrix = np.linalg.inv(self.matrix)
+                    [a, b, c, alpha, beta, gamma] = para
                     self.a = a
                     self.b = b
                     self.c = c
@@ -336,6 +395,8 @@ class Lattice:
                     self.beta = beta
                     self.gamma = gamma
                     break
+            else:
+                printx("Error: Could not generate lattice matrix.", priority=1)
         else:
             # a small utility to convert the cell shape
             para = matrix2para(self.matrix)
@@ -701,128 +762,13 @@ def generate_lattice(
         a 3x3 matrix representing the lattice vectors of the unit cell. If
         generation fails, outputs a warning message and returns empty
     """
-    maxangle = np.pi - minangle
-    for n in range(maxattempts):
-        # Triclinic
-        # if sg <= 2:
-        if ltype == "triclinic":
-            # Derive lattice constants from a random matrix
-            mat = random_shear_matrix(width=0.2)
-            a, b, c, alpha, beta, gamma = matrix2para(mat)
-            x = np.sqrt(
-                1
-                - np.cos(alpha) ** 2
-                - np.cos(beta) ** 2
-                - np.cos(gamma) ** 2
-                + 2 * (np.cos(alpha) * np.cos(beta) * np.cos(gamma))
-            )
-            vec = random_vector()
-            abc = volume / x
-            xyz = vec[0] * vec[1] * vec[2]
-            a = vec[0] * np.cbrt(abc) / np.cbrt(xyz)
-            b = vec[1] * np.cbrt(abc) / np.cbrt(xyz)
-            c = vec[2] * np.cbrt(abc) / np.cbrt(xyz)
-        # Monoclinic
-        elif ltype in ["monoclinic", "Monoclinic"]:
-            alpha, gamma = np.pi / 2, np.pi / 2
-            beta = gaussian(minangle, maxangle)
-            x = np.sin(beta)
-            vec = random_vector()
-            xyz = vec[0] * vec[1] * vec[2]
-            abc = volume / x
-            a = vec[0] * np.cbrt(abc) / np.cbrt(xyz)
-            b = vec[1] * np.cbrt(abc) / np.cbrt(xyz)
-            c = vec[2] * np.cbrt(abc) / np.cbrt(xyz)
-        # Orthorhombic
-        # elif sg <= 74:
-        elif ltype in ["orthorhombic", "Orthorhombic"]:
-            alpha, beta, gamma = np.pi / 2, np.pi / 2, np.pi / 2
-            x = 1
-            vec = random_vector()
-            xyz = vec[0] * vec[1] * vec[2]
-            abc = volume / x
-            a = vec[0] * np.cbrt(abc) / np.cbrt(xyz)
-            b = vec[1] * np.cbrt(abc) / np.cbrt(xyz)
-            c = vec[2] * np.cbrt(abc) / np.cbrt(xyz)
-        # Tetragonal
-        # elif sg <= 142:
-        elif ltype in ["tetragonal", "Tetragonal"]:
-            alpha, beta, gamma = np.pi / 2, np.pi / 2, np.pi / 2
-            x = 1
-            vec = random_vector()
-            c = vec[2] / (vec[0] * vec[1]) * np.cbrt(volume / x)
-            a = b = np.sqrt((volume / x) / c)
-        # Trigonal/Rhombohedral/Hexagonal
-        # elif sg <= 194:
-        elif ltype in ["hexagonal", "trigonal", "rhombohedral"]:
-            alpha, beta, gamma = np.pi / 2, np.pi / 2, np.pi / 3 * 2
-            x = np.sqrt(3.0) / 2.0
-            vec = random_vector()
-            c = vec[2] / (vec[0] * vec[1]) * np.cbrt(volume / x)
-            a = b = np.sqrt((volume / x) / c)
-        # Cubic
-        # else:
-        elif ltype in ["cubic", "Cubic"]:
-            alpha, beta, gamma = np.pi / 2, np.pi / 2, np.pi / 2
-            s = (volume) ** (1.0 / 3.0)
-            a, b, c = s, s, s
-        # Check that lattice meets requirements
-        maxvec = (a * b * c) / (minvec ** 2)
-
-        # Define limits on cell dimensions
-        if "min_l" not in kwargs:
-            min_l = minvec
-        else:
-            min_l = kwargs["min_l"]
-        if "mid_l" not in kwargs:
-            mid_l = min_l
-        else:
-            mid_l = kwargs["mid_l"]
-        if "max_l" not in kwargs:
-            max_l = mid_l
-        else:
-            max_l = kwargs["max_l"]
-        l_min = min(a, b, c)
-        l_max = max(a, b, c)
-        for x in (a, b, c):
-            if x <= l_max and x >= l_min:
-                l_mid = x
-        if not (l_min >= min_l and l_mid >= mid_l and l_max >= max_l):
-            continue
-
-        if minvec < maxvec:
-            # Check minimum Euclidean distances
-            smallvec = min(
-                a * np.cos(max(beta, gamma)),
-                b * np.cos(max(alpha, gamma)),
-                c * np.cos(max(alpha, beta)),
-            )
-            if (
-                a > minvec
-                and b > minvec
-                and c > minvec
-                and a < maxvec
-                and b < maxvec
-                and c < maxvec
-                and smallvec < minvec
-                and alpha > minangle
-                and beta > minangle
-                and gamma > minangle
-                and alpha < maxangle
-                and beta < maxangle
-                and gamma < maxangle
-                and a / b < max_ratio
-                and a / c < max_ratio
-                and b / c < max_ratio
-                and b / a < max_ratio
-                and c / a < max_ratio
-                and c / b < max_ratio
-            ):
-                return np.array([a, b, c, alpha, beta, gamma])
+    paras = generate_lattices(ltype, volume, maxattempts, minvec, minangle, max_ratio, **kwargs)
+    if len(paras) > 0:
+        return paras[0]
     # If maxattempts tries have been made without success
     printx(
         "Could not generate lattice after "
-        + str(n + 1)
+        + str(maxattempts)
         + " attempts for volume "
         + str(volume),
         priority=2,
@@ -830,6 +776,137 @@ def generate_lattice(
     return
 
 
+def generate_lattices(
+    ltype,
+    volume,
+    N=100,
+    minvec=1.2,
+    minangle=np.pi / 6,
+    max_ratio=10.0,
+    **kwargs
+):
+    """
+    Vectorized version of generate_lattice. Draws N candidate parameter sets
+    in one call and applies all the constraints as masks.
+
+    Args:
+        ltype: the lattice type
+        volume: volume of the conventional unit cell
+        N: the number of candidates
+        minvec: minimum allowed lattice vector length (among a, b, and c)
+        minangle: minimum allowed lattice angle (among alpha, beta, and gamma)
+        max_ratio: largest allowed ratio of two lattice vector lengths
+        kwargs: 'min_l', 'mid_l' and 'max_l' (see generate_lattice)
+
+    Returns:
+        a (M, 6) array of the accepted [a, b, c, alpha, beta, gamma], M <= N
+    """
+    paras = sample_lattice_paras(ltype, N, minangle)
+    paras[:, :3] *= np.cbrt(volume)
+    return paras[check_lattice_paras(paras, minvec, minangle, max_ratio, **kwargs)]
+
+
+def sample_lattice_paras(ltype, N=100, minangle=np.pi / 6):
+    """
+    Draw N random sets of lattice parameters with unit volume. The lengths
+    for a given volume are obtained by multiplying with its cubic root.
+
+    Args:
+        ltype: the lattice type
+        N: the number of candidates
+        minangle: minimum allowed lattice angle (for the monoclinic beta)
+
+    Returns:
+        a (M, 6) array of [a, b, c, alpha, beta, gamma], M <= N
+    """
+    maxangle = np.pi - minangle
+    paras = np.zeros([N, 6])
+    paras[:, 3:] = np.pi / 2
+    vec = np.exp(np.random.normal(scale=0.35, size=[N, 3]))
+    xyz = np.prod(vec, axis=1)
+
+    if ltype == "triclinic":
+        # Derive lattice angles from random shear matrices
+        a, b, c = np.random.normal(scale=0.2, size=[3, N])
+        ones = np.ones(N)
+        mat = np.stack([np.stack([ones, a, b], axis=1),
+                        np.stack([a, ones, c], axis=1),
+                        np.stack([b, c, ones], axis=1)], axis=1)
+        lengths = np.linalg.norm(mat, axis=2)
+        for i, (j, k) in enumerate([(1, 2), (0, 2), (0, 1)]):
+            cos = np.sum(mat[:, j] * mat[:, k], axis=1) / (lengths[:, j] * lengths[:, k])
+            paras[:, 3 + i] = np.arccos(np.clip(cos, -1, 1))
+        cos = np.cos(paras[:, 3:])
+        x = np.sqrt(1 - np.sum(cos ** 2, axis=1) + 2 * np.prod(cos, axis=1))
+        paras[:, :3] = vec / np.cbrt(xyz * x)[:, None]
+        paras = paras[np.linalg.det(mat) != 0]
+
+    elif ltype in ["monoclinic", "Monoclinic"]:
+        # Gaussian distribution of beta between minangle and maxangle
+        beta = np.random.normal(loc=np.pi / 2, scale=(maxangle - minangle) / 6, size=N)
+        paras[:, 4] = beta
+        paras[:, :3] = vec / np.cbrt(xyz * np.sin(beta))[:, None]
+        paras = paras[(beta > minangle) & (beta < maxangle)]
+
+    elif ltype in ["orthorhombic", "Orthorhombic"]:
+        paras[:, :3] = vec / np.cbrt(xyz)[:, None]
+
+    elif ltype in ["tetragonal", "Tetragonal"]:
+        paras[:, 2] = vec[:, 2] / (vec[:, 0] * vec[:, 1])
+        paras[:, 0] = paras[:, 1] = np.sqrt(1 / paras[:, 2])
+
+    elif ltype in ["hexagonal", "trigonal", "rhombohedral"]:
+        paras[:, 5] = np.pi / 3 * 2
+        x = np.sqrt(3.0) / 2.0
+        paras[:, 2] = vec[:, 2] / (vec[:, 0] * vec[:, 1]) * np.cbrt(1 / x)
+        paras[:, 0] = paras[:, 1] = np.sqrt((1 / x) / paras[:, 2])
+
+    elif ltype in ["cubic", "Cubic"]:
+        paras[:, :3] = 1.0
+
+    return paras
+
+
+def check_lattice_paras(paras, minvec=1.2, minangle=np.pi / 6, max_ratio=10.0, **kwargs):
+    """
+    Check the constraints of generate_lattice for a batch of lattice parameters
+
+    Args:
+        paras: a (N, 6) array of [a, b, c, alpha, beta, gamma]
+        minvec: minimum allowed lattice vector length (among a, b, and c)
+        minangle: minimum allowed lattice angle (among alpha, beta, and gamma)
+        max_ratio: largest allowed ratio of two lattice vector lengths
+        kwargs: 'min_l', 'mid_l' and 'max_l' (see generate_lattice)
+
+    Returns:
+        a (N,) boolean array, True if the lattice meets the requirements
+    """
+    maxangle = np.pi - minangle
+    abc, angles = paras[:, :3], paras[:, 3:]
+    maxvec = np.prod(abc, axis=1) / (minvec ** 2)
+
+    # Define limits on cell dimensions
+    min_l = kwargs.get("min_l", minvec)
+    mid_l = kwargs.get("mid_l", min_l)
+    max_l = kwargs.get("max_l", mid_l)
+    l_sorted = np.sort(abc, axis=1)
+    mask = (l_sorted[:, 0] >= min_l) & (l_sorted[:, 1] >= mid_l) & (l_sorted[:, 2] >= max_l)
+    mask &= minvec < maxvec
+
+    # Check minimum Euclidean distances
+    alpha, beta, gamma = angles.T
+    smallvec = np.min([
+        abc[:, 0] * np.cos(np.maximum(beta, gamma)),
+        abc[:, 1] * np.cos(np.maximum(alpha, gamma)),
+        abc[:, 2] * np.cos(np.maximum(alpha, beta)),
+    ], axis=0)
+    mask &= (abc > minvec).all(axis=1) & (abc < maxvec[:, None]).all(axis=1)
+    mask &= smallvec < minvec
+    mask &= (angles > minangle).all(axis=1) & (angles < maxangle).all(axis=1)
+    mask &= abc.max(axis=1) / abc.min(axis=1) < max_ratio
+    return mask
+
+
 def generate_lattice_2D(
     ltype,
     volume,
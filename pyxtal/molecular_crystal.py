@@ -2,6 +2,7 @@
 import random
 import numpy as np
 from copy import deepcopy
+from scipy.spatial.transform import Rotation
 
 # PyXtal imports
 from pyxtal.msg import printx
@@ -142,7 +143,7 @@ class molecular_crystal:
 
         self.molecules = []  # A pyxtal_molecule objects,
         for mol in molecules:
-            self.molecules.append(pyxtal_molecule(mol, self.tol_matrix))
+            self.molecules.append(pyxtal_molecule(mol, tm=self.tol_matrix))
 
         self.sites = {}
         for i, mol in enumerate(self.molecules):
@@ -597,44 +598,44 @@ class molecular_crystal:
         # Check distances within the WP
         if ms0.check_distances():
             return ms0
-        else:
-            # Maximize the smallest distance for the general
-            # positions if needed
-            if len(pyxtal_mol.mol) > 1 and ori.degrees > 0:
-                # bisection method
-                def fun_dist(angle, ori, mo, pt):
-                    ori0 = ori.copy()
-                    ori.change_orientation(angle)
-                    ms0 = mol_site(
-                        mo,
-                        pt,
-                        ori,
-                        wp,
-                        self.lattice,
-                        self.diag,
-                    )
-                    d = ms0.compute_distances()
-                    return d
-
-                angle_lo = ori.angle
-                angle_hi = angle_lo + np.pi
-                fun_lo = fun_dist(angle_lo, ori, pyxtal_mol, pt)
-                fun_hi = fun_dist(angle_hi, ori, pyxtal_mol, pt)
-                fun = fun_hi
-                for it in range(self.ori_attempts):
-                    self.numattempts += 1
-                    if (fun > 0.8) & (ms0.check_distances()):
-                        return ms0
-                    angle = (angle_lo + angle_hi) / 2
-                    fun = fun_dist(angle, ori, pyxtal_mol, pt)
-                    #print('Bisection: ', it, fun)
-                    if fun_lo > fun_hi:
-                        angle_hi, fun_hi = angle, fun
-                    else:
-                        angle_lo, fun_lo = angle, fun
+        elif len(pyxtal_mol.mol) > 1 and ori.degrees > 0:
+            # Scan a batch of orientations at once and keep the one
+            # with the largest ratio between distances and tolerances
+            self.numattempts += 1
+            rots = self._get_rotations(ori, 4 * self.ori_attempts)
+            ratios = ms0.scan_orientations((rots * ori.r).as_matrix())
+            # the scan uses the images of the conventional cell, so the
+            # candidates are confirmed by the exact check_distances
+            ori0 = ori.copy()
+            for best in np.argsort(-ratios):
+                if ratios[best] < 1:
+                    break
+                ori = ori0.copy()
+                ori.apply_rotation(rots[best])
+                ms0.orientation = ori
+                if ms0.check_distances():
+                    return ms0
 
         return None
 
+    def _get_rotations(self, ori, N):
+        """
+        Generate the candidate rotations to apply on an orientation.
+
+        Args:
+            ori: an Orientation object
+            N: the number of candidates
+
+        Returns:
+            a scipy Rotation object with N rotations: evenly spaced angles
+            about the axis if ori.degrees == 1, random rotations otherwise
+        """
+        if ori.degrees == 1:
+            angles = np.linspace(0, 2 * np.pi, N + 1)[1:]
+            return Rotation.from_rotvec(angles[:, None] * ori.axis)
+        else:
+            return Rotation.random(N)
+
 class molecular_crystal_2D(molecular_crystal):
     """
     A 2d counterpart to molecular_crystal. Given a layer group, list of
@@ -12,13 +12,15 @@ constraints.
 import numpy as np
 from copy import deepcopy
 from scipy.spatial.transform import Rotation
+from scipy.spatial import cKDTree
 import networkx as nx
 from random import choice
+from collections import OrderedDict
 # ------------------------------
 # External Libraries
 from pymatgen.core.structure import Molecule
 from pymatgen.symmetry.analyzer import PointGroupAnalyzer, generate_full_symmops
-from pymatgen.core.bonds import CovalentBond
+from pymatgen.core.bonds import bond_lengths
 
 # PyXtal imports
 from pyxtal.msg import printx
@@ -31,6 +33,11 @@ from pyxtal.database.collection import Collection
 # ------------------------------
 molecule_collection = Collection("molecules")
 
+# The prepared molecules (symmetrized mol, axes, box, radius, symbols and
+# tols_matrix) are shared by all pyxtal_molecule objects with the same content
+_mol_cache = OrderedDict()
+_mol_cache_size = 256
+
 
 class pyxtal_molecule:
     """
@@ -76,20 +83,41 @@ class pyxtal_molecule:
             raise NameError(msg)
 
         self.props = mo.site_properties
-
-        if len(mo) > 1:
-            if symmetrize:
-                pga = PointGroupAnalyzer(mo)
-                mo = pga.symmetrize_molecule()["sym_mol"] 
-            mo = self.add_site_props(mo)
-
-        self.mol = mo
         self.tm = tm
-        self.get_box()
+
+        key = get_mol_key(mo, symmetrize, tm)
+        if key in _mol_cache:
+            _mol_cache.move_to_end(key)
+        else:
+            if len(mo) > 1:
+                if symmetrize:
+                    pga = PointGroupAnalyzer(mo)
+                    mo = pga.symmetrize_molecule()["sym_mol"]
+                mo = self.add_site_props(mo)
+
+            self.mol = mo
+            self.get_box()
+            self.get_radius()
+            self.get_symbols()
+            self.get_tols_matrix()
+            _mol_cache[key] = {"mol": self.mol,
+                               "axes": self.axes,
+                               "box": self.box,
+                               "radius": self.radius,
+                               "symbols": self.symbols,
+                               "tols_matrix": self.tols_matrix,
+                              }
+            if len(_mol_cache) > _mol_cache_size:
+                _mol_cache.popitem(last=False)
+
+        prepared = _mol_cache[key]
+        self.mol = prepared["mol"].copy()
+        self.axes = prepared["axes"]
+        self.box = prepared["box"]
         self.volume = self.box.volume
-        self.get_radius()
-        self.get_symbols()
-        self.get_tols_matrix()
+        self.radius = prepared["radius"]
+        self.symbols = prepared["symbols"]
+        self.tols_matrix = prepared["tols_matrix"]
 
     def __str__(self):
         return '[' + self.name + ']'
@@ -99,9 +127,16 @@ class pyxtal_molecule:
 
     def copy(self):
         """
-        simply copy the structure
+        copy the molecule, only the pymatgen molecule is duplicated.
+        The box, axes, symbols, tols_matrix and tm are shared.
         """
-        return deepcopy(self)
+        new = self.__class__.__new__(self.__class__)
+        new.__dict__.update(self.__dict__)
+        new.mol = self.mol.copy()
+        return new
+
+    def __deepcopy__(self, memo):
+        return self.copy()
 
     def reset_positions(self, coors):
         """
@@ -132,7 +167,7 @@ class pyxtal_molecule:
         mo = Molecule(self.symbols, coords)
         mo = self.add_site_props(mo)
 
-        return pyxtal_molecule(mo, self.tm)
+        return pyxtal_molecule(mo, tm=self.tm)
 
     def add_site_props(self, mo):
         if len(self.props) > 0:
@@ -154,34 +189,22 @@ class pyxtal_molecule:
             a Box object
         """
         mol, P = reoriented_molecule(self.mol)
-        minx, miny, minz, maxx, maxy, maxz = 0.0, 0.0, 0.0, 0.0, 0.0, 0.0
-        for p in mol:
-            x, y, z = p.coords
-            r = Element(p.species_string).vdw_radius
-            if x - r < minx:
-                minx = x - r
-            if y - r < miny:
-                miny = y - r
-            if z - r < minz:
-                minz = z - r
-            if x + r > maxx:
-                maxx = x + r
-            if y + r > maxy:
-                maxy = y + r
-            if z + r > maxz:
-                maxz = z + r
+        numbers = np.array(mol.atomic_numbers)
+        radii = np.array(Element("H").all_vdw_radii())[numbers-1]
+        coords = mol.cart_coords
+        # the box always contains the origin
+        mins = np.minimum(np.min(coords - radii[:, None], axis=0), 0)
+        maxs = np.maximum(np.max(coords + radii[:, None], axis=0), 0)
+        [minx, miny, minz], [maxx, maxy, maxz] = mins, maxs
         self.box = Box(minx, maxx, miny, maxy, minz, maxz)
+        P.setflags(write=False)
         self.axes = P
 
     def get_radius(self):
-        r_max = 0
-        for coord, number in zip(self.mol.cart_coords, self.mol.atomic_numbers):
-            radius = (
-                np.sqrt(np.sum(coord * coord)) + self.tm.get_tol(number, number) * 0.5
-            )
-            if radius > r_max:
-                r_max = radius
-        self.radius = r_max
+        numbers = self.mol.atomic_numbers
+        tols = np.array([self.tm.get_tol(n, n) for n in numbers], dtype=float)
+        radii = np.linalg.norm(self.mol.cart_coords, axis=1) + tols * 0.5
+        self.radius = max([0, np.max(radii)])
         # reestimate the radius if it has stick shape
         rmax = max([self.box.width,self.box.height,self.box.length])
         rmin = min([self.box.width,self.box.height,self.box.length])
@@ -204,12 +227,15 @@ class pyxtal_molecule:
         Returns: a 2D matrix which is used internally for distance checking.
         """
         numbers = self.mol.atomic_numbers
-        tols = np.zeros((len(numbers), len(numbers)))
-        for i1, number1 in enumerate(numbers):
-            for i2, number2 in enumerate(numbers):
-                tols[i1][i2] = self.tm.get_tol(number1, number2)
+        uniq, ids = np.unique(numbers, return_inverse=True)
+        tols = np.zeros((len(uniq), len(uniq)))
+        for i1, number1 in enumerate(uniq):
+            for i2, number2 in enumerate(uniq):
+                tols[i1][i2] = self.tm.get_tol(int(number1), int(number2))
+        tols = tols[np.ix_(ids, ids)]
         if len(self.mol)==1:
             tols *= 0.8 # if only one atom, reduce the tolerance
+        tols.setflags(write=False)
         self.tols_matrix = tols
 
     def show(self):
@@ -217,6 +243,26 @@ class pyxtal_molecule:
         return display_molecules([self.mol])
 
 
+def get_mol_key(mol, symmetrize=True, tm=None):
+    """
+    Compute the content-based key to look up the prepared molecules
+
+    Args:
+        mol: a pymatgen Molecule object
+        symmetrize: whether or not the molecule will be symmetrized
+        tm: a Tol_matrix object
+
+    Returns:
+        a hashable tuple
+    """
+    coords = np.round(mol.cart_coords, 6) + 0.0 # avoid -0.0
+    key = (tuple(mol.atomic_numbers), coords.tobytes(), bool(symmetrize),
+           repr(mol.site_properties))
+    if tm is not None:
+        customs = tuple((i, j, tm.get_tol(i, j)) for (i, j) in tm.custom_values)
+        key += (tm.prototype, tm.f, customs)
+    return key
+
 
 
 class Box:
@@ -304,6 +350,30 @@ class Orientation:
         self.matrix = matrix
         self.r = Rotation.from_matrix(matrix)
 
+    def apply_rotation(self, r):
+        """
+        Apply an extra rotation on top of the orientation, and update the
+        angle/axis of the last change so that they stay consistent with
+        the new matrix.
+
+        Args:
+            r: a scipy Rotation object, about self.axis if self.degrees == 1
+        """
+        if self.angle is None:
+            r0 = r
+        else:
+            r0 = r * Rotation.from_rotvec(self.angle * self.axis)
+        rotvec = r0.as_rotvec()
+        if self.degrees == 1:
+            # keep the constraint axis, so the angle carries the sign
+            self.angle = np.dot(rotvec, self.axis)
+        else:
+            self.angle = np.linalg.norm(rotvec)
+            if self.angle > 1e-8:
+                self.axis = rotvec / self.angle
+        self.r = r * self.r
+        self.matrix = self.r.as_matrix()
+
     def __repr__(self):
         return str(self)
 
@@ -880,6 +950,40 @@ def orientation_in_wyckoff_position(
     else:
         return allowed
 
+def get_bond_cutoffs(names, tol=0.2, scaled=True):
+    """
+    Compute the maximum bonding distance between each pair of elements
+
+    Args:
+        names: a list of element symbols
+        tol: the relative tolerance on the typical bond lengths
+        scaled: whether or not to rescale tol for the pairs involving H
+            and the S-S, S-O, F-O pairs
+
+    Returns:
+        a square numpy array with one row per element in names. Pairs
+        without bond data have a cutoff of 0
+    """
+    cutoffs = np.zeros([len(names), len(names)])
+    for i, name1 in enumerate(names):
+        for j, name2 in enumerate(names):
+            #remove short X-H distances
+            if not scaled:
+                factor = 1.0
+            elif name1 == "H" and name2 == "H":
+                factor = -0.5
+            elif [name1, name2] in [["S","S"], ["S","O"], ["O","S"], ["F","O"], ["O","F"]]:
+                factor = 0.05
+            elif "H" in [name1, name2]:
+                factor = 0.5
+            else:
+                factor = 1.0
+            syms = tuple(sorted([name1, name2]))
+            if syms in bond_lengths:
+                bl = max(bond_lengths[syms].values())
+                cutoffs[i, j] = (1 + factor*tol) * bl
+    return cutoffs
+
 def make_graph(mol, tol=0.2):
     """
     make graph object for the input molecule
@@ -889,36 +993,34 @@ def make_graph(mol, tol=0.2):
     for i, site in enumerate(mol._sites):
         names[i] = site.specie.value
 
-    for i in range(len(mol)-1):
-        site1 = mol.sites[i]
-        for j in range(i+1, len(mol)):
-            site2 = mol.sites[j]
-            #remove short X-H distances
-            if names[i] == "H" and names[j]=="H":
-                factor = -0.5
-            elif [names[i], names[j]] in [["S","S"], ["S","O"], ["O","S"], ["F","O"], ["O","F"]]:
-                factor = 0.05
-            elif "H" in [names[i], names[j]]:
-                factor = 0.5
-            else:
-                factor = 1.0
-            try:
-                if CovalentBond.is_bonded(site1, site2, factor*tol):
-                    G.add_edge(i,j)
-                    #print(names[i], names[j], mol.get_distance(i, j))
-            except ValueError:
-                pass
+    # find all bonded pairs with a single KD-tree query
+    elements, ids = np.unique(list(names.values()), return_inverse=True)
+    cutoffs = get_bond_cutoffs(elements, tol)
+    coords = mol.cart_coords
+    pairs = cKDTree(coords).query_pairs(cutoffs.max(), output_type='ndarray')
+    if len(pairs) > 0:
+        pairs = pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+        d = np.linalg.norm(coords[pairs[:, 0]] - coords[pairs[:, 1]], axis=1)
+        pairs = pairs[d < cutoffs[ids[pairs[:, 0]], ids[pairs[:, 1]]]]
+        G.add_edges_from(pairs.tolist())
     nx.set_node_attributes(G, names, 'name')
 
     return G
- 
+
 def compare_mol_connectivity(mol1, mol2, ignore_name=False):
     """
-    Compare two molecules by connectivity
+    Compare two molecules by connectivity. The graphs are first compared
+    by their Weisfeiler-Lehman hashes, and the isomorphism mapping is only
+    searched if the hashes match.
     """
 
     G1 = make_graph(mol1)
     G2 = make_graph(mol2)
+    attr = None if ignore_name else 'name'
+    if nx.weisfeiler_lehman_graph_hash(G1, node_attr=attr) != \
+        nx.weisfeiler_lehman_graph_hash(G2, node_attr=attr):
+        return False, {}
+
     if ignore_name:
         GM = nx.isomorphism.GraphMatcher(G1, G2)
     else:
@@ -210,7 +210,10 @@ def distance_matrix(pts1, pts2, lattice, PBC=[1, 1, 1], single=False, metric="eu
     Returns:
         a scalor or distance matrix
     """
-    if PBC != [0, 0, 0]:
+    if sum(PBC) == 3 and metric == "euclidean":
+        return distance_matrix_reduced(pts1, pts2, lattice, single)
+
+    elif PBC != [0, 0, 0]:
         l1 = filtered_coords(pts1, PBC=PBC)
         l2 = filtered_coords(pts2, PBC=PBC)
         l1 = np.dot(l1, lattice)
@@ -232,6 +235,129 @@ def distance_matrix(pts1, pts2, lattice, PBC=[1, 1, 1], single=False, metric="eu
     else:
         return distance_matrix_no_PBC(pts1, pts2, lattice, single, metric)
 
+def distance_matrix_reduced(pts1, pts2, lattice, single=False, size=1<<16):
+    """
+    Returns the minimum image distances between two sets of fractional
+    coordinates in a 3D periodic lattice. The computation is done in the
+    reduced basis of the lattice, where the minimum image of a wrapped
+    displacement is found among itself and its 26 neighbours. The points
+    of pts1 are processed in blocks to bound the memory.
+
+    Args:
+        pts1: a list of fractional coordinates (N1*3)
+        pts2: another list of fractional coordinates (N2*3)
+        lattice: a 3x3 matrix describing a unit cell's lattice vectors
+        single: return the minimum distance or the matrix
+        size: the maximum number of pair-image entries in one block
+
+    Returns:
+        a scalor or distance matrix
+    """
+    matrix, tran = get_reduced_matrix(lattice)
+    inv_tran = np.linalg.inv(tran)
+    pts1 = np.reshape(pts1, [-1, 3]).dot(inv_tran)
+    pts2 = np.reshape(pts2, [-1, 3]).dot(inv_tran)
+    # one of each pair of the 26 neighbours (v and -v)
+    vecs = create_matrix(omit=True)[:13].dot(matrix)
+    vecs2 = np.sum(vecs**2, axis=1)[:, None]
+
+    d2 = np.zeros([len(pts1), len(pts2)])
+    step = max([1, size // max([1, len(pts2)*len(vecs)])])
+    for i in range(0, len(pts1), step):
+        # Wrapped displacements in the reduced basis
+        d = pts1[i:i+step, None, :] - pts2[None, :, :]
+        d -= np.round(d)
+        d = d.reshape([-1, 3]).dot(matrix)
+        # min(|d+v|^2, |d-v|^2) = |d|^2 + |v|^2 - 2|d.v|
+        shift = np.abs(vecs.dot(d.T))
+        shift *= -2
+        shift += vecs2
+        shift = np.minimum(shift.min(axis=0), 0)
+        shift += np.sum(d**2, axis=1)
+        d2[i:i+step] = np.maximum(shift, 0).reshape([-1, len(pts2)])
+
+    if single:
+        return np.sqrt(np.min(d2))
+    else:
+        return np.sqrt(d2)
+
+_reduced_cache = {}
+
+def get_reduced_matrix(matrix, delta=0.75):
+    """
+    Reduce the lattice vectors by the LLL algorithm followed by a greedy
+    pass which shortens each vector with small integer combinations of the
+    other two. The results are cached for the last lattices.
+
+    Args:
+        matrix: a 3x3 matrix describing a unit cell's lattice vectors
+        delta: the Lovasz parameter of the LLL algorithm
+
+    Returns:
+        the reduced 3x3 matrix and the integer matrix tran such that
+        reduced = tran.dot(matrix)
+    """
+    matrix = np.array(matrix, dtype=float)
+    key = (matrix.tobytes(), delta)
+    if key in _reduced_cache:
+        return _reduced_cache[key]
+
+    B = matrix.copy()
+    tran = np.eye(3)
+
+    def gram_schmidt(B):
+        Bs = np.zeros([3, 3])
+        mu = np.zeros([3, 3])
+        for i in range(3):
+            Bs[i] = B[i]
+            for j in range(i):
+                mu[i, j] = B[i].dot(Bs[j]) / Bs[j].dot(Bs[j])
+                Bs[i] -= mu[i, j] * Bs[j]
+        return Bs, mu
+
+    k = 1
+    Bs, mu = gram_schmidt(B)
+    while k < 3:
+        for j in range(k-1, -1, -1):
+            q = np.round(mu[k, j])
+            if q != 0:
+                B[k] -= q * B[j]
+                tran[k] -= q * tran[j]
+                Bs, mu = gram_schmidt(B)
+        if Bs[k].dot(Bs[k]) >= (delta - mu[k, k-1]**2) * Bs[k-1].dot(Bs[k-1]):
+            k += 1
+        else:
+            B[[k-1, k]] = B[[k, k-1]]
+            tran[[k-1, k]] = tran[[k, k-1]]
+            Bs, mu = gram_schmidt(B)
+            k = max(k-1, 1)
+
+    # greedy pass
+    combs = np.array([[m, n] for m in [-1, 0, 1] for n in [-1, 0, 1]])
+    reduced = True
+    while reduced:
+        reduced = False
+        for i in range(3):
+            j, k = [x for x in range(3) if x != i]
+            vecs = B[i] + combs.dot(B[[j, k]])
+            id = np.argmin(np.linalg.norm(vecs, axis=1))
+            if np.linalg.norm(vecs[id]) < np.linalg.norm(B[i]) - 1e-8:
+                B[i] = vecs[id]
+                tran[i] += combs[id].dot(tran[[j, k]])
+                reduced = True
+
+    # keep the handedness of the input lattice
+    if np.linalg.det(tran) < 0:
+        B *= -1
+        tran *= -1
+    tran = np.round(tran)
+    B.flags.writeable = False
+    tran.flags.writeable = False
+    if len(_reduced_cache) > 32:
+        _reduced_cache.clear()
+    _reduced_cache[key] = (B, tran)
+    return B, tran
+
 def distance_matrix_no_PBC(pts1, pts2, lattice, single=False, metric="euclidean"):
     """
     Returns the distances between two sets of fractional coordinates.
@@ -6,7 +6,6 @@ from pyxtal.wyckoff_split import wyckoff_split
 import pymatgen.analysis.structure_matcher as sm
 import numpy as np
 from copy import deepcopy
-from random import sample
 import itertools
 from scipy.optimize import minimize
 
@@ -106,27 +105,80 @@ class supergroup():
             self.error = True
             print("No compatible solution exists")
 
-    def search_supergroup(self, d_tol=1.0):
+    def search_supergroup(self, d_tol=1.0, ncpu=1, cutoff=None):
         """
         search for valid supergroup transition
 
         Args:
             d_tol (float): tolerance
+            ncpu (int): number of processes to evaluate the solutions
+            cutoff (float): stop the search once a solution below it is found
 
         Returns:
             valid_solutions: dictionary
         """
+        results = list(self._search(d_tol, ncpu, cutoff))
+        results.sort(key=lambda x: x[0])
+        return [res for (i, res) in results]
+
+    def iter_supergroup(self, d_tol=1.0, ncpu=1, cutoff=None):
+        """
+        search for valid supergroup transition, and yield each valid 
+        solution (splitter, mapping, disp, mae) as soon as it is found
+
+        Args:
+            d_tol (float): tolerance
+            ncpu (int): number of processes to evaluate the solutions
+            cutoff (float): stop the search once a solution below it is found
+        """
+        for (i, res) in self._search(d_tol, ncpu, cutoff):
+            yield res
+
+    def _search(self, d_tol, ncpu, cutoff):
+        """
+        evaluate all (G, split, solution) tasks serially or with a pool of 
+        processes, each of which receives a copy of this object only once
+
+        Returns:
+            a generator of (task id, (splitter, mapping, disp, mae))
+        """
         self.d_tol = d_tol
-        # extract the valid
-        valid_solutions = []
+        tasks = []
         for sols in self.solutions:
             G, id, sols = sols['group'], sols['id'], sols['splits']
             for sol in sols:
+                tasks.append((G, id, sol))
+
+        if ncpu > 1 and len(tasks) > 1:
+            from concurrent.futures import ProcessPoolExecutor, as_completed
+            size = int(np.ceil(len(tasks)/(ncpu*4)))
+            chunks = [list(range(i, min([i+size, len(tasks)]))) for i in range(0, len(tasks), size)]
+            with ProcessPoolExecutor(ncpu, initializer=_init_worker, initargs=(self,)) as executor:
+                futures = [executor.submit(_get_displacements, [(i, tasks[i]) for i in chunk], d_tol*1.1) for chunk in chunks]
+                stop = False
+                try:
+                    for future in as_completed(futures):
+                        for (i, mae, disp, mapping) in future.result():
+                            if mae < d_tol:
+                                G, id, sol = tasks[i]
+                                sp = self.get_splitter(G, id, sol)
+                                yield i, (sp, mapping, disp, mae)
+                                if cutoff is not None and mae < cutoff:
+                                    stop = True
+                        if stop:
+                            break
+                finally:
+                    # cancel the remaining tasks after the early stop
+                    for f in futures:
+                        f.cancel()
+        else:
+            for i, (G, id, sol) in enumerate(tasks):
                 mae, disp, mapping, sp = self.get_displacement(G, id, sol, d_tol*1.1)
                 #print(G, sol, mae, disp)
                 if mae < d_tol:
-                    valid_solutions.append((sp, mapping, disp, mae))
-        return valid_solutions
+                    yield i, (sp, mapping, disp, mae)
+                    if cutoff is not None and mae < cutoff:
+                        break
 
     def make_supergroup(self, solutions, show_detail=True):
         """
@@ -176,18 +228,17 @@ class supergroup():
 
         return G_strucs
 
-    def get_displacement(self, G, split_id, solution, d_tol):
+    def get_splitter(self, G, split_id, solution):
         """
-        For a given solution, search for the possbile supergroup structure
+        Create the splitter for a given solution
 
         Args:
             G: supergroup number
             split_id: integer
             solution: e.g., [['2d'], ['6h'], ['2c', '6h', '12i']]
-            d_tol:
+
         Returns:
-            mae: mean absolute atomic displcement
-            disp: overall cell translation
+            wyckoff_split object
         """
         sites_G = []
         elements = []
@@ -202,8 +253,23 @@ class supergroup():
         elements = [elements[id] for id in ids]
         sites_G = [sites_G[id] for id in ids]
         #print(G, self.struc.group.number, sites_G)
-        splitter = wyckoff_split(G, split_id, sites_G, self.group_type, elements)
-        mappings = self.find_mapping(splitter)
+        return wyckoff_split(G, split_id, sites_G, self.group_type, elements)
+
+    def get_displacement(self, G, split_id, solution, d_tol):
+        """
+        For a given solution, search for the possbile supergroup structure
+
+        Args:
+            G: supergroup number
+            split_id: integer
+            solution: e.g., [['2d'], ['6h'], ['2c', '6h', '12i']]
+            d_tol:
+        Returns:
+            mae: mean absolute atomic displcement
+            disp: overall cell translation
+        """
+        splitter = self.get_splitter(G, split_id, solution)
+        mappings = self.find_mapping(splitter, d_tol)
         dists = []
         disps = []
         if len(mappings) > 0:
@@ -220,7 +286,7 @@ class supergroup():
                 # optimize further
                 def fun(disp, mapping, splitter, mask):
                     return self.symmetrize_dist(splitter, mapping, disp, mask)[0]
-                res = minimize(fun, disps[id], args=(mappings[id], splitter, mask),
+                res = minimize(fun, disps[id], args=(mappings[id], splitter, None),
                         method='Nelder-Mead', options={'maxiter': 20})
                 if res.fun < mae:
                     mae = res.fun
@@ -229,52 +295,81 @@ class supergroup():
         else:
             return 1000, None, None, None
 
-    def find_mapping(self, splitter):
+    def find_mapping(self, splitter, d_tol=1.2):
         """
-        search for all mappings for a given splitter
+        search for the best mappings for a given splitter
+
+        The overall shift is set by the first one to one splitting (anchor),
+        after that, the distortion of each site in G only depends on the 
+        sites in H assigned to it. For each choice of the anchor, the sites 
+        of the same element and letter are assigned by a branch and bound 
+        search, which minimizes the maximum distortion.
+
+        Args:
+            splitter: splitter object to specify the relation between G and H
+            d_tol: the tolerance in angstrom
+
+        Returns:
+            list of the best mapping, or [] if no mapping is below d_tol
         """
-        solution_template = [[None]*len(wp2) for wp2 in splitter.wp2_lists]
         atom_sites_H = self.struc.atom_sites
-        assigned_ids = []
-        # look for unique assignment from sites_H to sites_G
+        if sum([len(wp2) for wp2 in splitter.wp2_lists]) != len(atom_sites_H):
+            return []
+
+        # the candidates with the compatible element and letter
+        candidates = []
         for i, wp2 in enumerate(splitter.wp2_lists):
-            # choose the sites belong to the same element
             ele = splitter.elements[i]
-            e_ids = [id for id, site in enumerate(atom_sites_H) if site.specie==ele]
-
-            if len(wp2) == 1:
-                ids = [id for id in e_ids if atom_sites_H[id].wp.letter == wp2[0].letter]
-                if len(ids) == 1:
-                    solution_template[i] = ids
-                    assigned_ids.append(ids[0])
-
-        # consider all permutations for to assign the rest atoms from H to G
-        # https://stackoverflow.com/questions/65484940
-
-        remaining_ids = [id for id in range(len(atom_sites_H)) if id not in assigned_ids]
-        all_permutations = list(itertools.permutations(remaining_ids))
-        unique_solutions = []
-        if len(all_permutations)>50:
-            all_permutations = sample(all_permutations, 50)
-        for permutation in all_permutations:
-            permutation = list(permutation)
-            solution = deepcopy(solution_template)
-            for i, sol in enumerate(solution):
-                valid = True
-                if None in sol:
-                    for j, id in enumerate(permutation[:len(sol)]):
-                        if atom_sites_H[id].wp.letter == splitter.wp2_lists[i][j].letter:
-                            solution[i][j] = id
-                        else:
-                            valid = False
-                            break
-                    if not valid:
+            ids = [[id for id, site in enumerate(atom_sites_H) if site.specie==ele \
+                    and site.wp.letter==wp.letter] for wp in wp2]
+            candidates.append([list(c) for c in itertools.product(*ids) if len(set(c))==len(c)])
+
+        anchors = [i for i, wp2 in enumerate(splitter.wp2_lists) if len(wp2) == 1]
+        anchor = anchors[0] if len(anchors) > 0 else len(candidates)
+
+        def get_costs(i, disp, mask):
+            costs = []
+            for ids in candidates[i]:
+                dist = self.symmetrize_site(splitter, i, ids, disp, mask, d_tol)[0]
+                if dist < 10000:
+                    costs.append((dist, ids))
+            costs.sort(key=lambda x: x[0])
+            return costs
+
+        # the sites before the anchor do not depend on the shift
+        costs0 = [get_costs(i, None, None) for i in range(anchor)]
+        if min([len(c) for c in costs0], default=1) == 0:
+            return []
+
+        # the mappings above d_tol cannot be accepted
+        best, solution = d_tol, None
+        if anchor < len(candidates):
+            trials = []
+            for ids in candidates[anchor]:
+                dist, disp, mask = self.symmetrize_site(splitter, anchor, ids, None, None, d_tol)
+                trials.append((dist, ids, disp, mask))
+            trials.sort(key=lambda x: x[0])
+        else:
+            trials = [(0, None, None, None)]
+
+        for dist, ids, disp, mask in trials:
+            if dist >= best:
+                break
+            costs = list(costs0)
+            if ids is not None:
+                costs.append([(dist, ids)])
+                for i in range(anchor+1, len(candidates)):
+                    cost = get_costs(i, disp, mask)
+                    if len(cost) == 0 or cost[0][0] >= best:
                         break
-                    else:
-                        del permutation[:len(sol)]
-            if valid and new_solution(solution, unique_solutions):
-                unique_solutions.append(solution)
-        return unique_solutions
+                    costs.append(cost)
+                if len(costs) < len(candidates):
+                    continue
+            cost, sol = get_best_assignment(costs, best)
+            if sol is not None:
+                best, solution = cost, sol
+
+        return [] if solution is None else [solution]
 
     def symmetrize_dist(self, splitter, solution, disp=None, mask=None, d_tol=1.2):
         """
@@ -290,122 +385,89 @@ class supergroup():
             cell translation
         """
         max_disps = []
-        atom_sites_H = self.struc.atom_sites
-        n_atoms = sum([site.wp.multiplicity for site in atom_sites_H])
         #print("checking solution-----------------", solution)
         # wp1 stores the wyckoff position object of ['2c', '6h', '12i']
         for i, wp1 in enumerate(splitter.wp1_lists):
+            dist, disp, mask = self.symmetrize_site(splitter, i, solution[i], disp, mask, d_tol)
+            if dist == 10000:
+                return dist, disp, mask
+            max_disps.append(dist)
 
-            if len(splitter.wp2_lists[i]) == 1:
-                # one to one splitting, e.g., 2c->2d
-                # this usually involves increase of site symmetry
-
-                # symmetry info
-                ops_H = splitter.H_orbits[i][0]  # ops for H
-                ops_G2 = splitter.G2_orbits[i][0] # ops for G2
-
-                # refine coord1 to find the best match on coord2
-                coord = atom_sites_H[solution[i][0]].position
-                coord0s = apply_ops(coord, ops_H) # possible coords in H
-                dists = []
-                for coord0 in coord0s:
-                    coord2 = coord0.copy()
-                    if disp is not None:
-                        coord2 += disp
-                    coord1 = apply_ops(coord2, ops_G2)[0] # coord in G
-                    #print(coord1, coord2)
-                    dist = coord1 - coord2
-                    dist -= np.round(dist)
-                    dist = np.dot(dist, self.cell)
-                    dists.append(np.linalg.norm(dist))
-                min_ID = np.argmin(np.array(dists))
-
-                dist = dists[min_ID]
-                coord2 = coord0s[min_ID].copy()
+        return max(max_disps), disp, mask
 
-                #print("---------", wp1.letter, coord1, coord2, disp, dist)
-                #print(splitter)
-                #print(splitter.R)
-                if disp is None:
-                    coord1 = apply_ops(coord2, ops_G2)[0]
-                    disp = (coord1 - coord2).copy()
-                    # temporary fix
-                    xyz1 = ops_H[0].as_xyz_string().split(',')
-                    xyz2 = ops_G2[0].as_xyz_string().split(',')
-                    mask = [m for m in range(3) if xyz1[m]==xyz2[m]]
-                    #disp[mask] = 0
-                    #if abs(disp[0] + disp[1]) < 1e-2:
-                    #    disp[:2] = 0
-                    #print(disp, coord1, coord2)
-                elif dist < d_tol:
-                    coord1 = ops_G2[0].operate(coord2+disp)
-                    if round(np.trace(ops_G2[0].rotation_matrix)) in [1, 2]:
-                        def fun(x, pt, ref, op):
-                            pt[0] = x[0]
-                            y = op.operate(pt)
-                            diff = y - ref
-                            diff -= np.round(diff)
-                            diff = np.dot(diff, self.cell)
-                            return np.linalg.norm(diff)
-
-                        # optimize the distance by changing coord1
-                        res = minimize(fun, coord1[0], args=(coord1, coord2, ops_G2[0]),
-                                method='Nelder-Mead', options={'maxiter': 20})
-                        coord1[0] = res.x[0]
-                        coord1 = ops_G2[0].operate(coord1)
-                else:
-                    return 10000, None, None
-                if mask is not None:
-                    disp[mask] = 0
-                diff = coord1-(coord2+disp)
-                diff -= np.round(diff)
-                max_disps.append(np.linalg.norm(np.dot(diff, self.cell)))
+    def symmetrize_site(self, splitter, i, ids, disp=None, mask=None, d_tol=1.2):
+        """
+        Compute the distortion of the H sites assigned to the i-th G site
 
+        Args:
+            splitter: splitter object to specify the relation between G and H
+            i: the index of the site in G
+            ids: the indices of the assigned sites in H
+            disp: an overall shift from H to G, None or 3 vector
+            mask: the directions where the shift is fixed to 0
+            d_tol: the tolerance in angstrom
+        Returns:
+            distortion (10000 if the sites do not match)
+            cell translation
+            mask
+        """
+        atom_sites_H = self.struc.atom_sites
+        if len(splitter.wp2_lists[i]) == 1:
+            # one to one splitting, e.g., 2c->2d
+            # this usually involves increase of site symmetry
+
+            # symmetry info
+            ops_H = splitter.H_orbits[i][0]  # ops for H
+            op_G2 = splitter.G2_orbits[i][0][0] # the first op for G2
+
+            # refine coord1 to find the best match on coord2
+            coord0s = apply_ops(atom_sites_H[ids[0]].position, ops_H) # possible coords in H
+            coord2s = coord0s if disp is None else coord0s + disp
+            dists = get_dists(transform(coord2s, op_G2) - coord2s, self.cell)
+            min_ID = np.argmin(dists)
+
+            dist = dists[min_ID]
+            coord2 = coord0s[min_ID].copy()
+
+            if disp is None:
+                coord1 = op_G2.operate(coord2)
+                disp = (coord1 - coord2).copy()
+                # temporary fix, the directions with the same xyz string
+                diffs = np.abs(ops_H[0].affine_matrix[:3] - op_G2.affine_matrix[:3])
+                mask = [m for m in range(3) if diffs[m].max() < 1e-3]
+            elif dist < d_tol:
+                coord1 = op_G2.operate(coord2+disp)
+                if round(np.trace(op_G2.rotation_matrix)) in [1, 2]:
+                    # optimize the distance by changing coord1
+                    coord1 = get_projection(coord1, coord2, op_G2, self.cell)
             else:
-                # symmetry operations
-                ops_H1 = splitter.H_orbits[i][0]
-                ops_G22 = splitter.G2_orbits[i][1]
-
-                coord1 = atom_sites_H[solution[i][0]].position.copy()
-                coord2 = atom_sites_H[solution[i][1]].position.copy()
-                # refine coord1 to find the best match on coord2
-                if disp is not None:
-                    coord11 = coord1 + disp
-                    coord22 = coord2 + disp
-                else:
-                    coord11 = coord1
-                    coord22 = coord2
-                coords11 = apply_ops(coord11, ops_H1)
-
-                # transform coords1 by symmetry operation
-                op = ops_G22[0]
-                for m, coord11 in enumerate(coords11):
-                    coords11[m] = op.operate(coord11)
-                tmp, dist = get_best_match(coords11, coord22, self.cell)
-                if dist > np.sqrt(2)*d_tol:
-                    return 10000, None, mask
-
-                # recover the original position
-                try:
-                    inv_op = get_inverse(op)
-                except:
-                    print("Error in getting the inverse")
-                    print(op)
-                    print(op.as_xyz_string())
-                    import sys; sys.exit()
-                coord1 = inv_op.operate(tmp)
-                if disp is not None:
-                    coord1 -= disp
-                d = coord22 - tmp
-                d -= np.round(d)
+                return 10000, None, None
+            if mask is not None:
+                disp[mask] = 0
+            diff = coord1-(coord2+disp)
+            diff -= np.round(diff)
+            return np.linalg.norm(np.dot(diff, self.cell)), disp, mask
 
-                coord22 -= d/2 #final coord2 after disp
-                # recover the displaced position
-                coord11 = inv_op.operate(coord22)
-
-                max_disps.append(np.linalg.norm(np.dot(d/2, self.cell)))
-
-        return max(max_disps), disp, mask
+        else:
+            # symmetry operations
+            ops_H1 = splitter.H_orbits[i][0]
+            op = splitter.G2_orbits[i][1][0]
+
+            coord11 = atom_sites_H[ids[0]].position
+            coord22 = atom_sites_H[ids[1]].position
+            if disp is not None:
+                coord11 = coord11 + disp
+                coord22 = coord22 + disp
+
+            # transform all coords1 by symmetry operation and match coord2
+            coords11 = transform(apply_ops(coord11, ops_H1), op)
+            tmp, dist = get_best_match(coords11, coord22, self.cell)
+            if dist > np.sqrt(2)*d_tol:
+                return 10000, None, mask
+
+            d = coord22 - tmp
+            d -= np.round(d)
+            return np.linalg.norm(np.dot(d/2, self.cell)), disp, mask
 
     def symmetrize(self, splitter, solution, disp):
         """
@@ -440,35 +502,16 @@ class supergroup():
                 ops_G2 = splitter.G2_orbits[i][0] # ops for G2
 
                 # refine coord1 to find the best match on coord2
-                coord = atom_sites_H[solution[i][0]].position
-                coord0s = apply_ops(coord, ops_H) # possible coords in H
-                dists = []
-                for coord0 in coord0s:
-                    coord2 = coord0.copy()
-                    coord2 += disp
-                    coord1 = apply_ops(coord2, ops_G2)[0] # coord in G
-                    dist = coord1 - coord2
-                    dist -= np.round(dist)
-                    dist = np.dot(dist, self.cell)
-                    dists.append(np.linalg.norm(dist))
-                min_ID = np.argmin(np.array(dists))
+                coord0s = apply_ops(atom_sites_H[solution[i][0]].position, ops_H) # possible coords in H
+                coord2s = coord0s + disp
+                dists = get_dists(transform(coord2s, ops_G2[0]) - coord2s, self.cell)
+                min_ID = np.argmin(dists)
 
                 coord2 = coord0s[min_ID].copy()
                 coord1 = ops_G2[0].operate(coord2+disp)
                 if round(np.trace(ops_G2[0].rotation_matrix)) in [1, 2]:
-                    def fun(x, pt, ref, op):
-                        pt[0] = x[0]
-                        y = op.operate(pt)
-                        diff = y - ref
-                        diff -= np.round(diff)
-                        diff = np.dot(diff, self.cell)
-                        return np.linalg.norm(diff)
-
                     # optimize the distance by changing coord1
-                    res = minimize(fun, coord1[0], args=(coord1, coord2, ops_G2[0]),
-                            method='Nelder-Mead', options={'maxiter': 20})
-                    coord1[0] = res.x[0]
-                    coord1 = ops_G2[0].operate(coord1)
+                    coord1 = get_projection(coord1, coord2, ops_G2[0], self.cell)
 
                 coords_G1.append(np.dot(inv_R[:3,:3], coord1).T+inv_R[:3,3].T)
                 #coords_G1.append(coord1)
@@ -487,12 +530,9 @@ class supergroup():
                 # refine coord1 to find the best match on coord2
                 coord11 = coord1 + disp
                 coord22 = coord2 + disp
-                coords11 = apply_ops(coord11, ops_H1)
-
                 # transform coords1 by symmetry operation
                 op = ops_G22[0]
-                for m, coord11 in enumerate(coords11):
-                    coords11[m] = op.operate(coord11)
+                coords11 = transform(apply_ops(coord11, ops_H1), op)
                 tmp, dist = get_best_match(coords11, coord22, self.cell)
 
                 # recover the original position
@@ -661,6 +701,110 @@ class supergroup():
         #     print(good_splittings_list[0])
         return good_splittings_list
 
+# the supergroup object shared by the worker processes
+_supergroup = None
+
+def _init_worker(my):
+    global _supergroup
+    _supergroup = my
+
+def _get_displacements(tasks, d_tol):
+    """
+    evaluate a list of (task id, (G, split_id, solution)) in a worker,
+    the splitters are not returned to save the cost of pickling
+
+    Returns:
+        list of (task id, mae, disp, mapping)
+    """
+    results = []
+    for i, (G, id, sol) in tasks:
+        mae, disp, mapping, sp = _supergroup.get_displacement(G, id, sol, d_tol)
+        results.append((i, mae, disp, mapping))
+    return results
+
+def get_best_assignment(costs, bound=np.inf):
+    """
+    branch and bound search for the assignment with the smallest maximum 
+    cost, in which each block takes one candidate and each id is used once
+
+    Args:
+        costs: list of [(cost, ids), ...] for each block, sorted by cost
+        bound: only search for the assignments below this cost
+
+    Returns:
+        the maximum cost and the list of ids for each block 
+        (None if there is no assignment below the bound)
+    """
+    order = sorted(range(len(costs)), key=lambda i: len(costs[i]))
+    choice = [None] * len(costs)
+    best = [bound, None]
+
+    def search(k, used, cost0):
+        if k == len(order):
+            best[0], best[1] = cost0, [list(ids) for ids in choice]
+            return
+        for cost, ids in costs[order[k]]:
+            if max([cost, cost0]) >= best[0]:
+                break
+            if used.isdisjoint(ids):
+                choice[order[k]] = ids
+                search(k+1, used.union(ids), max([cost, cost0]))
+
+    search(0, frozenset(), 0)
+    return best[0], best[1]
+
+def transform(coords, op):
+    """
+    apply a single symmetry operation to a set of positions
+
+    Args:
+        coords: N*3 array
+        op: SymmOp object
+
+    Returns:
+        N*3 array
+    """
+    return np.dot(coords, op.rotation_matrix.T) + op.translation_vector
+
+def get_dists(diffs, cell):
+    """
+    get the distances of the fractional differences under the PBC
+
+    Args:
+        diffs: N*3 array
+        cell: 3*3 matrix
+
+    Returns:
+        N array of distances
+    """
+    diffs = diffs - np.round(diffs)
+    return np.linalg.norm(np.dot(diffs, cell), axis=-1)
+
+def get_projection(pt, ref, op, cell):
+    """
+    change the first coordinate of pt to minimize the distance between op(pt) 
+    and ref. Since op(pt) is linear in pt[0], the best value is given by the 
+    projection of the distance on the direction of op(pt) in real space.
+
+    Args:
+        pt: 1*3 array
+        ref: 1*3 array
+        op: SymmOp object
+        cell: 3*3 matrix
+
+    Returns:
+        op(pt) at the optimized pt
+    """
+    pt = np.array(pt, dtype=float)
+    diff = op.operate(pt) - ref
+    diff -= np.round(diff)
+    diff = np.dot(diff, cell)
+    direction = np.dot(op.rotation_matrix[:, 0], cell)
+    norm = np.dot(direction, direction)
+    if norm > 1e-8:
+        pt[0] -= np.dot(diff, direction)/norm
+    return op.operate(pt)
+
 def get_best_match(positions, ref, cell):
     """
     find the best match with the reference from a set of positions
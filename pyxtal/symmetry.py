@@ -587,6 +587,8 @@ class Wyckoff_position:
         ops = Group(self.number)[self.index]
         if self.number in [7, 14, 15]:
             trans = np.array([[1,0,0],[0,1,0],[1,0,1]])
+            # make a new list, self.ops may be shared with the Group object
+            self.ops = list(self.ops)
             for j, op in enumerate(ops):
                 vec = op.translation_vector.dot(trans)
                 vec -= np.floor(vec) 
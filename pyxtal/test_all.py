@@ -9,11 +9,17 @@ from pymatgen.symmetry.analyzer import SpacegroupAnalyzer
 from pymatgen.core.operations import SymmOp
 
 from pyxtal import pyxtal
-from pyxtal.lattice import Lattice
+from pyxtal.lattice import Lattice, para2matrix
+from pyxtal.molecule import pyxtal_molecule, compare_mol_connectivity
 from pyxtal.symmetry import Group, Wyckoff_position, get_wyckoffs
-from pyxtal.wyckoff_site import WP_merge
-from pyxtal.XRD import Similarity
+from pyxtal.wyckoff_site import WP_merge, atom_site
+from pyxtal.wyckoff_split import wyckoff_split
+from pyxtal.supergroup import supergroup, get_best_assignment, get_projection
+from pyxtal.XRD import Similarity, FingerprintIndex
+from pyxtal.dedup import structure_index
 from pyxtal.operations import get_inverse
+from pyxtal.io import cif_writer, open_file, read_cifs, archive_writer, archive_reader
+from pyxtal.util import write_ase_db, read_ase_db
 
 cif_path = resource_filename("pyxtal", "database/cifs/")
 l0 = Lattice.from_matrix([[4.08, 0, 0], [0, 9.13, 0], [0, 0, 5.50]])
@@ -23,6 +29,17 @@ l3 = Lattice.from_para(4.08, 7.13, 5.50, 90, 38, 90, ltype="monoclinic")
 wp1 = Wyckoff_position.from_group_and_index(36, 0)
 wp2 = Wyckoff_position.from_group_and_index(36, "4a")
 
+def get_diag_struc():
+    """
+    a random atomic crystal of P21/c in the n representation (P21/n)
+    """
+    s = pyxtal()
+    s.from_random(3, 14, ["C", "Si"], [2, 4])
+    s.atom_sites = [atom_site(Group(14)[site.wp.index], site.position, site.specie, True)
+                    for site in s.atom_sites]
+    s.diag = True
+    return s
+
 
 class TestGroup(unittest.TestCase):
     def test_list_wyckoff_combinations(self):
@@ -190,6 +207,98 @@ class TestMolecular(unittest.TestCase):
         struc.from_random(3, 36, ["H2O"], [8], sites=sites)
         self.assertTrue(struc.valid)
 
+    def test_molecule_cache(self):
+        m1 = pyxtal_molecule("aspirin")
+        m2 = pyxtal_molecule("aspirin")
+        self.assertTrue(m1.tols_matrix is m2.tols_matrix)
+        self.assertTrue(m1.mol is not m2.mol)
+        m3 = m1.copy()
+        m3.reset_positions(m3.mol.cart_coords + 1.0)
+        self.assertTrue(m3.box is m1.box)
+        self.assertTrue(np.allclose(m1.mol.cart_coords, m2.mol.cart_coords))
+
+    def test_site_coords_cache(self):
+        struc = pyxtal(molecular=True)
+        struc.from_random(3, 14, ["aspirin"], [4])
+        site = struc.mol_sites[0]
+        coords0, species = site._get_coords_and_species()
+        self.assertTrue(len(coords0) == len(species) == 4*len(site.symbols))
+        coords1, _ = site._get_coords_and_species(first=True)
+        self.assertTrue(np.allclose(coords0[:len(coords1)], coords1))
+        site.translate([0.1, 0, 0])
+        coords2, _ = site._get_coords_and_species(first=True)
+        diff = coords2 - coords1 - [0.1, 0, 0]
+        self.assertTrue(np.allclose(diff, np.round(diff)))
+        site.rotate(axis=[1, 0, 0], angle=90)
+        coords3, _ = site._get_coords_and_species(first=True)
+        self.assertFalse(np.allclose(coords2, coords3))
+        site.molecule.reset_positions(site.mol.cart_coords*1.1)
+        coords4, _ = site._get_coords_and_species(first=True)
+        self.assertFalse(np.allclose(coords3, coords4))
+        site.wp.diagonalize_symops()
+        _, trans, _, _ = site._get_stacked_ops()
+        self.assertTrue(np.allclose(trans, [op.translation_vector for op in site.wp.ops]))
+
+    def test_sheared_lattice(self):
+        lattice = Lattice.from_para(8, 10, 14, 60, 120, 70, ltype="triclinic")
+        struc = pyxtal(molecular=True)
+        struc.from_random(3, 2, ["aspirin"], [2], lattice=lattice)
+        self.assertTrue(struc.valid and struc.mol_sites[0].check_distances())
+
+    def test_check_with_ms2(self):
+        struc = pyxtal(molecular=True)
+        struc.from_random(3, 14, ["aspirin", "H2O"], [4, 4])
+        ms1, ms2 = struc.mol_sites
+        self.assertTrue(ms1.check_with_ms2(ms2) and ms2.check_with_ms2(ms1))
+        ms2.position = ms1.position + 0.01
+        self.assertFalse(ms1.check_with_ms2(ms2) or ms2.check_with_ms2(ms1))
+
+    def test_compare_mol_connectivity(self):
+        mol1 = pyxtal_molecule("aspirin").mol
+        ids = np.random.permutation(len(mol1))
+        mol2 = Molecule([mol1[i].specie for i in ids], mol1.cart_coords[ids])
+        match, mapping = compare_mol_connectivity(mol1, mol2)
+        self.assertTrue(match)
+        self.assertTrue(len(mapping) == len(mol1))
+        self.assertTrue(all([mol1[i].specie == mol2[j].specie for i, j in mapping.items()]))
+        mol3 = pyxtal_molecule("benzene").mol
+        self.assertFalse(compare_mol_connectivity(mol1, mol3)[0])
+
+    def test_search_molecules(self):
+        from pyxtal.io import search_molecules_in_crystal
+        from pymatgen.core.structure import Structure
+        pmg_struc = Structure.from_file(cif_path+"aspirin.cif")
+        mols = search_molecules_in_crystal(pmg_struc)
+        self.assertTrue(len(mols) == 4)
+        ref = pyxtal_molecule("aspirin").mol
+        for mol in mols:
+            self.assertTrue(compare_mol_connectivity(mol, ref)[0])
+
+    def test_scan_orientations(self):
+        from scipy.spatial.transform import Rotation
+        struc = pyxtal(molecular=True)
+        struc.from_random(3, 14, ["aspirin"], [4], 0.8)
+        site = struc.mol_sites[0]
+        matrices = Rotation.random(10).as_matrix()
+        ratios = site.scan_orientations(matrices)
+        for matrix, ratio in zip(matrices, ratios):
+            site.orientation.reset_matrix(matrix)
+            self.assertTrue(site.check_distances() == (ratio >= 1))
+
+    def test_apply_rotation(self):
+        from scipy.spatial.transform import Rotation
+        from pyxtal.molecule import Orientation
+        ori = Orientation(np.eye(3), 1, np.array([0., 0., 1.]))
+        ori.change_orientation(angle=0.3)
+        ori.apply_rotation(Rotation.from_rotvec([0, 0, 0.5]))
+        self.assertTrue(abs(ori.angle - 0.8) < 1e-6)
+        self.assertTrue(np.allclose(ori.matrix, ori.get_matrix(angle=None)))
+        ori = Orientation(np.eye(3))
+        ori.change_orientation()
+        ori.apply_rotation(Rotation.random())
+        matrix = Rotation.from_rotvec(ori.angle * ori.axis).as_matrix()
+        self.assertTrue(np.allclose(ori.matrix, matrix))
+
 class TestAtomic3D(unittest.TestCase):
     def test_single_specie(self):
         struc = pyxtal()
@@ -275,6 +384,39 @@ class TestLattice(unittest.TestCase):
         l0.set_para([5, 5, 5, 90, 90, 90])
         self.assertTrue(l0.a == 5)
 
+    def test_generate_lattices(self):
+        from pyxtal.lattice import generate_lattices
+        for ltype in ["triclinic", "monoclinic", "hexagonal"]:
+            paras = generate_lattices(ltype, 100.0, 50, min_l=3.0)
+            self.assertTrue(len(paras) > 0)
+            for para in paras:
+                m = para2matrix(para)
+                self.assertTrue(abs(np.linalg.det(m) - 100.0) < 1e-6)
+                self.assertTrue(min(para[:3]) >= 3.0)
+        l = Lattice("monoclinic", 100.0)
+        l_copy = l.copy()
+        l.reset_matrix()
+        l_copy.reset_matrix()
+        self.assertFalse(np.allclose(l.matrix, l_copy.matrix))
+
+    def test_reduced_distance(self):
+        from scipy.spatial.distance import cdist
+        from pyxtal.operations import distance_matrix, distance_matrix_reduced
+        l = Lattice.from_matrix([[8.0, 1.7, 3.6], [0, 0.12, 3.0], [0, -0.24, 5.1]])
+        l_red, tran = l.get_reduced()
+        self.assertTrue(np.allclose(tran.dot(l.matrix), l_red.matrix))
+        self.assertTrue(abs(l_red.volume - l.volume) < 1e-6)
+        pts1 = np.random.random([5, 3])
+        pts2 = np.random.random([7, 3])
+        r = np.arange(-8, 9)
+        images = np.array(np.meshgrid(r, r, r)).reshape([3, -1]).T
+        ref = np.min([cdist((pts1+v).dot(l.matrix), pts2.dot(l.matrix)) for v in images], axis=0)
+        d = distance_matrix(pts1, pts2, l.matrix)
+        self.assertTrue(np.allclose(d, ref))
+        # one point of pts1 per block
+        d = distance_matrix_reduced(pts1, pts2, l.matrix, size=20)
+        self.assertTrue(np.allclose(d, ref))
+
 
 class TestSymmetry(unittest.TestCase):
     def test_P21(self):
@@ -357,7 +499,116 @@ class TestSubgroup(unittest.TestCase):
         struc.from_seed(seed=cif)
         for i in range(100):
             s = struc.subgroup_once(0.2, None, None, 't+k', 2)
+
+    def test_max_depth(self):
+        s = pyxtal()
+        s.from_random(3, 225, ["Cu"], [4], sites=[["4a"]])
+        # no split is valid for one site, the search stops after max_depth levels
+        self.assertTrue(s.subgroup(permutations={"Cu": "Si"}, max_cell=2, max_depth=1) == [])
+
+    def test_tree(self):
+        s = pyxtal()
+        s.from_seed(cif_path + "NaCl.cif")
+        pmg_s1 = s.to_pymatgen()
+        strucs = list(s.subgroup_tree(depth=2, max_cell=2))
+        keys = [struc.get_key() for (d, struc) in strucs]
+        self.assertTrue(len(set(keys)) == len(keys))
+        self.assertTrue([d for (d, struc) in strucs] == sorted([d for (d, struc) in strucs]))
+        keys1 = set([struc.get_key() for struc in s.subgroup(eps=0, max_cell=2)])
+        self.assertTrue(keys1 == set([key for key, (d, struc) in zip(keys, strucs) if d == 1]))
+        for (d, struc) in strucs:
+            self.assertTrue(sm.StructureMatcher().fit(pmg_s1, struc.to_pymatgen()))
+
+    def test_split_cache(self):
+        sp1 = wyckoff_split(G=227, idx=0, wp1=['8a', '32e'], group_type='t')
+        sp1.G1_orbits[0][0][0] = None
+        sp1.G[0].ops = []
+        sp2 = wyckoff_split(G=227, idx=0, wp1=[8, 4], group_type='t')
+        self.assertTrue(len(sp2.G[0].ops) == 192)
+        self.assertTrue(sp2.G1_orbits[0][0][0] is not None)
+        for G1s, G2s in zip(sp2.G1_orbits, sp2.G2_orbits):
+            for ops1, ops2 in zip(G1s, G2s):
+                for op1, op2 in zip(ops1, ops2):
+                    # G1 orbit = R * G2 orbit
+                    self.assertTrue(np.allclose(op1.affine_matrix, 
+                                    np.dot(sp2.R, op2.affine_matrix)))
+        for i in range(11):
+            sp = wyckoff_split(G=98, idx=i, wp1=['4b', '8f'], group_type='k')
+            sp = wyckoff_split(G=98, idx=i, wp1=['4b', '8f'], group_type='k')
+            self.assertTrue(len(sp.G1_orbits) == 2)
  
+class TestSupergroup(unittest.TestCase):
+    def test_assignment(self):
+        costs = [[(0.1, [0]), (0.5, [1])], 
+                 [(0.2, [0]), (0.3, [1]), (0.9, [2])], 
+                 [(0.4, [2, 3]), (0.6, [3, 1])]]
+        cost, solution = get_best_assignment(costs)
+        self.assertTrue(abs(cost-0.4) < 1e-8)
+        self.assertTrue(solution == [[0], [1], [2, 3]])
+        self.assertTrue(get_best_assignment(costs, 0.4)[1] is None)
+
+    def test_projection(self):
+        cell = l3.matrix
+        op = SymmOp.from_xyz_string("x, 2x, 1/4")
+        pt = np.array([0.11, 0.3, 0.2])
+        ref = np.array([0.2, 0.35, 0.3])
+        y = get_projection(pt, ref, op, cell)
+        xs = np.linspace(-0.5, 0.5, 1001)
+        diffs = np.array([op.operate([x, 0, 0]) for x in xs]) - ref
+        diffs -= np.round(diffs)
+        d0 = np.linalg.norm(np.dot(diffs, cell), axis=1).min()
+        diff = y - ref
+        diff -= np.round(diff)
+        self.assertTrue(np.linalg.norm(np.dot(diff, cell)) <= d0 + 1e-6)
+
+    def test_quartz(self):
+        s = pyxtal()
+        s.from_seed(cif_path + "lt_quartz.cif")
+        my = supergroup(s, G=[180])
+        solutions = my.search_supergroup(d_tol=1.0)
+        self.assertTrue(len(solutions) > 0)
+        for (sp, mapping, disp, mae) in solutions:
+            self.assertTrue(sp.G.number == 180 and mae < 0.3)
+
+    def test_parallel(self):
+        s = pyxtal()
+        s.from_seed(cif_path + "GeF2.cif")
+        my = supergroup(s, G=[62])
+        maes = [sol[-1] for sol in my.search_supergroup(d_tol=1.0)]
+        maes1 = [sol[-1] for sol in my.search_supergroup(d_tol=1.0, ncpu=2)]
+        self.assertTrue(len(maes) > 1 and np.allclose(maes, maes1))
+        sols = list(my.iter_supergroup(d_tol=1.0, cutoff=1.0))
+        self.assertTrue(len(sols) == 1)
+
+class TestDedup(unittest.TestCase):
+    def test_index(self):
+        strucs = []
+        for i in range(5):
+            s = pyxtal()
+            s.from_random(3, 225, ["Na", "Cl"], [4, 4], lattice=Lattice.from_para(5.64, 5.64, 5.64, 90, 90, 90))
+            strucs.append(s)
+        s = pyxtal()
+        s.from_seed(cif_path + "NaCl.cif")
+        strucs.append(s)
+        s = pyxtal()
+        s.from_random(3, 194, ["C"], [4])
+        strucs.append(s)
+        for confirm in [False, True]:
+            index = structure_index(confirm=confirm)
+            self.assertTrue(len(index.filter(strucs)) == 2)
+            self.assertTrue(index.query(strucs[2]) == 0)
+            self.assertTrue(index.add(strucs[-1]) == (False, 1))
+
+    def test_bucket_size(self):
+        # same key and volume, different c/a ratios
+        index = structure_index()
+        for ratio in np.linspace(0.6, 1.6, 21):
+            a = 2.5/ratio**(1/3)
+            s = pyxtal()
+            s.from_random(3, 123, ["C"], [1], lattice=Lattice.from_para(a, a, a*ratio, 90, 90, 90))
+            self.assertTrue(index.add(s)[0])
+        self.assertTrue(max([len(ids) for ids in index.buckets.values()]) <= 2)
+
 class TestPXRD(unittest.TestCase):
     def test_similarity(self):
         sites = ['8a']
@@ -378,6 +629,138 @@ class TestPXRD(unittest.TestCase):
         s = Similarity(p1, p2, x_range=[15, 90])
         self.assertTrue( 0.95 <s.S <1.001)
 
+    def test_structure_factor(self):
+        from pyxtal.XRD import XRD, structure_factor
+        C1 = pyxtal()
+        C1.from_seed(cif_path+"NaCl.cif")
+        atoms = C1.to_ase()
+        xrd1 = XRD(atoms)
+        xrd2 = XRD(atoms, backend='numba')
+        self.assertTrue(np.allclose(xrd1.xrd_intensity, xrd2.xrd_intensity))
+        # fcc reflections only appear with unmixed hkl
+        for labels in xrd1.hkl_labels:
+            self.assertTrue(len(set(np.array(labels[0]["hkl"]) % 2)) == 1)
+
+        # compare with the direct sum over atoms
+        hkls = np.array([[1, 1, 1], [2, 0, 0], [1, 2, 3]])
+        pos = np.random.random([5, 3])
+        ids = np.array([0, 1, 1, 0, 1])
+        sfs = np.array([[2.0, 3.0], [1.0, 0.5]])
+        s2_ids = np.array([0, 1, 0])
+        I = structure_factor(hkls, pos, ids, sfs, s2_ids, max_size=10)
+        for i in range(3):
+            f = np.sum(sfs[s2_ids[i], ids] * np.exp(2j*np.pi*pos.dot(hkls[i])))
+            self.assertTrue(abs(I[i] - abs(f)**2) < 1e-8)
+
+    def test_unique_reflections(self):
+        from pyxtal.XRD import XRD, get_symmetry, get_unique_reflections
+        C1 = pyxtal()
+        C1.from_seed(cif_path+"NaCl.cif")
+        atoms = C1.to_ase()
+        xrd1 = XRD(atoms)
+        xrd2 = XRD(atoms, symprec=None)
+        self.assertTrue(np.allclose(xrd1.xrd_intensity, xrd2.xrd_intensity))
+        self.assertTrue(xrd1.hkl_labels == xrd2.hkl_labels)
+
+        # the peaks dict covers all reflections, including the weak ones
+        peaks = xrd1.peaks
+        self.assertTrue(sum([len(p[1]) for p in peaks.values()]) == len(xrd1.hkl_list))
+        for two_theta, intensity in zip(xrd1.theta2, xrd1.xrd_intensity):
+            self.assertTrue(abs(peaks[two_theta][0] - intensity) < 1e-6)
+
+        rots, trans = get_symmetry(atoms)
+        uniques, inverse, absent = get_unique_reflections(xrd1.hkl_list, rots, trans)
+        self.assertTrue(len(uniques) < len(xrd1.hkl_list)/20)
+        # fcc: the reflections with mixed hkl are absent
+        hkls = xrd1.hkl_list[uniques]
+        self.assertTrue(np.all(absent == (np.ptp(hkls % 2, axis=1) > 0)))
+
+    def test_xrd_from_pyxtal(self):
+        from pyxtal.XRD import XRD
+        C1 = pyxtal()
+        C1.from_random(3, 227, ['C', 'Si'], [8, 16])
+        C2 = pyxtal(molecular=True)
+        C2.from_random(3, 14, ['H2O'], [4], diag=True)
+        for C in [C1, C2]:
+            xrd1 = C.get_XRD()
+            xrd2 = XRD(C.to_ase(), symprec=None)
+            self.assertTrue(np.allclose(xrd1.xrd_intensity, xrd2.xrd_intensity))
+            self.assertTrue(xrd1.hkl_labels == xrd2.hkl_labels)
+
+    def test_profile(self):
+        from pyxtal.XRD import Profile
+        thetas = np.array([10.0, 35.2, 35.25, 80.0, 150.0])
+        intensities = np.array([1.0, 0.5, 0.2, 0.8, 0.3])
+        for method in ['gaussian', 'lorentzian', 'pseudo-voigt', 'mod_pseudo-voigt']:
+            p0 = Profile(method, cutoff=1e4, tail=False).get_profile(thetas, intensities, 5, 160)
+            p1 = Profile(method).get_profile(thetas, intensities, 5, 160)
+            self.assertTrue(np.allclose(p0[0], p1[0]))
+            self.assertTrue(np.abs(p0[1] - p1[1]).max() < 1e-3)
+
+    def test_similarity_fft(self):
+        from pyxtal.XRD import similarity_calculate
+        x = np.linspace(10, 80, 3000)
+        f = np.exp(-(x-30)**2) + 0.5*np.exp(-(x-50.3)**2/0.1)
+        g = np.exp(-(x-30.4)**2) + 0.4*np.exp(-(x-50.0)**2/0.1)
+        h = np.exp(-(x-31.0)**2)
+        for weight in ['cosine', 'triangle']:
+            s = Similarity([x, f], [x, g], l=1.5, weight=weight)
+            w = s.cosineFunction() if weight == 'cosine' else s.triangleFunction()
+            d = s.fx[1] - s.fx[0]
+            S = similarity_calculate(s.r, w, d, len(s.fx), s.fy, s.gy)
+            self.assertTrue(abs(s.S - S) < 1e-10)
+            # reuse the reference
+            S1 = s.compare([x, h])
+            S2 = Similarity([x, f], [x, h], l=1.5, weight=weight).S
+            self.assertTrue(abs(S1 - S2) < 1e-10)
+
+    def test_similarity_matrix(self):
+        x = np.linspace(10, 80, 2000)
+        spectra = []
+        for c in [30, 30.2, 31, 45, 45.1]:
+            spectra.append([x, np.exp(-(x-c)**2) + 0.5*np.exp(-(x-c-10)**2/0.1)])
+        M = Similarity.matrix(spectra, l=1.5, block=2)
+        for i in range(len(spectra)):
+            for j in range(len(spectra)):
+                S = Similarity(spectra[i], spectra[j], l=1.5).S
+                self.assertTrue(abs(M[i, j] - S) < 1e-10)
+        rows, cols, vals = Similarity.matrix(spectra, l=1.5, threshold=0.9, ncpu=2, block=2)
+        iu = np.triu_indices(len(spectra), 1)
+        self.assertTrue(len(vals) == np.sum(M[iu] >= 0.9))
+        self.assertTrue(np.allclose(M[rows, cols], vals))
+        ids, vals = Similarity.matrix(spectra, l=1.5, top_k=1)
+        self.assertTrue(ids[:, 0].tolist() == [1, 0, 1, 4, 3])
+
+    def test_fingerprint_index(self):
+        import os, tempfile
+        x = np.linspace(10, 80, 2000)
+        spectra = []
+        for c in range(20, 60, 2):
+            spectra.append([x, np.exp(-(x-c)**2) + 0.5*np.exp(-(x-c-15)**2/0.1)])
+        query = [x, np.exp(-(x-36.3)**2) + 0.5*np.exp(-(x-51.3)**2/0.1)]
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, "fp.npy")
+            index = FingerprintIndex(filename, x_range=[10, 80], l=1.5)
+            index.add(spectra[:10])
+            index.query(query, k=3, shortlist=5)
+            size = os.path.getsize(filename)
+            index.add(spectra[10:])
+            # the new chunk is appended to the file and the codes are extended
+            self.assertTrue(os.path.getsize(filename) > size)
+            codes = index.get_codes().copy()
+            self.assertTrue(len(codes) == len(spectra))
+            ids1, _ = index.query(query, k=3, shortlist=5)
+            self.assertTrue(ids1[0] == 8)
+            index = FingerprintIndex.load(filename)
+            self.assertTrue(len(index) == len(spectra) and len(index.chunks) == 2)
+            ids, vals = index.query(query, k=3, shortlist=5)
+            self.assertTrue(ids[0] == 8 and ids.tolist() == ids1.tolist())
+            self.assertTrue(np.allclose(index.get_codes(), codes))
+            ids, vals = index.query(query, k=3, pool=spectra)
+            S = Similarity(query, spectra[8], x_range=[10, 80], l=1.5).S
+            self.assertTrue(ids[0] == 8 and abs(vals[0] - S) < 1e-10)
+            del index
+
 class TestLoad(unittest.TestCase):
     def test_atomic(self):
         s1 = pyxtal()
@@ -397,6 +780,158 @@ class TestLoad(unittest.TestCase):
         pmg_s2 = s2.to_pymatgen()
         self.assertTrue(sm.StructureMatcher().fit(pmg_s1, pmg_s2))
 
+class TestIO(unittest.TestCase):
+    def test_cif_writer(self):
+        import os, tempfile
+        s1 = pyxtal()
+        s1.from_seed(cif_path + "NaCl.cif")
+        s2 = pyxtal(molecular=True)
+        s2.from_random(3, 14, ["H2O"], [4])
+        strucs = [s1, s2, s1]
+        with tempfile.TemporaryDirectory() as tmp:
+            for name in ["my.cif", "my.cif.gz"]:
+                filename = os.path.join(tmp, name)
+                with cif_writer(filename) as f:
+                    f.write_all(strucs[:2])
+                    f.write(strucs[2], "NaCl")
+                with open_file(filename) as f:
+                    lines = f.read()
+                blocks = [s.to_file()[s.to_file().index("data_"):] for s in strucs]
+                blocks = [block.replace("from_pyxtal", str(i)) for i, block in enumerate(blocks)]
+                blocks[2] = blocks[2].replace("data_2", "data_NaCl")
+                self.assertTrue(lines.count("data_") == 3)
+                self.assertTrue(lines.endswith("".join(blocks)))
+        cif = s2.to_file(sym_num=2)
+        self.assertTrue(cif.count("\nH ") == 4)
+        # the n representation does not change the group of the structure
+        s3 = get_diag_struc()
+        ops = [op.as_xyz_string() for op in s3.group[0]]
+        cif = s3.to_file()
+        self.assertTrue([op.as_xyz_string() for op in s3.group[0]] == ops)
+        self.assertTrue("'-x+1/2, y+1/2, -z+1/2'" in cif and "'P21/n'" in cif)
+
+    def test_read_cifs(self):
+        import os, tempfile
+        from pyxtal.io import read_cif_blocks, get_wyckoff_sites
+        strucs = []
+        for name in ["NaCl", "GeF2", "PPO"]:
+            s = pyxtal()
+            s.from_seed(cif_path + name + ".cif")
+            strucs.append(s)
+        strucs.append(get_diag_struc())
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, "my.cif.gz")
+            with cif_writer(filename) as f:
+                f.write_all(strucs)
+            for s1, s2 in zip(strucs, read_cifs(filename)):
+                self.assertTrue(s1.group.number == s2.group.number and s1.diag == s2.diag)
+                wps1 = [site.wp.letter for site in s1.atom_sites]
+                wps2 = [site.wp.letter for site in s2.atom_sites]
+                self.assertTrue(wps1 == wps2)
+                self.assertTrue(sm.StructureMatcher().fit(s1.to_pymatgen(), s2.to_pymatgen()))
+            # the structures do not share the Group and Wyckoff positions
+            a, b = next(read_cifs(filename)), next(read_cifs(filename))
+            self.assertTrue(a.group is not b.group and a.atom_sites[0].wp is not b.atom_sites[0].wp)
+            a.atom_sites[0].wp.ops.pop()
+            mul = a.atom_sites[0].wp.multiplicity
+            self.assertTrue(len(b.atom_sites[0].wp.ops) == mul)
+            self.assertTrue(len(next(read_cifs(filename)).atom_sites[0].wp.ops) == mul)
+            # the cif with all atoms in the unit cell
+            coords, species = strucs[0]._get_coords_and_species()
+            cif = strucs[0].to_file()
+            cif = cif[:cif.index("_atom_site_occupancy\n")+22]
+            for specie, coord in zip(species, coords):
+                cif += "{:s} {:s} 1 {:f} {:f} {:f} 1\n".format(specie, specie, *coord)
+            filename = os.path.join(tmp, "all.cif")
+            with open(filename, "w") as f:
+                f.write(cif)
+            s = next(read_cifs(filename))
+            self.assertTrue(s.formula == strucs[0].formula and len(s.atom_sites) == 2)
+            # one point per chunk
+            args = (coords, species, 225, strucs[0].lattice.matrix)
+            sites1 = get_wyckoff_sites(*args)
+            sites2 = get_wyckoff_sites(*args, size=1)
+            self.assertTrue(len(sites1) == 2)
+            self.assertTrue([(w, sp) for w, _, sp in sites1] == [(w, sp) for w, _, sp in sites2])
+            self.assertTrue(np.allclose([pt for _, pt, _ in sites1], [pt for _, pt, _ in sites2]))
+            # empty values and text fields
+            cif = strucs[0].to_file().replace("_symmetry_cell_setting", "_audit_author ''\n"
+                    + "_audit_title\n;\n;\n_audit_text\n;_not_a_tag\n;\n_symmetry_cell_setting")
+            name, data = next(read_cif_blocks(cif.splitlines(True)))
+            self.assertTrue(data["_audit_author"] == "" and data["_audit_title"] == "")
+            self.assertTrue(data["_audit_text"] == "_not_a_tag" and "_not_a_tag" not in data)
+            with open(filename, "w") as f:
+                f.write(cif)
+            self.assertTrue(next(read_cifs(filename)).formula == strucs[0].formula)
+            # the symmetry operations of P21/n do not belong to P21/c
+            with open(filename, "w") as f:
+                f.write(strucs[3].to_file().replace("'P21/n'", "'P21/c'"))
+            self.assertRaises(ValueError, next, read_cifs(filename))
+            # P21/a setting
+            self.assertRaises(ValueError, next, read_cifs(cif_path + "MERQIM.cif"))
+
+    def test_archive(self):
+        import os, tempfile
+        strucs = []
+        for name in ["NaCl", "GeF2", "PPO"]:
+            s = pyxtal()
+            s.from_seed(cif_path + name + ".cif")
+            strucs.append(s)
+        strucs.append(get_diag_struc())
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, "my.pxa")
+            with archive_writer(filename, chunk=2) as f:
+                f.write_all(strucs[:3])
+            with archive_writer(filename, permission="a") as f:
+                f.write(strucs[3])
+            archive = archive_reader(filename)
+            self.assertTrue(len(archive) == 4 and len(archive.chunks) == 3)
+            self.assertTrue(archive.groups.tolist() == [s.group.number for s in strucs])
+            for s1, s2 in zip(strucs, archive):
+                self.assertTrue(s1.diag == s2.diag)
+                wps1 = [site.wp.letter for site in s1.atom_sites]
+                wps2 = [site.wp.letter for site in s2.atom_sites]
+                self.assertTrue(wps1 == wps2)
+                self.assertTrue(sm.StructureMatcher().fit(s1.to_pymatgen(), s2.to_pymatgen()))
+            self.assertTrue(archive[-1].formula == strucs[-1].formula)
+            # each structure has its own Group and Wyckoff positions
+            s3, s4 = archive[3], archive[3]
+            self.assertTrue(s3.group is not s4.group and s3.atom_sites[0].wp is not s4.atom_sites[0].wp)
+            self.assertTrue(s3.atom_sites[0].wp.ops is not s4.atom_sites[0].wp.ops)
+            ops1 = [op.affine_matrix for op in strucs[3].atom_sites[0].wp.ops]
+            ops2 = [op.affine_matrix for op in s3.atom_sites[0].wp.ops]
+            self.assertTrue(np.allclose(ops1, ops2))
+            del archive
+
+    def test_ase_db(self):
+        import os, tempfile
+        from ase.db import connect
+        strucs = []
+        for name in ["NaCl", "GeF2", "PPO"]:
+            s = pyxtal()
+            s.from_seed(cif_path + name + ".cif")
+            strucs.append(s)
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, "my.db")
+            kvps = [{"trial": i} for i in range(6)]
+            ids = write_ase_db(strucs*2, filename, kvps, batch=4)
+            self.assertTrue(ids == list(range(1, 7)))
+            row = connect(filename).get(id=1)
+            self.assertTrue(row.spg == 225 and row.wps == "Na4a Cl4b" and row.trial == 0)
+            # the metadata can not overwrite the structural keys
+            filename1 = os.path.join(tmp, "reserved.db")
+            self.assertRaises(ValueError, write_ase_db, strucs, filename1, [{"spg": 1}]*3)
+            res = list(read_ase_db(filename, "spg<100,trial>2"))
+            self.assertTrue([id for (id, struc) in res] == [5, 6])
+            # the rows of the same group do not share the Group and Wyckoff positions
+            (_, s1), (_, s2) = list(read_ase_db(filename, "spg=225"))
+            self.assertTrue(s1.group is not s2.group and s1.atom_sites[0].wp is not s2.atom_sites[0].wp)
+            for (id, s1), s2 in zip(res, strucs[1:]):
+                wps1 = [site.wp.letter for site in s1.atom_sites]
+                wps2 = [site.wp.letter for site in s2.atom_sites]
+                self.assertTrue(wps1 == wps2)
+                self.assertTrue(sm.StructureMatcher().fit(s1.to_pymatgen(), s2.to_pymatgen()))
+
 class Test_operations(unittest.TestCase):
     def test_inverse(self):
         coord0 = [0.35, 0.1, 0.4]
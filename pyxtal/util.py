@@ -1,6 +1,7 @@
 from pymatgen.core.structure import Structure
 from pymatgen.symmetry.analyzer import SpacegroupAnalyzer
 from ase import Atoms
+import numpy as np
 
 """
 scripts to perform structure conformation
@@ -70,6 +71,124 @@ def symmetrize(pmg, tol=1e-3):
     return pmg
 
 
+def get_ase_row(struc):
+    """
+    get the ase atoms, key-value pairs and data of a pyxtal structure for
+    the ase db. The group number, Wyckoff labels and source are stored as
+    key-value pairs for the indexed queries, and the Wyckoff encoding
+    is stored in the data to rebuild the pyxtal structure (see get_pyxtal_row)
+
+    Args:
+        struc: pyxtal structure (atomic)
+
+    Returns:
+        atoms, key_value_pairs, data
+    """
+    if struc.molecular:
+        raise NotImplementedError("Does not support molecular crystals for now")
+    sites = struc.atom_sites
+    wps = [site.specie + str(site.wp.multiplicity) + site.wp.letter for site in sites]
+    kvp = {"spg": struc.group.number,
+           "wps": " ".join(wps),
+           "diag": bool(struc.diag),
+           "source": struc.source,
+          }
+    data = {"pyxtal": {"lattice": np.array(struc.lattice.get_para(degree=True)),
+                       "wps": np.array([site.wp.index for site in sites], dtype=int),
+                       "species": [site.specie for site in sites],
+                       "positions": np.array([site.position for site in sites]).reshape([-1, 3]),
+                      }
+           }
+    return struc.to_ase(), kvp, data
+
+def get_pyxtal_row(row):
+    """
+    rebuild the pyxtal structure from the ase db row. The row without the
+    Wyckoff encoding in the data is loaded by the symmetry analysis
+
+    Args:
+        row: ase db row
+
+    Returns:
+        pyxtal structure
+    """
+    from pyxtal import pyxtal
+    from pyxtal.io import get_wyckoff_positions, _get_atom_site, _get_pyxtal
+    from pyxtal.lattice import Lattice
+
+    if "pyxtal" not in row.data:
+        struc = pyxtal()
+        struc.from_seed(row.toatoms())
+        return struc
+
+    data = row.data["pyxtal"]
+    diag = row.get("diag", False)
+    group, wps = get_wyckoff_positions(row.spg, diag)
+    lattice = Lattice.from_para(*data["lattice"], ltype=group.lattice_type)
+    sites = []
+    for wp, specie, pos in zip(data["wps"], data["species"], data["positions"]):
+        sites.append(_get_atom_site(wps[int(wp)], pos, specie, diag))
+    struc = _get_pyxtal(group, lattice, sites)
+    struc.source = row.get("source", struc.source)
+    return struc
+
+def write_ase_db(strucs, db_file, key_value_pairs=None, batch=1000):
+    """
+    write the pyxtal structures to the ase db (sqlite) in batches, where
+    each batch is committed as a single transaction
+
+    Args:
+        strucs: an iterable of pyxtal structures
+        db_file: path of the sqlite db file
+        key_value_pairs: an iterable of dictionaries with the generation
+            metadata for each structure (optional), which can not use the
+            keys written by get_ase_row (spg, wps, diag and source)
+        batch: the number of rows per transaction
+
+    Returns:
+        list of row ids
+    """
+    from ase.db import connect
+    from itertools import islice, repeat
+
+    if key_value_pairs is None:
+        key_value_pairs = repeat({})
+    rows = zip(strucs, key_value_pairs)
+    db = connect(db_file, type='db')
+    ids = []
+    while True:
+        chunk = list(islice(rows, batch))
+        if len(chunk) == 0:
+            break
+        with db:
+            for struc, kvp0 in chunk:
+                atoms, kvp, data = get_ase_row(struc)
+                keys = sorted(set(kvp).intersection(kvp0))
+                if len(keys) > 0:
+                    raise ValueError("Reserved keys in key_value_pairs: {:}".format(keys))
+                kvp.update(kvp0)
+                ids.append(db.write(atoms, key_value_pairs=kvp, data=data))
+    return ids
+
+def read_ase_db(db_file, selection=None, **kwargs):
+    """
+    read the pyxtal structures from the ase db (sqlite) lazily. The
+    selection is passed to db.select, e.g., read_ase_db('my.db', 'spg>100')
+
+    Args:
+        db_file: path of the sqlite db file
+        selection: the selection string of ase db
+        kwargs: the other arguments of db.select, e.g., limit
+
+    Yields:
+        row id and pyxtal structure
+    """
+    from ase.db import connect
+
+    db = connect(db_file, type='db')
+    for row in db.select(selection, **kwargs):
+        yield row.id, get_pyxtal_row(row)
+
 def extract_ase_db(db_file, id):
     """
     a short cut to extract the structural information 
@@ -4,6 +4,7 @@ Module for handling Wyckoff sites for both atom and molecule
 
 # Standard Libraries
 import numpy as np
+from scipy.spatial.distance import cdist
 from scipy.spatial.transform import Rotation as R
 
 # External Libraries
@@ -62,6 +63,9 @@ class mol_site:
         self.numbers = self.mol.atomic_numbers
         self.tols_matrix = mol.tols_matrix
         self.radius = mol.radius
+        # expanded coords are cached until position/orientation/lattice change
+        self._coords_cache = {}
+        self._stacked_ops = None
 
         if self.diag:
             self.wp.diagonalize_symops()
@@ -140,36 +144,14 @@ class mol_site:
             atomic coords: a numpy array of fractional coordinates for the atoms in the site
             species: a list of atomic species for the atomic coords
         """
-        coord0 = self.mol.cart_coords.dot(self.orientation.matrix.T)  #
-        wp_atomic_sites = []
-        wp_atomic_coords = None
-
-        for point_index, op2 in enumerate(self.wp.ops):
-            # Obtain the center in absolute coords
-            center_relative = op2.operate(self.position)
-            if unitcell:
-                center_relative -= np.floor(center_relative)
-            center_absolute = np.dot(center_relative, self.lattice.matrix)
-
-            # Rotate the molecule (Euclidean metric)
-            op2_m = self.wp.generators_m[point_index]
-            rot = op2_m.affine_matrix[:3, :3].T
-            if self.diag and self.wp.index > 0:
-                tau = op2.translation_vector
-            else:
-                tau = op2_m.affine_matrix[:3, 3]
-            tmp = np.dot(coord0, rot) + tau
-            # Add absolute center to molecule
-            tmp += center_absolute
-            tmp = tmp.dot(self.lattice.inv_matrix)
-            if wp_atomic_coords is None:
-                wp_atomic_coords = tmp
-            else:
-                wp_atomic_coords = np.append(wp_atomic_coords, tmp, axis=0)
-            wp_atomic_sites.extend(self.symbols)
+        m_length = len(self.symbols)
+        coords, _ = self._get_expanded(unitcell)
 
-            if first:
-                break
+        if first:
+            wp_atomic_coords = coords[:m_length].copy()
+        else:
+            wp_atomic_coords = coords.copy()
+        wp_atomic_sites = list(self.symbols) * int(len(wp_atomic_coords) / m_length)
 
         if add_PBC is True:
             # Filter PBC of wp_atomic_coords
@@ -177,17 +159,99 @@ class mol_site:
             # Add PBC copies of coords
             m = create_matrix(PBC=self.PBC, omit=True)
             # Move [0,0,0] PBC vector to first position in array
-            m2 = [[0, 0, 0]]
-            for v in m:
-                m2.append(v)
-            new_coords = np.vstack([wp_atomic_coords + v for v in m2])
-            wp_atomic_coords = new_coords
+            m2 = np.vstack([np.zeros([1, 3]), m])
+            new_coords = wp_atomic_coords[None, :, :] + m2[:, None, :]
+            wp_atomic_coords = new_coords.reshape([-1, 3])
 
         if absolute:
             wp_atomic_coords = wp_atomic_coords.dot(self.lattice.matrix)
 
         return wp_atomic_coords, wp_atomic_sites
 
+    def _get_expanded(self, unitcell=False):
+        """
+        Return the expanded coords and molecular origins for the current
+        position, orientation, lattice, molecular coordinates and Wyckoff
+        operations, recomputing them only if the
+        site has changed since the last call. The arrays must not be
+        modified by the caller.
+
+        Args:
+            unitcell: whether or not to move the molecular center to the unit cell
+
+        Returns:
+            coords: a (N_ops*N_atoms, 3) array of fractional coordinates
+            origins: a (N_ops, 3) array of fractional molecular origins
+        """
+        state = (
+            np.asarray(self.position, dtype=float).tobytes(),
+            np.asarray(self.orientation.matrix, dtype=float).tobytes(),
+            self.lattice.matrix.tobytes(),
+            self.mol.cart_coords.tobytes(),
+        )
+        cache = self._coords_cache.get(unitcell)
+        if cache is None or cache[0] != state or cache[1] is not self.mol \
+            or cache[2] is not self.wp.ops:
+            coords, origins = self._expand_molecules(unitcell)
+            cache = (state, self.mol, self.wp.ops, coords, origins)
+            self._coords_cache[unitcell] = cache
+        return cache[3], cache[4]
+
+    def _get_stacked_ops(self):
+        """
+        Stack the Wyckoff operations as arrays for the batched expansion.
+        The arrays are recomputed only when the Wyckoff position or its
+        operations (e.g., after diagonalize_symops) change.
+
+        Returns:
+            rots: (N_ops, 3, 3) rotations for the molecular centers
+            trans: (N_ops, 3) translations for the molecular centers
+            rots_m: (N_ops, 3, 3) Euclidean rotations for the molecules
+            taus_m: (N_ops, 3) Euclidean translations for the molecules
+        """
+        if self._stacked_ops is None or self._stacked_ops[0] is not self.wp \
+            or self._stacked_ops[1] is not self.wp.ops:
+            affines = np.array([op.affine_matrix for op in self.wp.ops])
+            n_ops = len(affines)
+            affines_m = np.array([op.affine_matrix for op in self.wp.generators_m[:n_ops]])
+            rots, trans = affines[:, :3, :3], affines[:, :3, 3]
+            rots_m = affines_m[:, :3, :3]
+            if self.diag and self.wp.index > 0:
+                taus_m = trans
+            else:
+                taus_m = affines_m[:, :3, 3]
+            self._stacked_ops = (self.wp, self.wp.ops, (rots, trans, rots_m, taus_m))
+        return self._stacked_ops[2]
+
+    def _expand_molecules(self, unitcell=False):
+        """
+        Apply all Wyckoff operations to the molecule at once.
+
+        Args:
+            unitcell: whether or not to move the molecular center to the unit cell
+
+        Returns:
+            coords: a (N_ops*N_atoms, 3) array of fractional coordinates
+            origins: a (N_ops, 3) array of fractional coordinates where the
+                origin of the molecular frame is placed by each operation
+        """
+        rots, trans, rots_m, taus_m = self._get_stacked_ops()
+        coord0 = self.mol.cart_coords.dot(self.orientation.matrix.T)
+
+        # Obtain the centers in absolute coords
+        centers = np.einsum('kij,j->ki', rots, np.asarray(self.position, dtype=float)) + trans
+        if unitcell:
+            centers -= np.floor(centers)
+        centers = centers.dot(self.lattice.matrix)
+
+        # Rotate the molecules (Euclidean metric) into a preallocated buffer
+        coords = np.empty([len(rots_m), len(coord0), 3])
+        np.einsum('kij,nj->kni', rots_m, coord0, out=coords)
+        origins = taus_m + centers
+        coords += origins[:, None, :]
+        coords = coords.reshape([-1, 3]).dot(self.lattice.inv_matrix)
+        return coords, origins.dot(self.lattice.inv_matrix)
+
     def get_coords_and_species(self, absolute=False, add_PBC=False, unitcell=False):
         """
         Lazily generates and returns the atomic coordinate and species for the
@@ -334,7 +398,32 @@ class mol_site:
             return Molecule(self.symbols, tmp)           
         else:
             raise ValueError("id is greater than the number of molecules")
-        
+
+    def _get_mol_coords(self, num):
+        """
+        Batched version of get_mol_object for the first num molecules
+
+        Args:
+            num: the number of molecules
+
+        Returns:
+            coords: a (num*N_atoms, 3) array of fractional coordinates
+            species: a list of atomic symbols
+        """
+        if num > len(self.wp.generators):
+            raise ValueError("num is greater than the number of molecules")
+        affines = np.array([op.affine_matrix for op in self.wp.generators[:num]])
+        affines_m = np.array([op.affine_matrix for op in self.wp.generators_m[:num]])
+        coord0 = self.mol.cart_coords.dot(self.orientation.matrix.T)
+
+        centers = np.einsum('kij,j->ki', affines[:, :3, :3], self.position) + affines[:, :3, 3]
+        centers -= np.floor(centers)
+        centers = centers.dot(self.lattice.matrix)
+        coords = np.einsum('kij,nj->kni', affines_m[:, :3, :3], coord0)
+        coords += (affines_m[:, :3, 3] + centers)[:, None, :]
+        coords = coords.reshape([-1, 3]).dot(self.lattice.inv_matrix)
+        return coords, list(self.symbols) * num
+
 
     def update(self, coords, lattice=None, absolute=False, update_mol=True):
         """
@@ -571,6 +660,64 @@ class mol_site:
 
 
 
+    def scan_orientations(self, matrices, max_size=2000000):
+        """
+        Vectorized version of check_distances for a batch of candidate
+        orientations of the molecule at the current position.
+
+        Args:
+            matrices: a (N, 3, 3) array of rotation matrices
+            max_size: the maximum number of distances evaluated at once
+
+        Returns:
+            a (N,) array of the smallest ratios between the intermolecular
+            distances and their tolerances. The images are taken from the
+            conventional cell, so a ratio no less than 1 is a necessary but,
+            in strongly sheared cells, not a sufficient condition to pass
+            check_distances.
+        """
+        matrices = np.asarray(matrices, dtype=float).reshape([-1, 3, 3])
+        m_length = len(self.symbols)
+        size = m_length * m_length * self.wp.multiplicity
+        n_batch = max(1, int(max_size / size))
+        if len(matrices) > n_batch:
+            ids = range(n_batch, len(matrices), n_batch)
+            return np.hstack([self.scan_orientations(m, max_size)
+                              for m in np.split(matrices, ids)])
+
+        lattice = self.lattice.matrix
+        _, _, rots_m, _ = self._get_stacked_ops()
+        _, origins = self._get_expanded()
+
+        # Absolute coords of the whole WP for all candidates at once
+        coord0 = np.einsum('kij,nj->kni', matrices, self.mol.cart_coords)
+        coords = np.einsum('oij,knj->koni', rots_m, coord0)
+        coords += origins.dot(lattice)[None, :, None, :]
+        coords_mol = coords[:, 0]
+        ratios = np.full(len(matrices), np.inf)
+
+        # Check periodic images
+        for v in self._create_matrix().dot(lattice):
+            d = batch_distances(coords_mol + v, coords_mol)
+            ratios = np.minimum(ratios, (d / self.tols_matrix).min(axis=(1, 2)))
+
+        if self.wp.multiplicity > 1:
+            # Check inter-atomic distances
+            PBC = np.array(self.PBC)
+            inv_matrix = self.lattice.inv_matrix
+            coords_mol = coords_mol.dot(inv_matrix)
+            coords_mol -= np.floor(coords_mol) * PBC
+            coords_mol = coords_mol.dot(lattice)
+            coords = coords[:, 1:].reshape([len(matrices), -1, 3]).dot(inv_matrix)
+            coords -= np.floor(coords) * PBC
+            coords = coords.dot(lattice)
+            tols = np.tile(self.tols_matrix, self.wp.multiplicity - 1)
+            for v in create_matrix(PBC=self.PBC).dot(lattice):
+                d = batch_distances(coords_mol + v, coords)
+                ratios = np.minimum(ratios, (d / tols).min(axis=(1, 2)))
+
+        return ratios
+
     def check_with_ms2(self, ms2, factor=1.0, tm=Tol_matrix(prototype="molecular")):
         """
         Checks whether or not the molecules of two mol sites overlap. Uses
@@ -587,46 +734,81 @@ class mol_site:
         Returns:
             False if the Wyckoff positions overlap. True otherwise
         """
-        # Get coordinates for both mol_sites
-        c1, _ = self.get_coords_and_species()
-        c2, _ = ms2.get_coords_and_species()
-    
-        # Calculate which distance matrix is smaller/faster
-        m_length1 = len(self.numbers)
-        m_length2 = len(ms2.numbers)
-        wp_length1 = len(c1)
-        wp_length2 = len(c2)
-        size1 = m_length1 * wp_length2
-        size2 = m_length2 * wp_length1
-    
-        # Case 1
-        if size1 <= size2:
-            coords_mol = c1[:m_length1]
-            # Calculate tol matrix for species pairs
-            tols = np.zeros((m_length1, m_length2))
-            for i1, number1 in enumerate(self.numbers):
-                for i2, number2 in enumerate(ms2.numbers):
-                    tols[i1][i2] = tm.get_tol(number1, number2)
-            tols = np.repeat(tols, ms2.wp.multiplicity, axis=1)
-            d = distance_matrix(coords_mol, c2, self.lattice.matrix, PBC=self.PBC)
-    
-        # Case 2
-        elif size1 > size2:
-            coords_mol = c2[:m_length2]
-            # Calculate tol matrix for species pairs
-            tols = np.zeros((m_length2, m_length1))
-            for i1, number1 in enumerate(ms2.numbers):
-                for i2, number2 in enumerate(self.numbers):
-                    tols[i1][i2] = tm.get_tol(number1, number2)
-            tols = np.repeat(tols, self.wp.multiplicity, axis=1)
-            d = distance_matrix(coords_mol, c1, self.lattice.matrix, PBC=self.PBC)
-    
+        # Compute the distances from the generating molecule of the
+        # site with the smaller orbit to all molecules of the other one
+        if len(self.numbers) * ms2.wp.multiplicity <= \
+            len(ms2.numbers) * self.wp.multiplicity:
+            s1, s2 = self, ms2
+        else:
+            s1, s2 = ms2, self
+        c1, o1 = s1._get_expanded()
+        c2, o2 = s2._get_expanded()
+        m_length1 = len(s1.numbers)
+        m_length2 = len(s2.numbers)
+        matrix = self.lattice.matrix
+        tols = get_tols(tm, s1.numbers, s2.numbers)
+
+        # Molecular level: periodic search of the origins of s2 that may be
+        # close enough to the origin of the generating molecule of s1
+        r1 = np.linalg.norm(s1.mol.cart_coords, axis=1).max()
+        r2 = np.linalg.norm(s2.mol.cart_coords, axis=1).max()
+        cutoff = r1 + r2 + tols.max()
+        shifts = -np.round(o2 - o1[0]) * s1.PBC
+        images = create_matrix(PBC=s1.PBC)
+        d_frac = (o2 + shifts - o1[0])[:, None, :] + images[None, :, :]
+        d_centers = np.linalg.norm(d_frac.dot(matrix), axis=2)
+        ids, img_ids = np.where(d_centers < cutoff)
+        if len(ids) == 0:
+            return True
+
+        # Atomic level: only for the pairs of molecules that may collide
+        coords_mol = c1[:m_length1].dot(matrix)
+        c2 = c2.reshape([-1, m_length2, 3])[ids]
+        c2 += (shifts[ids] + images[img_ids])[:, None, :]
+        d = cdist(coords_mol, c2.reshape([-1, 3]).dot(matrix))
+        d = d.reshape([m_length1, len(ids), m_length2])
+
         # Check if distances are smaller than tolerances
-        if (d < tols).any():
+        if (d < tols[:, None, :]).any():
             return False
         return True
 
 
+def batch_distances(pts1, pts2):
+    """
+    Compute the Euclidean distance matrices for a batch of point sets
+
+    Args:
+        pts1: a (N, N1, 3) array of absolute coordinates
+        pts2: a (N, N2, 3) array of absolute coordinates
+
+    Returns:
+        a (N, N1, N2) array of distances
+    """
+    d2 = np.einsum('kij,kij->ki', pts1, pts1)[:, :, None]
+    d2 = d2 + np.einsum('kij,kij->ki', pts2, pts2)[:, None, :]
+    d2 -= 2 * np.matmul(pts1, pts2.transpose(0, 2, 1))
+    return np.sqrt(np.maximum(d2, 0))
+
+
+def get_tols(tm, numbers1, numbers2):
+    """
+    Compute the matrix of distance tolerances between two lists of atoms
+
+    Args:
+        tm: a Tol_matrix object
+        numbers1: a list of atomic numbers
+        numbers2: another list of atomic numbers
+
+    Returns:
+        a (len(numbers1), len(numbers2)) numpy array
+    """
+    u1, inv1 = np.unique(numbers1, return_inverse=True)
+    u2, inv2 = np.unique(numbers2, return_inverse=True)
+    tols = np.array([[tm.get_tol(int(n1), int(n2)) for n2 in u2] for n1 in u1])
+    return tols[np.ix_(inv1, inv2)]
+
+
 class atom_site:
     """
     Class for storing atomic Wyckoff positions with a single coordinate.
@@ -1,9 +1,15 @@
 import numpy as np
+import pickle
 import pyxtal.symmetry as sym
 from copy import deepcopy
 from pymatgen.core.operations import SymmOp
 from random import choice
 
+# pickled Group objects and the split orbits, keyed by 
+# (G, idx, wp1 index, group_type), shared by all splitters
+_group_cache = {}
+_split_cache = {}
+
 class wyckoff_split:
     """
     Class for performing wyckoff split between two space groups.
@@ -20,7 +26,7 @@ class wyckoff_split:
     def __init__(self, G=197, idx=None, wp1=[0, 1], group_type='t', elements=None):
         self.error = False
         self.elements = elements
-        self.G = sym.Group(G)  # Group object
+        self.G = get_group(G)  # Group object
         if group_type == 't':
             self.wyc = self.G.get_max_t_subgroup()
         else:
@@ -40,7 +46,7 @@ class wyckoff_split:
             idx = choice(ids)
         #print(G, idx, len(self.wyc['subgroup']))
         H = self.wyc['subgroup'][idx]
-        self.H = sym.Group(H)  # Group object
+        self.H = get_group(H)  # Group object
 
         #print(G, H)
         self.parse_wp2(idx)
@@ -61,16 +67,49 @@ class wyckoff_split:
         self.G2_orbits = []
         self.H_orbits = []
         for i, wp1 in enumerate(self.wp1_lists):
-            self.counter=0
-            self.current_wp1_size=len(wp1)
             self.H_orbits.append([wp2.ops for wp2 in self.wp2_lists[i]])
-            if group_type == 't':
-                G1_orbits, G2_orbits = self.split_t(wp1, self.wp2_lists[i])
+            key = (self.G.number, idx, self.wp1_indices[i], group_type)
+            if key not in _split_cache:
+                _split_cache[key] = self.split(wp1, self.wp2_lists[i], group_type)
+            orbits = _split_cache[key]
+            if orbits is None:
+                self.valid_split = False
+                self.error = True
+                G1_orbits, G2_orbits = None, None
             else:
-                G1_orbits, G2_orbits = self.split_k(wp1, self.wp2_lists[i])
+                G1_orbits = [[SymmOp(op) for op in ops] for ops in orbits[0]]
+                G2_orbits = [[SymmOp(op) for op in ops] for ops in orbits[1]]
             self.G1_orbits.append(G1_orbits)
             self.G2_orbits.append(G2_orbits)
 
+    def split(self, wp1, wp2_lists, group_type='t'):
+        """
+        split the generators in w1 to different w2s, the results only 
+        depend on (G, idx, wp1, group_type) and are stored in _split_cache
+
+        Returns:
+            None if the split fails, otherwise the G1 and G2 orbits as 
+            tuples of read-only (N, 4, 4) arrays
+        """
+        self.counter = 0
+        self.current_wp1_size = len(wp1)
+        if group_type == 't':
+            G1_orbits, G2_orbits = self.split_t(wp1, wp2_lists)
+        else:
+            G1_orbits, G2_orbits = self.split_k(wp1, wp2_lists)
+        if G1_orbits is None:
+            return None
+
+        orbits = []
+        for Gs in [G1_orbits, G2_orbits]:
+            arrays = []
+            for ops in Gs:
+                array = np.array([op.affine_matrix for op in ops])
+                array.setflags(write=False)
+                arrays.append(array)
+            orbits.append(tuple(arrays))
+        return tuple(orbits)
+
     def sort(self):
         """
         sort the orbits by multiplicity
@@ -736,6 +775,16 @@ class wyckoff_split:
 
 
 
+def get_group(number):
+    """
+    Return a new Group object of the space group number. The group is
+    built once and then restored from its pickle, which is much faster
+    than parsing the Wyckoff positions again.
+    """
+    if number not in _group_cache:
+        _group_cache[number] = pickle.dumps(sym.Group(number))
+    return pickle.loads(_group_cache[number])
+
 def in_lists(mat1, mat2, eps=1e-4, PBC=True):
     if len(mat2) == 0:
         return False
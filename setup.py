@@ -47,7 +47,7 @@ setup(
         "spglib>=1.10.4",
         "pymatgen>=2020.1.28",
         "pandas>=0.24.2",
-        "networkx>=2.3",
+        "networkx>=2.5",
         "py3Dmol>=0.8.0",
         'ase>=3.18.0',
         'numba>=0.50.1',